@@ -0,0 +1,285 @@
+# -*- encoding: utf-8 -*-
+'''
+encrypted archive of folders and notes, to back up a notebook or to move notes to another one:
+    with open('notes.pnarc', 'wb') as f:
+        archive.exportArchive(db, f, passwd)
+    with open('notes.pnarc', 'rb') as f:
+        archive.importArchive(db, f, passwd, parentid)
+The archive is a stream of frames of about FRAME_SIZE bytes, it is written and read one frame at a time,
+so the memory used does not depend on the size of the notebook. A frame is compressed by zlib if asked, then encrypted
+by AES-GCM with a key derived from the password of the archive by PBKDF2, which does not need to be the one of the notebook.
+    header: MAGIC, flags, PBKDF2 iterations, salt
+    frame: length of the cipher text (4 bytes), cipher text, GCM tag. the nonce is the number of the frame and
+        the header is authenticated with every frame, so a frame cannot be moved, dropped or taken from another archive
+    plain text of a frame: 1 for the last frame, 0 otherwise (1 byte), the records, compressed if FLAG_ZLIB
+    record: kind (1 byte), length of the payload (4 bytes), payload
+A folder comes before its children, its note right after it: RECORD_NOTE then the text in RECORD_TEXT pieces.
+Author: Jared Yu
+Contect: hfyu.hzcn@gmail.com
+Version: 1.0
+Update: 2023-3-14
+Requires: pycryptodome
+'''
+import os
+import time
+import zlib
+import json
+import struct
+import hashlib
+import logging
+from itertools import count
+from Crypto.Cipher import AES
+import cipherdb
+
+MAGIC = b'PNARC\x00\x00\x01' #format version in the last byte
+FLAG_ZLIB = 0x01 #the records of a frame are compressed
+HEADER_FORMAT = '>8sBI16s' #magic, flags, PBKDF2 iterations, salt
+FRAME_LENGTH_FORMAT = '>I'
+RECORD_HEADER_FORMAT = '>BI' #kind, length of the payload
+RECORD_FOLDER = 1 #payload: folderid and parentid (FOLDER_FORMAT), the name in UTF-8
+RECORD_NOTE = 2 #payload: folderid (NOTE_FORMAT), [dateCreate, dateEdit] in JSON, a date may be null. the text follows
+RECORD_TEXT = 3 #payload: a piece of the text of the last note in UTF-8
+FOLDER_FORMAT = '>qq'
+NOTE_FORMAT = '>q'
+FRAME_SIZE = 1024 * 1024 #bytes of records buffered before a frame is written
+TEXT_PIECE_SIZE = 64 * 1024 #characters of a RECORD_TEXT at most, at most 4 bytes each in UTF-8
+MAX_FRAME_SIZE = 2 * FRAME_SIZE #bytes of a frame at most, after compression too, a longer one is taken for corruption
+KDF_ITERATIONS = 600000 #PBKDF2-HMAC-SHA256, written in the header
+KEY_SIZE = 32
+SALT_SIZE = 16
+NONCE_SIZE = 12
+TAG_SIZE = 16
+IMPORT_BATCH_BYTES = 32 * 1024 * 1024 #bytes of the archive imported by one transaction
+IMPORT_FOLDER_ROWS = 1000 #folders inserted by one statement
+
+class ArchiveError(Exception):
+    '''the file is not an archive, the password is wrong, or the archive is corrupted or truncated'''
+
+def deriveKey(passwd:str, salt:bytes, iterations:int) -> bytes:
+    '''the AES key of an archive'''
+    return hashlib.pbkdf2_hmac('sha256', passwd.encode('utf-8'), salt, iterations, KEY_SIZE)
+
+class ArchiveWriter():
+    '''write records to a binary file object as encrypted frames, the records of one frame are buffered'''
+    def __init__(self, out, passwd:str, compress:bool=True, iterations:int=KDF_ITERATIONS):
+        self.out = out
+        self.flags = FLAG_ZLIB if compress else 0
+        salt = os.urandom(SALT_SIZE)
+        self.header = struct.pack(HEADER_FORMAT, MAGIC, self.flags, iterations, salt)
+        self.key = deriveKey(passwd, salt, iterations)
+        self.buffer = bytearray()
+        self.frames = 0 #number of frames written, the nonce of the next one
+        self.bytesWritten = len(self.header)
+        out.write(self.header)
+
+    def write(self, kind:int, payload:bytes) -> None:
+        '''add a record, a frame is written once FRAME_SIZE bytes are buffered'''
+        self.buffer += struct.pack(RECORD_HEADER_FORMAT, kind, len(payload))
+        self.buffer += payload
+        if len(self.buffer) >= FRAME_SIZE:
+            self.__writeFrame(False)
+
+    def close(self) -> None:
+        '''write the last frame, which tells the reader that the archive is complete. out is not closed'''
+        self.__writeFrame(True)
+
+    def __writeFrame(self, last:bool) -> None:
+        '''compress, encrypt and write the records buffered'''
+        data = zlib.compress(self.buffer) if self.flags & FLAG_ZLIB else bytes(self.buffer)
+        cipher = AES.new(self.key, AES.MODE_GCM, nonce=self.frames.to_bytes(NONCE_SIZE, 'big'))
+        cipher.update(self.header)
+        cipherText, tag = cipher.encrypt_and_digest(bytes([last]) + data)
+        self.out.write(struct.pack(FRAME_LENGTH_FORMAT, len(cipherText)))
+        self.out.write(cipherText)
+        self.out.write(tag)
+        self.bytesWritten += struct.calcsize(FRAME_LENGTH_FORMAT) + len(cipherText) + len(tag)
+        self.frames += 1
+        self.buffer.clear()
+
+class ArchiveReader():
+    '''read the records of an archive written by ArchiveWriter from a binary file object, one frame is in memory'''
+    def __init__(self, inp, passwd:str):
+        self.inp = inp
+        self.header = inp.read(struct.calcsize(HEADER_FORMAT))
+        if len(self.header) != struct.calcsize(HEADER_FORMAT):
+            raise ArchiveError('not an archive')
+        magic, self.flags, iterations, salt = struct.unpack(HEADER_FORMAT, self.header)
+        if magic != MAGIC:
+            raise ArchiveError('not an archive, or written by another version')
+        self.key = deriveKey(passwd, salt, iterations)
+        self.bytesRead = len(self.header)
+        self.stream = self.__records()
+        self.unread = None #a record given back by unreadRecord()
+
+    def nextRecord(self) -> tuple:
+        '''the next record, (kind, payload), None at the end of the archive'''
+        if self.unread != None:
+            record, self.unread = self.unread, None
+            return record
+        return next(self.stream, None)
+
+    def unreadRecord(self, record:tuple) -> None:
+        '''give back the record just read, it is the next one again'''
+        self.unread = record
+
+    def __frames(self):
+        '''generator, yield the records of each frame as bytes, after checking and decrypting it'''
+        lengthSize = struct.calcsize(FRAME_LENGTH_FORMAT)
+        for number in count():
+            data = self.inp.read(lengthSize)
+            if len(data) != lengthSize:
+                raise ArchiveError('the archive is truncated')
+            length, = struct.unpack(FRAME_LENGTH_FORMAT, data)
+            if length > MAX_FRAME_SIZE:
+                raise ArchiveError('the archive is corrupted')
+            data = self.inp.read(length + TAG_SIZE)
+            if len(data) != length + TAG_SIZE:
+                raise ArchiveError('the archive is truncated')
+            self.bytesRead += lengthSize + len(data)
+            cipher = AES.new(self.key, AES.MODE_GCM, nonce=number.to_bytes(NONCE_SIZE, 'big'))
+            cipher.update(self.header)
+            try:
+                plainText = cipher.decrypt_and_verify(data[:length], data[length:])
+            except ValueError:
+                raise ArchiveError('wrong password, or the archive is corrupted') from None
+            records = plainText[1:]
+            if self.flags & FLAG_ZLIB:
+                decompressor = zlib.decompressobj()
+                records = decompressor.decompress(records, MAX_FRAME_SIZE)
+                if not decompressor.eof:
+                    raise ArchiveError('the archive is corrupted')
+            yield records
+            if plainText[0]:
+                if self.inp.read(1):
+                    raise ArchiveError('data after the end of the archive')
+                return
+
+    def __records(self):
+        '''generator, yield (kind, payload) of each record'''
+        headerSize = struct.calcsize(RECORD_HEADER_FORMAT)
+        for records in self.__frames():
+            view, position = memoryview(records), 0
+            while position < len(records):
+                kind, length = struct.unpack_from(RECORD_HEADER_FORMAT, records, position)
+                position += headerSize
+                if position + length > len(records):
+                    raise ArchiveError('the archive is corrupted')
+                yield kind, bytes(view[position:position + length])
+                position += length
+
+def exportArchive(db:cipherdb.CiperDatabase, out, passwd:str, folderid:int=cipherdb.ID_ROOT, compress:bool=True, progress=None) -> dict:
+    '''write the folder with its subtree and their notes to the binary file object out, all the folders for ID_ROOT.
+    a note is read chunk by chunk and not cached. progress(done, total): number of folders written and to write.
+    return {'folders', 'notes', 'bytes': of the notes in UTF-8, 'archivebytes', 'seconds'}'''
+    start = time.perf_counter()
+    writer = ArchiveWriter(out, passwd, compress)
+    stats = {'folders': 0, 'notes': 0, 'bytes': 0}
+    folderid = int(folderid)
+    tops = db.folderChildren(folderid) if folderid == cipherdb.ID_ROOT else [folderid]
+    total = sum(1 for _ in walkSubtrees(db, tops)) if progress else 0
+    for childid, parentid in walkSubtrees(db, tops):
+        writer.write(RECORD_FOLDER, struct.pack(FOLDER_FORMAT, childid, parentid) + db.folderName(childid).encode('utf-8', 'surrogatepass'))
+        stream = db.streamTextByFolderid(childid, cache=False)
+        textid, dateCreate, dateEdit = next(stream)
+        if textid != cipherdb.ID_ROOT:
+            writer.write(RECORD_NOTE, struct.pack(NOTE_FORMAT, childid) + json.dumps([dateCreate, dateEdit]).encode('utf-8'))
+            for text in stream:
+                for position in range(0, len(text), TEXT_PIECE_SIZE):
+                    piece = text[position:position + TEXT_PIECE_SIZE].encode('utf-8', 'surrogatepass')
+                    writer.write(RECORD_TEXT, piece)
+                    stats['bytes'] += len(piece)
+            stats['notes'] += 1
+        stats['folders'] += 1
+        if progress:
+            progress(stats['folders'], total)
+    writer.close()
+    stats['archivebytes'] = writer.bytesWritten
+    stats['seconds'] = time.perf_counter() - start
+    logging.info(f'archive exported: {formatStats(stats)}')
+    return stats
+
+def walkSubtrees(db:cipherdb.CiperDatabase, folderids:list):
+    '''generator, yield (folderid, parentid) of the folders and their descendants, a folder before its children.
+    the parentid of the folders given is ID_ROOT, their parents are not in the archive'''
+    pending = [(folderid, cipherdb.ID_ROOT) for folderid in reversed(folderids)]
+    while pending:
+        folderid, parentid = pending.pop()
+        yield folderid, parentid
+        pending += [(childid, folderid) for childid in reversed(db.folderChildren(folderid))]
+
+def importArchive(db:cipherdb.CiperDatabase, inp, passwd:str, parentid:int=cipherdb.ID_ROOT, progress=None) -> dict:
+    '''read an archive written by exportArchive() from the binary file object inp into the folder parentid.
+    the folders and notes get new ids, the top folders of the archive become children of parentid, the dates are kept.
+    a transaction is committed every IMPORT_BATCH_BYTES of the archive. if the archive turns out to be corrupted,
+    the folders imported are deleted and ArchiveError is raised.
+    progress(done, total): bytes of the archive read and its size, 0 if it is not a file.
+    return {'folders', 'notes', 'bytes': of the notes in UTF-8, 'archivebytes', 'seconds'}'''
+    start = time.perf_counter()
+    reader = ArchiveReader(inp, passwd)
+    try:
+        total = os.fstat(inp.fileno()).st_size
+    except (OSError, AttributeError, ValueError):
+        total = 0
+    stats = {'folders': 0, 'notes': 0, 'bytes': 0}
+    idMap = {} #folderid in the archive: folderid in the database
+    tops = [] #folderids of the top folders imported
+
+    def texts():
+        '''generator, yield the text pieces of the note being imported, the record after them is given back to the reader'''
+        while True:
+            record = reader.nextRecord()
+            if record == None or record[0] != RECORD_TEXT:
+                reader.unreadRecord(record)
+                return
+            stats['bytes'] += len(record[1])
+            yield record[1].decode('utf-8', 'surrogatepass')
+
+    try:
+        record = reader.nextRecord()
+        while record != None:
+            batchStart = reader.bytesRead
+            folders = []
+            with db.batch():
+                while record != None and reader.bytesRead - batchStart < IMPORT_BATCH_BYTES:
+                    kind, payload = record
+                    if kind == RECORD_FOLDER:
+                        oldid, oldParentid = struct.unpack_from(FOLDER_FORMAT, payload)
+                        folderid = cipherdb.getUniqueId()
+                        if oldParentid not in idMap:
+                            tops.append(folderid)
+                        folders.append((folderid, payload[struct.calcsize(FOLDER_FORMAT):].decode('utf-8', 'surrogatepass'), idMap.get(oldParentid, parentid)))
+                        idMap[oldid] = folderid
+                        stats['folders'] += 1
+                        if len(folders) >= IMPORT_FOLDER_ROWS:
+                            db.insertManyFolders(folders)
+                            folders = []
+                    elif kind == RECORD_NOTE:
+                        oldid, = struct.unpack_from(NOTE_FORMAT, payload)
+                        if oldid not in idMap:
+                            raise ArchiveError('the archive is corrupted, a note of an unknown folder')
+                        dateCreate, dateEdit = json.loads(payload[struct.calcsize(NOTE_FORMAT):])
+                        db.importNote(idMap[oldid], texts(), dateCreate, dateEdit)
+                        stats['notes'] += 1
+                    else:
+                        raise ArchiveError(f'the archive is corrupted, unknown record {kind}')
+                    if progress:
+                        progress(reader.bytesRead, total)
+                    record = reader.nextRecord()
+                if folders:
+                    db.insertManyFolders(folders)
+    except:
+        #the batches committed are taken back, the current one is rolled back by batch()
+        for folderid in tops:
+            db.updateTableFoldersDeleteFolder(folderid)
+        raise
+    stats['archivebytes'] = reader.bytesRead
+    stats['seconds'] = time.perf_counter() - start
+    logging.info(f'archive imported: {formatStats(stats)}')
+    return stats
+
+def formatStats(stats:dict) -> str:
+    '''the statistics of exportArchive() or importArchive() with the throughput, as text'''
+    seconds = max(stats['seconds'], 1e-6)
+    return (f"{stats['folders']} folders, {stats['notes']} notes, {stats['bytes'] / 2**20:.1f} MB of notes, "
+        f"archive {stats['archivebytes'] / 2**20:.1f} MB, {seconds:.2f} s, {stats['bytes'] / 2**20 / seconds:.1f} MB/s, "
+        f"{stats['folders'] / seconds:.0f} folders/s")
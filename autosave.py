@@ -0,0 +1,58 @@
+# -*- encoding: utf-8 -*-
+'''
+debounced autosave, a burst of edits is saved by one write
+Author: Jared Yu
+Contect: hfyu.hzcn@gmail.com
+Version: 1.0
+Update: 2023-3-10
+Requires: PyQt5
+'''
+from PyQt5.QtCore import QObject, QTimer
+
+DEFAULT_IDLE_MS = 2000 #save when no edit is done for so long
+DEFAULT_MAX_LATENCY_MS = 10000 #save at the latest so long after the first edit of a burst, even if the user keeps typing
+
+class AutoSaver(QObject):
+    '''call save() once the edits pause for idleMs, or maxLatencyMs after the first unsaved edit.
+    touch() is called for each edit, it only restarts a timer.
+    isBusy: if it returns True when a timer expires, e.g. the previous write is not finished,
+        the save is postponed by idleMs, so that the edits done meanwhile go into the next write'''
+    def __init__(self, save, isBusy=None, idleMs:int=DEFAULT_IDLE_MS, maxLatencyMs:int=DEFAULT_MAX_LATENCY_MS, parent:QObject=None):
+        super(AutoSaver, self).__init__(parent)
+        self.save, self.isBusy = save, isBusy
+        self.idleTimer = QTimer(self)
+        self.idleTimer.setSingleShot(True)
+        self.idleTimer.setInterval(idleMs)
+        self.idleTimer.timeout.connect(self.__timeout)
+        self.maxLatencyTimer = QTimer(self)
+        self.maxLatencyTimer.setSingleShot(True)
+        self.maxLatencyTimer.setInterval(maxLatencyMs)
+        self.maxLatencyTimer.timeout.connect(self.__timeout)
+
+    def setIntervals(self, idleMs:int, maxLatencyMs:int) -> None:
+        '''change the delays of the save'''
+        self.idleTimer.setInterval(idleMs)
+        self.maxLatencyTimer.setInterval(maxLatencyMs)
+
+    def touch(self) -> None:
+        '''an edit is done'''
+        self.idleTimer.start()
+        if not self.maxLatencyTimer.isActive():
+            self.maxLatencyTimer.start()
+
+    def __timeout(self) -> None:
+        '''one of the timers expired'''
+        if self.isBusy and self.isBusy():
+            self.idleTimer.start()
+            return
+        self.flush()
+
+    def flush(self) -> None:
+        '''save now, e.g. before another note is shown or the program exits'''
+        self.stop()
+        self.save()
+
+    def stop(self) -> None:
+        '''forget the pending save'''
+        self.idleTimer.stop()
+        self.maxLatencyTimer.stop()
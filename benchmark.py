@@ -0,0 +1,707 @@
+# -*- encoding: utf-8 -*-
+'''
+benchmarks for the cipher notebook, run "python benchmark.py -h" for the list of benchmarks
+Author: Jared Yu
+Contect: hfyu.hzcn@gmail.com
+Version: 1.0
+Update: 2023-3-6
+Requires: pycryptodome
+'''
+import os
+import sys
+import time
+import random
+import tempfile
+import sqlite3
+import argparse
+import tracemalloc
+from collections import OrderedDict
+from binascii import b2a_hex
+from Crypto.Cipher import AES
+import cipherdb
+import encryption as ECP
+import archive
+import dirimport
+import notecodec
+
+BENCH_PASSWD = cipherdb.DEFAULT_PASSWD
+
+def timeit(func, *args, **kwargs) -> tuple:
+    '''call func with the arguments, return (seconds elapsed, result)'''
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+def createBenchDatabase(filename:str, folderCount:int, passwd:str=BENCH_PASSWD) -> cipherdb.CiperDatabase:
+    '''create a database with folderCount folders in a random tree, return the opened database'''
+    if os.path.exists(filename):
+        os.remove(filename)
+    db = cipherdb.CiperDatabase(filename)
+    db.createDatabase(filename, passwd)
+    aes = ECP.AESCipher(passwd)
+    rnd = random.Random(folderCount)
+    ids = []
+    rows = []
+    for i in range(folderCount):
+        folderid = cipherdb.getUniqueId()
+        #about 1/10 of the folders are root folders, the others hang under a random earlier folder
+        parentid = cipherdb.ID_ROOT if not ids or rnd.random() < 0.1 else rnd.choice(ids)
+        ids.append(folderid)
+        rows.append((folderid, aes.encryptRaw(f'folder {i}'), parentid))
+    db.dbConn.executemany(f"INSERT INTO {cipherdb.TBL_FOLDERS} ({cipherdb.TBL_FOLDERS_F_ID}, {cipherdb.TBL_FOLDERS_F_NAME}, {cipherdb.TBL_FOLDERS_F_PARENTID}) VALUES (?, ?, ?)", rows)
+    db.dbConn.commit()
+    return db
+
+def openBenchDatabase(filename:str, passwd:str=BENCH_PASSWD) -> cipherdb.CiperDatabase:
+    '''open an existing database and verify the password'''
+    db = cipherdb.CiperDatabase(filename)
+    db.openDatabase(filename)
+    db.verifyPasswd(passwd)
+    return db
+
+def legacyReadAllFolders(db:cipherdb.CiperDatabase, parentid:int=cipherdb.ID_ROOT) -> int:
+    '''the recursive loader used by MainWindow before readFolderTree(), one query per folder
+    return the number of folders read'''
+    count = 0
+    for row in db.readTableFolders(parentid):
+        count += 1 + legacyReadAllFolders(db, row[0])
+    return count
+
+def benchFolderTree(sizes:list, legacyLimit:int, workdir:str) -> None:
+    '''compare the time to load the whole folder tree, one query per folder versus readFolderTree(),
+    the time to read the root folders only, which is what the lazy tree widget does at start, is listed too'''
+    print(f'{"folders":>10} {"per-folder query(s)":>20} {"readFolderTree(s)":>18} {"root folders only(s)":>21}')
+    for size in sizes:
+        filename = os.path.join(workdir, f'bench_tree_{size}.db')
+        createBenchDatabase(filename, size).closeDatabase()
+        db = openBenchDatabase(filename)
+        legacy = 'skipped'
+        if size <= legacyLimit:
+            legacy = f'{timeit(legacyReadAllFolders, db)[0]:.3f}'
+        elapsed, tree = timeit(db.readFolderTree)
+        assert sum(len(children) for children in tree.values()) == size
+        lazy = timeit(db.readTableFoldersWithChildFlag, cipherdb.ID_ROOT)[0]
+        print(f'{size:>10} {legacy:>20} {elapsed:>18.3f} {lazy:>21.3f}')
+        db.closeDatabase()
+
+def legacyEncrypt(aes:ECP.AESCipher, text:str) -> str:
+    '''encrypt the way AESCipher did before the cryptor was reused, a new AES instance for every call'''
+    data = text.encode()
+    data += b'\0' * (-len(data) % 16)
+    return b2a_hex(AES.new(key=aes.key, mode=AES.MODE_ECB).encrypt(data)).decode('ascii')
+
+def benchCipher(count:int, size:int) -> None:
+    '''throughput of encrypting and decrypting count records of size characters,
+    one AES instance per record versus a reused cryptor versus the batch methods'''
+    aes = ECP.AESCipher(BENCH_PASSWD)
+    texts = [f'{i:08d}' + 'x' * (size - 8) for i in range(count)]
+    encrypted = aes.encryptMany(texts)
+    results = [
+        ('encrypt, new AES per record', timeit(lambda: [legacyEncrypt(aes, text) for text in texts])),
+        ('encrypt, reused cryptor', timeit(lambda: [aes.encrypt(text) for text in texts])),
+        ('encryptMany', timeit(aes.encryptMany, texts)),
+        ('decrypt, reused cryptor', timeit(lambda: [aes.decrypt(text) for text in encrypted])),
+        ('decryptMany', timeit(aes.decryptMany, encrypted)),
+    ]
+    print(f'{count} records of {size} characters')
+    print(f'{"method":<30} {"seconds":>8} {"records/s":>12}')
+    for name, (elapsed, result) in results:
+        assert result == encrypted or result == texts
+        print(f'{name:<30} {elapsed:>8.3f} {count / elapsed:>12.0f}')
+
+def createLegacyDatabase(filename:str, noteCount:int, noteSize:int, passwd:str=BENCH_PASSWD) -> list:
+    '''create a version 1.0 database, cipher texts saved as hex strings, with one note of noteSize characters
+    in each of noteCount folders, return the folderids'''
+    if os.path.exists(filename):
+        os.remove(filename)
+    aes = ECP.AESCipher(passwd)
+    conn = sqlite3.connect(filename)
+    conn.execute(f'CREATE TABLE {cipherdb.TBL_FOLDERS} ({cipherdb.TBL_FOLDERS_F_ID} integer PRIMARY KEY, {cipherdb.TBL_FOLDERS_F_NAME} text NOT NULL, {cipherdb.TBL_FOLDERS_F_PARENTID} integer NOT NULL)')
+    conn.execute(f'CREATE TABLE {cipherdb.TBL_TEXT} ({cipherdb.TBL_TEXT_F_ID} integer PRIMARY KEY, {cipherdb.TBL_TEXT_F_VALUE} text NOT NULL, {cipherdb.TBL_TEXT_F_FOLDERID} integer NOT NULL, {cipherdb.TBL_TEXT_F_DATE_C} text, {cipherdb.TBL_TEXT_F_DATE_E} text)')
+    conn.execute(f'CREATE TABLE {cipherdb.TBL_SYS} ({cipherdb.TBL_SYS_F_ID} integer PRIMARY KEY, {cipherdb.TBL_SYS_F_ITEMVALUE} text NOT NULL)')
+    conn.executemany(f'INSERT INTO {cipherdb.TBL_SYS} VALUES (?, ?)', [(cipherdb.TBL_SYS_V_IDX_VER, cipherdb.DB_VERSION_1), (cipherdb.TBL_SYS_V_IDX_SAMPLE, aes.encrypt(cipherdb.SAMPLE_TEXT))])
+    folderids = [cipherdb.getUniqueId() for i in range(noteCount)]
+    words = 'the quick brown fox jumps over the lazy dog while a secret password hides in plain sight'.split()
+    rnd = random.Random(noteCount)
+    for start in range(0, noteCount, 1000):
+        ids = folderids[start:start + 1000]
+        conn.executemany(f'INSERT INTO {cipherdb.TBL_FOLDERS} VALUES (?, ?, ?)', [(folderid, aes.encrypt(f'note {folderid}'), cipherdb.ID_ROOT) for folderid in ids])
+        texts = [' '.join(rnd.choice(words) for i in range(noteSize // 5))[:noteSize] for folderid in ids]
+        conn.executemany(f'INSERT INTO {cipherdb.TBL_TEXT} VALUES (?, ?, ?, NULL, NULL)', [(cipherdb.getUniqueId(), text, folderid) for folderid, text in zip(ids, aes.encryptMany(texts))])
+    conn.commit()
+    conn.close()
+    return folderids
+
+def legacyReadText(conn:sqlite3.Connection, aes:ECP.AESCipher, folderid:int) -> str:
+    '''read a note of a version 1.0 database the way readTextByFolderid() did, unhex and decrypt'''
+    record = conn.execute(f'SELECT {cipherdb.TBL_TEXT_F_VALUE} FROM {cipherdb.TBL_TEXT} WHERE {cipherdb.TBL_TEXT_F_FOLDERID}={folderid}').fetchone()
+    return aes.decrypt(str(record[0]))
+
+def benchStorage(noteCount:int, noteSize:int, workdir:str) -> None:
+    '''file size and read latency of a notebook saved with hex strings (1.0) and with BLOB (2.0)'''
+    filename = os.path.join(workdir, 'bench_storage.db')
+    folderids = createLegacyDatabase(filename, noteCount, noteSize)
+    sample = random.Random(0).sample(folderids, min(1000, noteCount))
+    sizeBefore = os.path.getsize(filename)
+    conn = sqlite3.connect(filename)
+    aes = ECP.AESCipher(BENCH_PASSWD)
+    readBefore = timeit(lambda: [legacyReadText(conn, aes, folderid) for folderid in sample])[0]
+    conn.close()
+    migrate, db = timeit(openBenchDatabase, filename)
+    sizeAfter = os.path.getsize(filename)
+    readAfter = timeit(lambda: [db.readTextByFolderid(folderid) for folderid in sample])[0]
+    db.closeDatabase()
+    print(f'{noteCount} notes of {noteSize} characters, {len(sample)} notes read, migration took {migrate:.3f}s')
+    print(f'{"format":<12} {"file size(MB)":>14} {"read latency(ms/note)":>22}')
+    print(f'{"1.0 hex":<12} {sizeBefore / 2**20:>14.2f} {readBefore * 1000 / len(sample):>22.4f}')
+    print(f'{"2.0 blob":<12} {sizeAfter / 2**20:>14.2f} {readAfter * 1000 / len(sample):>22.4f}')
+
+def legacyChangePasswd(db:cipherdb.CiperDatabase, newPasswd:str) -> None:
+    '''re-encryption as changePasswd() did it before it read the tables in chunks, every record is in memory'''
+    newAes = ECP.AESCipher(newPasswd)
+    tables = [(cipherdb.TBL_FOLDERS, cipherdb.TBL_FOLDERS_F_ID, cipherdb.TBL_FOLDERS_F_NAME),
+              (cipherdb.TBL_TEXT, cipherdb.TBL_TEXT_F_ID, cipherdb.TBL_TEXT_F_VALUE)]
+    with db.batch():
+        for table, idField, valueField in tables:
+            records = db.dbCursor.execute(f"SELECT {idField},{valueField} FROM {table}").fetchall()
+            values = newAes.encryptManyRaw(db.aes.decryptManyRaw([record[1] for record in records]))
+            db.dbCursor.executemany(f"UPDATE {table} SET {valueField}=? WHERE {idField}=?", zip(values, [record[0] for record in records]))
+        db.dbCursor.execute(f"UPDATE {cipherdb.TBL_SYS} SET {cipherdb.TBL_SYS_F_ITEMVALUE}=? WHERE {cipherdb.TBL_SYS_F_ID}=?",
+            (newAes.encryptRaw(cipherdb.SAMPLE_TEXT), cipherdb.TBL_SYS_V_IDX_SAMPLE))
+    db.aes = newAes
+
+def benchRekey(noteCount:int, noteSize:int, workdir:str) -> None:
+    '''time and peak python memory of changing the password, whole table in memory versus chunks'''
+    filename = os.path.join(workdir, 'bench_rekey.db')
+    createLegacyDatabase(filename, noteCount, noteSize)
+    db = openBenchDatabase(filename)
+    print(f'{noteCount} notes of {noteSize} characters, database {os.path.getsize(filename) / 2**20:.1f}MB')
+    print(f'{"mode":<10} {"seconds":>8} {"peak memory(MB)":>16}')
+    for mode, func in [('fetchall', lambda: legacyChangePasswd(db, BENCH_PASSWD + '1')),
+                       ('chunked', lambda: db.changePasswd(BENCH_PASSWD + '2'))]:
+        tracemalloc.start()
+        seconds = timeit(func)[0]
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f'{mode:<10} {seconds:>8.3f} {peak / 2**20:>16.2f}')
+    db.closeDatabase()
+
+def benchRekeyWorkers(noteCount:int, noteSize:int, workerCounts:list, workdir:str) -> None:
+    '''rows re-encrypted per second by changePasswd() with a pool of 1, 2, 4... worker processes,
+    the notes and the search results are checked after each change'''
+    filename = os.path.join(workdir, 'bench_rekey_workers.db')
+    folderids = createLegacyDatabase(filename, noteCount, noteSize)
+    db = openBenchDatabase(filename)
+    notes = [db.readTextByFolderid(folderid)[1] for folderid in folderids]
+    found = sorted(path for paths in db.scanNotes('secret') for path in paths) #decrypts the notes, no index needed
+    rows = noteCount * 2 #a folder and a text per note
+    print(f'{noteCount} notes of {noteSize} characters, {os.cpu_count()} cpus')
+    print(f'{"workers":>8} {"seconds":>8} {"rows/s":>10}')
+    for i, workers in enumerate(workerCounts):
+        seconds, changed = timeit(db.changePasswd, f'{BENCH_PASSWD}{i}', None, workers)
+        assert changed
+        assert [db.readTextByFolderid(folderid)[1] for folderid in folderids] == notes, 'notes changed by the new password'
+        assert sorted(db.searchNotes('secret')) == found, 'search index not rebuilt with the new password'
+        print(f'{workers:>8} {seconds:>8.3f} {rows / seconds:>10.0f}')
+    db.closeDatabase()
+
+def benchSave(sizes:list, saves:int, workdir:str) -> None:
+    '''latency of saving a note after a one-line edit: the whole note in one row as before version 3.0,
+    the whole text split into chunks, and the dirty ranges only'''
+    rng = random.Random(0)
+    print(f'{saves} saves of a one-line edit per note size, milliseconds per save')
+    print(f'{"note size(KB)":>14} {"single row":>11} {"full text":>10} {"ranges":>8}')
+    for size in sizes:
+        filename = os.path.join(workdir, f'bench_save_{size}.db')
+        db = createBenchDatabase(filename, 1)
+        folderid = db.readTableFolders(cipherdb.ID_ROOT)[0][0]
+        text = ''.join(f'line {i} ' + 'x' * rng.randint(0, 70) + '\n' for i in range(size * 1024 // 40))
+        textid = db.insertTexts(text, folderid)
+        positions = [rng.randint(0, len(text)) for _ in range(saves)]
+        sql = f'UPDATE {cipherdb.TBL_TEXT} SET {cipherdb.TBL_TEXT_F_VALUE}=? WHERE {cipherdb.TBL_TEXT_F_ID}=?'
+        def singleRow():
+            for position in positions:
+                db.dbCursor.execute(sql, (db.aes.encryptRaw(text[:position] + 'edited\n' + text[position:]), textid))
+                db.dbConn.commit()
+        def fullText():
+            for position in positions:
+                db.updateTextsTextByTextid(textid, text[:position] + 'edited\n' + text[position:])
+            db.updateTextsTextByTextid(textid, text)
+        def ranges():
+            #insert a line and remove it again, so that every save starts from the same text
+            for i, position in enumerate(positions):
+                if i % 2 == 0:
+                    db.updateTextRanges(textid, [(position, position, 'edited\n')])
+                else:
+                    db.updateTextRanges(textid, [(positions[i - 1], positions[i - 1] + 7, '')])
+        results = [timeit(func)[0] * 1000 / saves for func in (singleRow, fullText, ranges)]
+        db.updateTextsTextByTextid(textid, text) #the text column of the single row run is emptied again
+        print(f'{len(text) // 1024:>14} {results[0]:>11.2f} {results[1]:>10.2f} {results[2]:>8.2f}')
+        db.closeDatabase()
+
+def benchSearch(noteCount:int, noteSize:int, lookups:int, workdir:str) -> None:
+    '''time to build the search index and latency of a lookup, versus decrypting every note to find a word'''
+    filename = os.path.join(workdir, 'bench_search.db')
+    folderids = createLegacyDatabase(filename, noteCount, noteSize)
+    db = openBenchDatabase(filename)
+    build = timeit(db.rebuildSearchIndex)[0]
+    rows = db.dbConn.execute(f'SELECT count(*) FROM {cipherdb.TBL_SEARCH}').fetchone()[0]
+    print(f'{noteCount} notes of {noteSize} characters, index of {rows} rows built in {build:.3f}s')
+    sample = random.Random(0).sample(folderids, min(lookups, noteCount))
+    #a folder name is "note <folderid>", so the folderid is a word found once and "note" is found in every folder
+    queries = [('rare word', [str(folderid) for folderid in sample]), ('rare and common', [f'note {folderid}' for folderid in sample]),
+        ('absent word', ['absent'] * len(sample))]
+    print(f'{"query":<16} {"ms/lookup":>10}')
+    for name, texts in queries:
+        elapsed, results = timeit(lambda: [db.searchNotes(text) for text in texts])
+        assert name == 'absent word' or all(result == [[folderid]] for result, folderid in zip(results, sample))
+        print(f'{name:<16} {elapsed * 1000 / len(texts):>10.4f}')
+    db.noteCache.clear()
+    scan = timeit(lambda: [folderid for folderid in folderids if 'absent' in db.readTextByFolderid(folderid)[1]])[0]
+    print(f'{"decrypt all":<16} {scan * 1000:>10.1f}')
+    db.closeDatabase()
+
+def benchScan(noteCount:int, noteSize:int, workerCounts:list, workdir:str) -> None:
+    '''throughput of a substring search decrypting every note: a loop of readTextByFolderid() versus scanNotes()
+    with a pool of 1, 2, 4... worker processes'''
+    filename = os.path.join(workdir, 'bench_scan.db')
+    folderids = createLegacyDatabase(filename, noteCount, noteSize)
+    db = openBenchDatabase(filename)
+    db.noteCache = cipherdb.NoteCache(0) #every note is read from the database
+    megabytes = noteCount * noteSize / 2**20
+    print(f'{noteCount} notes of {noteSize} characters, {os.cpu_count()} cpus')
+    print(f'{"mode":<12} {"seconds":>8} {"notes/s":>10} {"MB/s":>8}')
+    seconds, found = timeit(lambda: [folderid for folderid in folderids if 'absent' in db.readTextByFolderid(folderid)[1]])
+    assert not found
+    print(f'{"read loop":<12} {seconds:>8.3f} {noteCount / seconds:>10.0f} {megabytes / seconds:>8.1f}')
+    for workers in workerCounts:
+        list(db.scanNotes('absent', False, workers)) #the pool started by the first scan is kept for the next ones
+        seconds, found = timeit(lambda: [path for paths in db.scanNotes('absent', False, workers) for path in paths])
+        assert not found
+        print(f'{f"scan x{workers}":<12} {seconds:>8.3f} {noteCount / seconds:>10.0f} {megabytes / seconds:>8.1f}')
+    db.closeDatabase()
+
+def legacyCopySubtree(db:cipherdb.CiperDatabase, folderid:int, parentid:int) -> int:
+    '''copy a subtree with the per-record methods: each folder name and note is decrypted and encrypted again,
+    return the number of folders copied'''
+    pending, count = [(folderid, parentid)], 0
+    while pending:
+        folderid, parentid = pending.pop()
+        copyid = db.insertFolders(db.folderName(folderid), parentid)
+        textid, text, _, _ = db.readTextByFolderid(folderid)
+        if textid != cipherdb.ID_ROOT:
+            db.insertTexts(text, copyid)
+        pending += [(childid, copyid) for childid in db.folderChildren(folderid)]
+        count += 1
+    return count
+
+def benchCopy(folderCount:int, noteSize:int, workdir:str) -> None:
+    '''time to copy and move a subtree of folderCount folders holding a note each,
+    record by record versus copySubtree()/moveSubtree()'''
+    filename = os.path.join(workdir, 'bench_copy.db')
+    db = createBenchDatabase(filename, 0)
+    rnd = random.Random(folderCount)
+    with db.batch():
+        rootid = db.insertFolders('subtree', cipherdb.ID_ROOT)
+        targetid = db.insertFolders('target', cipherdb.ID_ROOT)
+        ids = [rootid]
+        for i in range(folderCount - 1):
+            ids.append(db.insertFolders(f'folder {i}', rnd.choice(ids)))
+        for folderid in ids:
+            db.insertTexts(f'note of folder {folderid}\n' * (noteSize // 30 + 1), folderid)
+    db.noteCache = cipherdb.NoteCache(0) #every note is read from the database
+    print(f'subtree of {folderCount} folders, a note of about {noteSize} characters in each')
+    print(f'{"operation":<20} {"seconds":>8} {"folders/s":>10}')
+    def legacyCopy():
+        with db.batch():
+            return legacyCopySubtree(db, rootid, targetid)
+    seconds, count = timeit(legacyCopy)
+    assert count == folderCount
+    print(f'{"copy per record":<20} {seconds:>8.3f} {folderCount / seconds:>10.0f}')
+    seconds, copies = timeit(db.copySubtree, [rootid], targetid)
+    assert len(copies) == folderCount
+    print(f'{"copySubtree":<20} {seconds:>8.3f} {folderCount / seconds:>10.0f}')
+    children = db.folderChildren(rootid)
+    def legacyMove():
+        for folderid in children:
+            db.updateTableFoldersParentidByFolderid(folderid, targetid)
+    seconds = timeit(legacyMove)[0]
+    print(f'{f"move {len(children)} one by one":<20} {seconds:>8.3f} {folderCount / seconds:>10.0f}')
+    seconds = timeit(db.moveSubtree, children, rootid)[0]
+    print(f'{f"moveSubtree {len(children)}":<20} {seconds:>8.3f} {folderCount / seconds:>10.0f}')
+    db.closeDatabase()
+
+def benchArchive(noteCounts:list, noteSize:int, workdir:str) -> None:
+    '''throughput and peak python memory of exporting a notebook to an archive and importing it into an empty one.
+    the memory is measured by a second run, tracemalloc slows it down. the folder index of the notebook is loaded before,
+    it grows with the number of folders, the memory used for the notes must not'''
+    print(f'notes of {noteSize} characters, archive compressed')
+    print(f'{"notes":>8} {"operation":<8} {"seconds":>8} {"MB/s":>8} {"folders/s":>10} {"peak memory(MB)":>16} {"archive(MB)":>12}')
+    for noteCount in noteCounts:
+        filename = os.path.join(workdir, f'bench_archive_{noteCount}.db')
+        createLegacyDatabase(filename, noteCount, noteSize)
+        db = openBenchDatabase(filename)
+        db.folderChildren(cipherdb.ID_ROOT)
+        archiveName = os.path.join(workdir, f'bench_archive_{noteCount}.pnarc')
+        for operation in ('export', 'import'):
+            results = []
+            for traced in (False, True):
+                with open(archiveName, 'wb' if operation == 'export' else 'rb') as f:
+                    if operation == 'export':
+                        if traced:
+                            tracemalloc.start()
+                        results.append(archive.exportArchive(db, f, BENCH_PASSWD))
+                    else:
+                        target = createBenchDatabase(os.path.join(workdir, f'bench_archive_{noteCount}_imported.db'), 0)
+                        if traced:
+                            tracemalloc.start()
+                        results.append(archive.importArchive(target, f, BENCH_PASSWD))
+                        target.closeDatabase()
+                    if traced:
+                        results.append(tracemalloc.get_traced_memory()[1])
+                        tracemalloc.stop()
+            stats, _, peak = results
+            assert stats['notes'] == noteCount
+            print(f"{noteCount:>8} {operation:<8} {stats['seconds']:>8.3f} {stats['bytes'] / 2**20 / stats['seconds']:>8.1f} "
+                f"{stats['folders'] / stats['seconds']:>10.0f} {peak / 2**20:>16.2f} {stats['archivebytes'] / 2**20:>12.1f}")
+        db.closeDatabase()
+
+def createTextTree(directory:str, fileCount:int, fileSize:int) -> None:
+    '''write fileCount text files of fileSize characters in a tree of directories of 100 files, if not done yet'''
+    if os.path.isdir(directory) and sum(len(files) for _, _, files in os.walk(directory)) == fileCount:
+        return
+    rnd = random.Random(fileCount)
+    words = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliett']
+    for i in range(fileCount):
+        subdir = os.path.join(directory, f'dir{i // 1000}', f'sub{i // 100 % 10}')
+        os.makedirs(subdir, exist_ok=True)
+        with open(os.path.join(subdir, f'note{i}.txt'), 'w', encoding='utf-8') as f:
+            f.write(''.join(rnd.choice(words) + (' ' if rnd.random() < 0.9 else '\n') for _ in range(fileSize // 6))[:fileSize])
+
+def benchImportDir(fileCount:int, fileSize:int, workerCounts:list, workdir:str) -> None:
+    '''files/s of importing a directory tree of text files: one insertFolders() and insertTexts() per file
+    versus importDirectory() with a pool of 1, 2, 4... worker processes'''
+    directory = os.path.join(workdir, f'bench_importdir_{fileCount}')
+    createTextTree(directory, fileCount, fileSize)
+    megabytes = fileCount * fileSize / 2**20
+    print(f'{fileCount} files of {fileSize} characters, {os.cpu_count()} cpus')
+    print(f'{"mode":<14} {"seconds":>8} {"files/s":>10} {"MB/s":>8}')
+    def perNote(db):
+        folders = {}
+        for path, _, files in os.walk(directory):
+            parentid = folders.get(os.path.dirname(path), cipherdb.ID_ROOT)
+            folders[path] = db.insertFolders(os.path.basename(path), parentid)
+            for name in files:
+                with open(os.path.join(path, name), 'r', encoding='utf-8') as f:
+                    db.insertTexts(f.read(), db.insertFolders(os.path.splitext(name)[0], folders[path]))
+    db = createBenchDatabase(os.path.join(workdir, 'bench_importdir.db'), 0)
+    seconds = timeit(lambda: perNote(db))[0]
+    db.closeDatabase()
+    print(f'{"per note":<14} {seconds:>8.3f} {fileCount / seconds:>10.0f} {megabytes / seconds:>8.1f}')
+    for workers in workerCounts:
+        db = createBenchDatabase(os.path.join(workdir, 'bench_importdir.db'), 0)
+        stats = dirimport.importDirectory(db, directory, workers=workers)
+        db.closeDatabase()
+        assert stats['files'] == fileCount and not stats['failed']
+        print(f'{f"import x{workers}":<14} {stats["seconds"]:>8.3f} {fileCount / stats["seconds"]:>10.0f} {megabytes / stats["seconds"]:>8.1f}')
+
+def proseTexts(count:int, size:int) -> list:
+    '''count texts of size characters which compress about as well as prose: sentences of words drawn from a vocabulary
+    of 5000 words by their rank, as the words of a language are, the 16 words of createLegacyDatabase() compress far better'''
+    rnd = random.Random(size)
+    letters = 'etaoinshrdlcumwfgypbvkjxqz'
+    vocabulary = [''.join(rnd.choices(letters, weights=range(len(letters), 0, -1), k=rnd.randint(2, 10))) for i in range(5000)]
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    texts = []
+    for i in range(count):
+        sentences, length = [], 0
+        while length < size:
+            sentence = ' '.join(rnd.choices(vocabulary, weights, k=rnd.randint(5, 20))).capitalize() + ('.\n' if rnd.random() < 0.2 else '. ')
+            sentences.append(sentence)
+            length += len(sentence)
+        texts.append(''.join(sentences)[:size])
+    return texts
+
+def benchCodec(noteCount:int, noteSizes:list, workdir:str) -> None:
+    '''size of the notes and of the database, write and read latency of the notes encrypted as they are, compressed by
+    zlib only and compressed by the codec notecodec chooses by size. the search index takes the same room in each mode.
+    the notes are read with the note cache disabled, from the page cache of the file system'''
+    print(f'{noteCount} notes of prose per size')
+    print(f'{"characters":>10} {"mode":<9} {"notes(MB)":>9} {"ratio":>6} {"database(MB)":>12} {"write(ms)":>10} {"read(ms)":>9}')
+    lzmaMinBytes = notecodec.LZMA_MIN_BYTES
+    for noteSize in noteSizes:
+        texts = proseTexts(noteCount, noteSize)
+        sizes = {}
+        for mode in ('raw', 'zlib', 'adaptive'):
+            notecodec.LZMA_MIN_BYTES = sys.maxsize if mode == 'zlib' else lzmaMinBytes
+            filename = os.path.join(workdir, 'bench_codec.db')
+            db = createBenchDatabase(filename, 0)
+            db.compressed = mode != 'raw'
+            folderids = [db.insertFolders(f'note {i}', cipherdb.ID_ROOT) for i in range(noteCount)]
+            write = timeit(lambda: [db.insertTexts(text, folderid) for text, folderid in zip(texts, folderids)])[0]
+            sizes[mode] = db.dbConn.execute(f'SELECT sum(length({cipherdb.TBL_CHUNKS_F_VALUE})) FROM {cipherdb.TBL_CHUNKS}').fetchone()[0]
+            db.closeDatabase()
+            db = cipherdb.CiperDatabase(filename, 0)
+            db.openDatabase(filename)
+            db.verifyPasswd(BENCH_PASSWD)
+            read, result = timeit(lambda: [db.readTextByFolderid(folderid)[1] for folderid in folderids])
+            assert result == texts
+            db.closeDatabase()
+            print(f'{noteSize:>10} {mode:<9} {sizes[mode] / 2**20:>9.2f} {sizes[mode] / sizes["raw"]:>6.2f} {os.path.getsize(filename) / 2**20:>12.2f} '
+                f'{write / noteCount * 1000:>10.3f} {read / noteCount * 1000:>9.3f}')
+    notecodec.LZMA_MIN_BYTES = lzmaMinBytes
+
+def benchBatch(count:int, workdir:str) -> None:
+    '''time to insert count folders, one commit per insert versus one batch() per run,
+    with the default rollback journal and with WAL and synchronous NORMAL'''
+    print(f'{count} folders inserted')
+    print(f'{"journal/synchronous":<22} {"mode":<18} {"seconds":>8} {"inserts/s":>10}')
+    for journalMode, synchronous in [(None, None), ('WAL', 'NORMAL')]:
+        for batched in [False, True]:
+            filename = os.path.join(workdir, 'bench_batch.db')
+            for suffix in ['', '-wal', '-shm']:
+                if os.path.exists(filename + suffix):
+                    os.remove(filename + suffix)
+            db = cipherdb.CiperDatabase(filename)
+            db.createDatabase(filename, BENCH_PASSWD, journalMode, synchronous)
+            def insert():
+                for i in range(count):
+                    db.insertFolders(f'folder {i}', cipherdb.ID_ROOT)
+            def insertBatched():
+                with db.batch():
+                    insert()
+            elapsed = timeit(insertBatched if batched else insert)[0]
+            db.closeDatabase()
+            durability = f'{journalMode or "default"}/{synchronous or "default"}'
+            print(f'{durability:<22} {"batch()" if batched else "commit per insert":<18} {elapsed:>8.3f} {count / elapsed:>10.0f}')
+
+class CountingCursor(sqlite3.Cursor):
+    '''cursor which replays the statements on a model of the statement cache of sqlite3,
+    an LRU cache of cipherdb.STATEMENT_CACHE_SIZE prepared statements keyed by the text of the sql'''
+    cache = OrderedDict()
+    hits = 0
+    misses = 0
+    @classmethod
+    def reset(cls) -> None:
+        cls.cache.clear()
+        cls.hits = cls.misses = 0
+    @classmethod
+    def hitRate(cls) -> float:
+        return cls.hits / max(cls.hits + cls.misses, 1)
+    def __lookup(self, sql:str) -> None:
+        if sql in CountingCursor.cache:
+            CountingCursor.cache.move_to_end(sql)
+            CountingCursor.hits += 1
+            return
+        CountingCursor.misses += 1
+        CountingCursor.cache[sql] = True
+        if len(CountingCursor.cache) > cipherdb.STATEMENT_CACHE_SIZE:
+            CountingCursor.cache.popitem(last=False)
+    def execute(self, sql, params=()):
+        self.__lookup(sql)
+        return super().execute(sql, params)
+    def executemany(self, sql, paramsList):
+        self.__lookup(sql)
+        return super().executemany(sql, paramsList)
+
+def legacyStatements(cursor:sqlite3.Cursor, aes:ECP.AESCipher, folderids:list, parentids:list) -> list:
+    '''insert, rename and read folders with the values formatted into the sql, as cipherdb did before'''
+    F = cipherdb
+    def insert():
+        for folderid in folderids:
+            cursor.execute(f"INSERT INTO {F.TBL_FOLDERS} ({F.TBL_FOLDERS_F_ID}, {F.TBL_FOLDERS_F_NAME}, {F.TBL_FOLDERS_F_PARENTID}) VALUES ({folderid}, X'{aes.encrypt(str(folderid))}', {parentids[folderid % len(parentids)]});")
+    def update():
+        for folderid in folderids:
+            cursor.execute(f"UPDATE {F.TBL_FOLDERS} SET {F.TBL_FOLDERS_F_NAME}=X'{aes.encrypt('renamed')}' WHERE {F.TBL_FOLDERS_F_ID}={folderid}")
+    def read():
+        for parentid in parentids:
+            cursor.execute(f"SELECT {F.TBL_FOLDERS_F_ID},{F.TBL_FOLDERS_F_NAME},{F.TBL_FOLDERS_F_PARENTID} FROM {F.TBL_FOLDERS} WHERE {F.TBL_FOLDERS_F_PARENTID}={parentid}")
+            aes.decryptManyRaw([record[1] for record in cursor.fetchall()])
+    return [('insert', len(folderids), insert), ('update', len(folderids), update), ('read', len(parentids), read)]
+
+def boundStatements(cursor:sqlite3.Cursor, aes:ECP.AESCipher, folderids:list, parentids:list) -> list:
+    '''same work as legacyStatements() with the values bound as parameters, as cipherdb does now'''
+    F = cipherdb
+    def insert():
+        for folderid in folderids:
+            cursor.execute(f"INSERT INTO {F.TBL_FOLDERS} ({F.TBL_FOLDERS_F_ID}, {F.TBL_FOLDERS_F_NAME}, {F.TBL_FOLDERS_F_PARENTID}) VALUES (?, ?, ?);", (folderid, aes.encryptRaw(str(folderid)), parentids[folderid % len(parentids)]))
+    def update():
+        for folderid in folderids:
+            cursor.execute(f"UPDATE {F.TBL_FOLDERS} SET {F.TBL_FOLDERS_F_NAME}=? WHERE {F.TBL_FOLDERS_F_ID}=?", (aes.encryptRaw('renamed'), folderid))
+    def read():
+        for parentid in parentids:
+            cursor.execute(f"SELECT {F.TBL_FOLDERS_F_ID},{F.TBL_FOLDERS_F_NAME},{F.TBL_FOLDERS_F_PARENTID} FROM {F.TBL_FOLDERS} WHERE {F.TBL_FOLDERS_F_PARENTID}=?", (parentid,))
+            aes.decryptManyRaw([record[1] for record in cursor.fetchall()])
+    return [('insert', len(folderids), insert), ('update', len(folderids), update), ('read', len(parentids), read)]
+
+def benchStatements(count:int, reads:int, workdir:str) -> None:
+    '''throughput of insert, update and read with the values formatted into the sql versus bound parameters,
+    the hit rate of the statement cache is reported for each'''
+    folderids = list(range(1, count + 1))
+    parentids = [cipherdb.ID_ROOT] + folderids[:reads - 1]
+    print(f'{count} rows inserted and updated, {reads} reads by parentid')
+    print(f'{"statements":<12} {"operation":<10} {"seconds":>8} {"rows/s":>10} {"cache hit rate":>15}')
+    for mode in ['formatted', 'bound']:
+        filename = os.path.join(workdir, 'bench_statements.db')
+        if os.path.exists(filename):
+            os.remove(filename)
+        db = cipherdb.CiperDatabase(filename)
+        db.createDatabase(filename, BENCH_PASSWD)
+        db.dbCursor = db.dbConn.cursor(CountingCursor)
+        if mode == 'formatted':
+            operations = legacyStatements(db.dbCursor, db.aes, folderids, parentids)
+        else:
+            operations = boundStatements(db.dbCursor, db.aes, folderids, parentids)
+        for name, rows, operation in operations:
+            CountingCursor.reset()
+            with db.batch():
+                elapsed = timeit(operation)[0]
+            print(f'{mode:<12} {name:<10} {elapsed:>8.3f} {rows / elapsed:>10.0f} {CountingCursor.hitRate():>15.1%}')
+        db.closeDatabase()
+
+def checkQueryPlans(workdir:str) -> bool:
+    '''run EXPLAIN QUERY PLAN on the statements issued by the frequent queries of CiperDatabase,
+    both on a new database and on an upgraded 1.0 database, none of them may scan a whole table
+    return True if all the statements use an index'''
+    newFile = os.path.join(workdir, 'bench_plan_new.db')
+    oldFile = os.path.join(workdir, 'bench_plan_old.db')
+    createBenchDatabase(newFile, 1000).closeDatabase()
+    createLegacyDatabase(oldFile, 1000, 100)
+    passed = True
+    for filename in [newFile, oldFile]:
+        db = openBenchDatabase(filename)
+        folderid = db.readTableFolders(cipherdb.ID_ROOT)[0][0]
+        textid = db.readTextByFolderid(folderid)[0]
+        if textid == cipherdb.ID_ROOT:
+            textid = db.insertTexts('note', folderid)
+        db.noteCache.clear() #the note is read from the database
+        db.folderPath(folderid) #the folder index is loaded once by reading the whole table
+        statements = []
+        db.dbConn.set_trace_callback(statements.append)
+        db.readTableFolders(folderid)
+        db.readTableFoldersWithChildFlag(folderid)
+        db.readTextByFolderid(folderid)
+        db.updateTextsTextByTextid(textid, 'note\nedited')
+        db.searchNotes('note edited')
+        db.updateTableFoldersDeleteFolder(folderid)
+        db.dbConn.set_trace_callback(None)
+        print(os.path.basename(filename))
+        for sql in statements:
+            if not sql.lstrip().upper().startswith(('SELECT', 'DELETE', 'UPDATE')):
+                continue
+            plan = [record[3] for record in db.dbConn.execute('EXPLAIN QUERY PLAN ' + sql)]
+            #a scan of a bounded subquery, of the constant row of a SELECT without FROM
+            #or of the queue of the recursive walk of SQL_SUBTREE reads no table
+            ok = not any(detail.startswith('SCAN') and not detail.startswith(('SCAN (subquery', 'SCAN CONSTANT ROW'))
+                and detail not in ('SCAN s', 'SCAN subtree') for detail in plan)
+            passed = passed and ok
+            print(f'  {"ok  " if ok else "FAIL"} {" ".join(sql.split())[:90]}')
+            for detail in plan:
+                print(f'         {detail}')
+        db.closeDatabase()
+    return passed
+
+def main() -> None:
+    '''parse the command line and run the selected benchmark'''
+    parser = argparse.ArgumentParser(description='benchmarks for the cipher notebook')
+    parser.add_argument('--workdir', default=None, help='directory for the generated databases, a temporary directory by default')
+    subparsers = parser.add_subparsers(dest='bench', required=True)
+
+    sub = subparsers.add_parser('foldertree', help='open time of the folder tree')
+    sub.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    sub.add_argument('--legacy-limit', type=int, default=10000, help='skip the per-folder loader above this size, it is quadratic')
+
+    sub = subparsers.add_parser('cipher', help='per record versus batch encryption throughput')
+    sub.add_argument('--count', type=int, default=100000)
+    sub.add_argument('--size', type=int, default=32, help='characters per record')
+
+    sub = subparsers.add_parser('storage', help='file size and read latency, hex strings versus BLOB')
+    sub.add_argument('--notes', type=int, default=20000)
+    sub.add_argument('--size', type=int, default=2000, help='characters per note')
+
+    sub = subparsers.add_parser('batch', help='commit per statement versus batch(), rollback journal versus WAL')
+    sub.add_argument('--count', type=int, default=2000)
+
+    sub = subparsers.add_parser('statements', help='values formatted into the sql versus bound parameters')
+    sub.add_argument('--count', type=int, default=100000)
+    sub.add_argument('--reads', type=int, default=1000, help='number of reads by parentid, each is a table scan')
+
+    sub = subparsers.add_parser('rekey', help='time and memory of changing the password, whole table versus chunks')
+    sub.add_argument('--notes', type=int, default=20000)
+    sub.add_argument('--size', type=int, default=2000, help='characters per note')
+
+    sub = subparsers.add_parser('rekeyworkers', help='rows/s of changing the password with a pool of worker processes')
+    sub.add_argument('--notes', type=int, default=20000)
+    sub.add_argument('--size', type=int, default=2000, help='characters per note')
+    sub.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+
+    sub = subparsers.add_parser('save', help='save latency of a small edit versus note size, whole note versus dirty ranges')
+    sub.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000], help='note sizes in KB')
+    sub.add_argument('--saves', type=int, default=20)
+
+    sub = subparsers.add_parser('search', help='build time of the search index and lookup latency versus decrypting every note')
+    sub.add_argument('--notes', type=int, default=20000)
+    sub.add_argument('--size', type=int, default=2000, help='characters per note')
+    sub.add_argument('--lookups', type=int, default=1000)
+
+    sub = subparsers.add_parser('scan', help='notes/s of a substring search decrypting every note, read loop versus worker processes')
+    sub.add_argument('--notes', type=int, default=20000)
+    sub.add_argument('--size', type=int, default=2000, help='characters per note')
+    sub.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+
+    sub = subparsers.add_parser('copy', help='time to copy and move a subtree, record by record versus copySubtree()/moveSubtree()')
+    sub.add_argument('--folders', type=int, default=10000)
+    sub.add_argument('--size', type=int, default=200, help='characters per note')
+
+    sub = subparsers.add_parser('archive', help='throughput and memory of exporting to an archive and importing it, versus the notebook size')
+    sub.add_argument('--notes', type=int, nargs='+', default=[2000, 20000])
+    sub.add_argument('--size', type=int, default=2000, help='characters per note')
+
+    sub = subparsers.add_parser('importdir', help='files/s of importing a directory tree of text files, per note versus importDirectory()')
+    sub.add_argument('--files', type=int, default=20000)
+    sub.add_argument('--size', type=int, default=2000, help='characters per file')
+    sub.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+
+    sub = subparsers.add_parser('codec', help='database size, write and read latency of the notes, raw versus compressed before encryption')
+    sub.add_argument('--notes', type=int, default=500)
+    sub.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000], help='characters per note')
+
+    sub = subparsers.add_parser('queryplan', help='check that the frequent queries use the indexes, exit with 1 if not')
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = args.workdir or tmpdir
+        if args.bench == 'foldertree':
+            benchFolderTree(args.sizes, args.legacy_limit, workdir)
+        elif args.bench == 'cipher':
+            benchCipher(args.count, args.size)
+        elif args.bench == 'storage':
+            benchStorage(args.notes, args.size, workdir)
+        elif args.bench == 'batch':
+            benchBatch(args.count, workdir)
+        elif args.bench == 'statements':
+            benchStatements(args.count, args.reads, workdir)
+        elif args.bench == 'rekey':
+            benchRekey(args.notes, args.size, workdir)
+        elif args.bench == 'rekeyworkers':
+            benchRekeyWorkers(args.notes, args.size, args.workers, workdir)
+        elif args.bench == 'save':
+            benchSave(args.sizes, args.saves, workdir)
+        elif args.bench == 'search':
+            benchSearch(args.notes, args.size, args.lookups, workdir)
+        elif args.bench == 'scan':
+            benchScan(args.notes, args.size, args.workers, workdir)
+        elif args.bench == 'copy':
+            benchCopy(args.folders, args.size, workdir)
+        elif args.bench == 'archive':
+            benchArchive(args.notes, args.size, workdir)
+        elif args.bench == 'importdir':
+            benchImportDir(args.files, args.size, args.workers, workdir)
+        elif args.bench == 'codec':
+            benchCodec(args.notes, args.sizes, workdir)
+        elif args.bench == 'queryplan':
+            if not checkQueryPlans(workdir):
+                sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -7,14 +7,48 @@ Version: 1.0
 Update: 2023-2-20
 Requires: PyQt5
 '''
+from __future__ import annotations #ECP is loaded lazily, the annotations must not touch it
 import os
+import sys
+import importlib.util
 import datetime
 import sqlite3
-import uuid
-import encryption as ECP
+import re
+import zlib
+import hmac
+import hashlib
 import logging
 import operator as OPT
-DB_VERSION = '1.0'
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from contextlib import contextmanager
+from collections import deque, OrderedDict
+#the process pool of concurrent.futures is only imported when a pool is created, it pulls in multiprocessing
+import concurrent.futures
+from concurrent.futures import Executor
+from binascii import a2b_hex
+
+def lazyImport(name:str):
+    '''the module is loaded at the first use of one of its attributes,
+    so that the modules only needed once a database is open do not delay the start of the GUI'''
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+ECP = lazyImport('encryption') #pycryptodome takes about as long to import as the rest of cipherdb
+uuid = lazyImport('uuid')
+notecodec = lazyImport('notecodec')
+
+DB_VERSION = '5.0' #notes may be compressed before they are encrypted, see notecodec
+DB_VERSION_4 = '4.0' #search index, table searchtokens
+DB_VERSION_3 = '3.0' #notes are saved in chunks, table textchunks
+DB_VERSION_2 = '2.0' #cipher texts are saved as BLOB
+DB_VERSION_1 = '1.0' #cipher texts are saved as hex strings
 
 TBL_FOLDERS = 'folders' #table name
 #field names for table TBL_FOLDERS
@@ -31,6 +65,32 @@ TBL_TEXT_F_FOLDERID = 'folderid'
 TBL_TEXT_F_DATE_C = 'dateCreate'
 TBL_TEXT_F_DATE_E = 'dateLastEdit'
 
+TBL_CHUNKS = 'textchunks' #a note is split into chunks encrypted separately, textval of TBL_TEXT is empty then
+
+#field names for table TBL_CHUNKS
+TBL_CHUNKS_F_ID = 'chunkid'
+TBL_CHUNKS_F_TEXTID = 'textid'
+TBL_CHUNKS_F_SEQ = 'seq' #position of the chunk in the note
+TBL_CHUNKS_F_VALUE = 'chunkval'
+
+#inverted index for search, a keyed hash of a word maps to the folder names and the chunks of notes holding it
+TBL_SEARCH = 'searchtokens'
+
+#field names for table TBL_SEARCH
+TBL_SEARCH_F_TOKEN = 'token'
+TBL_SEARCH_F_KIND = 'kind' #one of SEARCH_KIND_*, what ownerid is
+TBL_SEARCH_F_OWNERID = 'ownerid'
+SEARCH_KIND_FOLDER = 0 #ownerid is a folderid, the word is in the folder name
+SEARCH_KIND_TEXT = 1 #ownerid is a textid, the word is in textval of a note saved before version 3.0
+SEARCH_KIND_CHUNK = 2 #ownerid is a chunkid
+
+#files and directories imported by dirimport, so that an interrupted import can be resumed. created by the first import
+TBL_IMPORTS = 'importedpaths'
+
+#field names for table TBL_IMPORTS
+TBL_IMPORTS_F_PATH = 'pathhash' #keyed hash of the path, the path itself is not saved
+TBL_IMPORTS_F_FOLDERID = 'folderid' #the folder created for the file or directory
+
 ID_ROOT = 0
 
 TBL_SYS = 'sysinfo' #table which holds system info
@@ -39,56 +99,534 @@ TBL_SYS_F_ID = 'itemindex'
 TBL_SYS_F_ITEMVALUE = 'itemvalue'
 TBL_SYS_V_IDX_VER = 1
 TBL_SYS_V_IDX_SAMPLE = 2
+TBL_SYS_V_IDX_SEARCH = 3 #'1' once every record is in the search index, '0' after an upgrade
+
+#indexes for the frequent queries: children of a folder, text of a folder, chunks of a text
+IDX_FOLDERS_PARENTID = 'idx_folders_parentid'
+IDX_TEXT_FOLDERID = 'idx_texts_folderid'
+IDX_CHUNKS_TEXTID = 'idx_textchunks_textid'
+IDX_SEARCH_OWNERID = 'idx_searchtokens_ownerid' #for removing the words of a record rewritten or deleted
+INDEXES = ((IDX_FOLDERS_PARENTID, TBL_FOLDERS, TBL_FOLDERS_F_PARENTID),
+    (IDX_TEXT_FOLDERID, TBL_TEXT, TBL_TEXT_F_FOLDERID),
+    (IDX_CHUNKS_TEXTID, TBL_CHUNKS, f'{TBL_CHUNKS_F_TEXTID},{TBL_CHUNKS_F_SEQ}'),
+    (IDX_SEARCH_OWNERID, TBL_SEARCH, TBL_SEARCH_F_OWNERID))
+
+#the columns holding cipher texts: table, id field, value field, kind of the words of the value in the search index
+ENCRYPTED_COLUMNS = ((TBL_FOLDERS, TBL_FOLDERS_F_ID, TBL_FOLDERS_F_NAME, SEARCH_KIND_FOLDER),
+    (TBL_TEXT, TBL_TEXT_F_ID, TBL_TEXT_F_VALUE, SEARCH_KIND_TEXT),
+    (TBL_CHUNKS, TBL_CHUNKS_F_ID, TBL_CHUNKS_F_VALUE, SEARCH_KIND_CHUNK))
+
+#the folderids of the folder bound to ? and all its descendants, walked by the index on parentid.
+#UNION drops the folders already visited, so a damaged tree holding a cycle does not recurse forever.
+#it is used as a subquery, a statement starting with WITH is not seen as a modification by sqlite3 and gets no transaction
+SQL_SUBTREE = f"""WITH RECURSIVE subtree(id) AS (SELECT ? UNION
+    SELECT f.{TBL_FOLDERS_F_ID} FROM {TBL_FOLDERS} f JOIN subtree s ON f.{TBL_FOLDERS_F_PARENTID}=s.id) SELECT id FROM subtree"""
 
 DEFAULT_PASSWD = 'HiJared@2022' #default password used to encrypt the database
 SAMPLE_TEXT = 'PasswordNotebookByJared@202212'
+UNIQUE_ID_BITS = 52 #random bits of the ids of the records, exact in a double as well, e.g. in JSON
+
+#journal modes and synchronous levels accepted by openDatabase() and createDatabase()
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+STATEMENT_CACHE_SIZE = 128 #number of prepared statements kept by a connection, more than the statements used here
+
+#a chunk of records re-encrypted by changePasswd() holds at most so many records and about so many bytes
+REKEY_CHUNK_ROWS = 1000
+REKEY_CHUNK_BYTES = 4 * 1024 * 1024
+
+#a note is split at line ends, a chunk ends at a line whose crc32 has the bits of CHUNK_BOUNDARY_MASK cleared
+#once it holds CHUNK_MIN_SIZE characters, or at CHUNK_MAX_SIZE characters
+CHUNK_MIN_SIZE = 8 * 1024
+CHUNK_MAX_SIZE = 64 * 1024
+CHUNK_BOUNDARY_MASK = 0x3f
+CHUNK_READ_ROWS = 64 #chunks read by one query when a note is loaded
+
+DEFAULT_CACHE_SIZE = 32 * 1024 * 1024 #bytes of decrypted notes kept by NoteCache
+DEFAULT_PREFETCH_BUDGET = 10 #notes decrypted in advance by prefetchNotes() when a folder is selected
+
+#a word is a run of letters and digits, or a single CJK character since those are written without spaces.
+#words are compared case insensitively and only their first SEARCH_TOKEN_MAX_LENGTH characters count
+SEARCH_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+SEARCH_TOKEN_PATTERN = re.compile(f'[{SEARCH_CJK}]|[^\\W{SEARCH_CJK}]+')
+SEARCH_TOKEN_MAX_LENGTH = 64
+SEARCH_TOKEN_BYTES = 16 #the HMAC of a word is truncated to so many bytes
+SEARCH_KEY_LABEL = b'passnote search index' #the key of the HMAC is derived from the password with this label
+SEARCH_RANK_LIMIT = 1000 #the words of a query are ranked by their number of records, counted up to this limit
+SCAN_BATCH_BYTES = 4 * 1024 * 1024 #cipher texts decrypted and matched by scanNotes() at once, a worker process gets one batch at a time
+POOL_START_METHOD = 'spawn' #of the processes of the rekey and scan pools, see CiperDatabase.__scanPool()
+IMPORT_KEY_LABEL = b'passnote imported paths' #the key of the HMAC of the paths imported is derived from the password with this label
+IMPORT_LOOKUP_ROWS = 500 #paths looked up by one query of importedPaths()
+
+class OperationCancelled(Exception):
+    '''raised inside a long operation when its progress callback asks to stop, the transaction is rolled back'''
+
+def searchTokens(text:str) -> set:
+    '''the distinct words of a text, see SEARCH_TOKEN_PATTERN'''
+    return {token[:SEARCH_TOKEN_MAX_LENGTH] for token in SEARCH_TOKEN_PATTERN.findall(text.casefold())}
+
+def searchKeyOf(aes:ECP.AESCipher) -> bytes:
+    '''the key of the HMAC of the words, derived from the key of the cipher so that it changes with the password'''
+    return hmac.digest(aes.key, SEARCH_KEY_LABEL, 'sha256')
+
+def tokenHashes(searchKey:bytes, text:str) -> set:
+    '''the keyed hashes of the distinct words of a text, which are saved in the search index instead of the words.
+    the same word has the same hash in every note, so the index tells how often a word is used but not which word it is'''
+    return {hmac.digest(searchKey, token.encode(), 'sha256')[:SEARCH_TOKEN_BYTES] for token in searchTokens(text)}
+
+def rekeyAndIndex(oldAes:ECP.AESCipher, newAes:ECP.AESCipher, searchKey:bytes, values:list, compressed:bool) -> tuple:
+    '''decrypt the cipher texts with the old password and encrypt them with the new one, compressed or not, see notecodec.
+    return (cipher texts, hashes of the words of each text with the new searchKey)'''
+    texts = notecodec.decodeMany(oldAes, values)
+    return notecodec.encodeMany(newAes, texts, compressed), [tokenHashes(searchKey, text) for text in texts]
+
+#the ciphers of the old and the new password and the new search key in a worker process of changePasswd(), set by initRekeyWorker()
+rekeyCiphers = None
+
+def initRekeyWorker(oldAes:ECP.AESCipher, newAes:ECP.AESCipher) -> None:
+    '''initializer of the worker processes of changePasswd(), the ciphers are sent once instead of with every chunk'''
+    global rekeyCiphers
+    rekeyCiphers = (oldAes, newAes, searchKeyOf(newAes))
+
+def rekeyValues(values:list, compressed:bool) -> tuple:
+    '''run in a worker process, see rekeyAndIndex()'''
+    return rekeyAndIndex(*rekeyCiphers, values, compressed)
+
+#the cipher in a worker process of scanNotes(), set by initScanWorker(), the pool is kept for the next scans
+scanAes = None
+
+def initScanWorker(aes:ECP.AESCipher) -> None:
+    '''initializer of the worker processes of scanNotes()'''
+    global scanAes
+    scanAes = aes
+
+def scanMatches(aes:ECP.AESCipher, pattern, items:list) -> list:
+    '''items: [(folderid, [cipher texts]), ...], the cipher texts of an item are the parts of one text.
+    decrypt the texts and return the folderids of those matching the pattern.
+    pattern: a compiled regular expression, or a lower case str found in the lower case text,
+        which is several times faster than a case insensitive regular expression'''
+    texts = notecodec.decodeMany(aes, [value for _, values in items for value in values])
+    found, start = [], 0
+    for folderid, values in items:
+        text = ''.join(texts[start:start + len(values)])
+        if (pattern in text.lower()) if isinstance(pattern, str) else pattern.search(text):
+            found.append(folderid)
+        start += len(values)
+    return found
+
+def scanValues(pattern, items:list) -> list:
+    '''run in a worker process, see scanMatches()'''
+    return scanMatches(scanAes, pattern, items)
+
+class NoteCache():
+    '''LRU cache of the decrypted notes keyed by folderid, the total size of the texts is kept under maxBytes'''
+    def __init__(self, maxBytes:int=DEFAULT_CACHE_SIZE):
+        self.maxBytes = maxBytes
+        self.notes = OrderedDict() #folderid: (textid, text, dateCreate, dateEdit), the least recently used first
+        self.folderids = {} #textid: folderid, to find a note updated by its textid
+        self.size = 0
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def __sizeOf(self, note:tuple) -> int:
+        '''memory used by the text of a note'''
+        return sys.getsizeof(note[1])
+
+    def __contains__(self, folderid:int) -> bool:
+        '''if the note of the folder is cached, the counters are not changed'''
+        return folderid in self.notes
+
+    def get(self, folderid:int) -> tuple:
+        '''return the cached note of the folder, None if not cached'''
+        note = self.notes.get(folderid)
+        if note == None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.notes.move_to_end(folderid)
+        return note
+
+    def put(self, folderid:int, note:tuple) -> None:
+        '''cache the note of a folder, the least recently used notes are evicted if the cache is full'''
+        self.discard(folderid)
+        size = self.__sizeOf(note)
+        if size > self.maxBytes:
+            return
+        self.notes[folderid] = note
+        if note[0] != ID_ROOT:
+            self.folderids[note[0]] = folderid
+        self.size += size
+        while self.size > self.maxBytes:
+            self.discard(next(iter(self.notes)))
+            self.evictions += 1
+
+    def textOf(self, textid:int) -> str:
+        '''return the cached text of a note by its textid, None if not cached, the counters are not changed'''
+        folderid = self.folderids.get(textid)
+        return None if folderid == None else self.notes[folderid][1]
+
+    def updateText(self, textid:int, text:str, dateEdit:str) -> None:
+        '''a text was saved, update its cached note if any'''
+        folderid = self.folderids.get(textid)
+        if folderid != None:
+            _, _, dateCreate, _ = self.notes[folderid]
+            self.put(folderid, (textid, text, dateCreate, dateEdit))
+
+    def discard(self, folderid:int) -> None:
+        '''remove the note of the folder from the cache'''
+        note = self.notes.pop(folderid, None)
+        if note != None:
+            self.folderids.pop(note[0], None)
+            self.size -= self.__sizeOf(note)
+
+    def clear(self) -> None:
+        '''remove all the notes, the counters are kept'''
+        self.notes.clear()
+        self.folderids.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        '''counters of the cache'''
+        return {'notes': len(self.notes), 'bytes': self.size, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+class FolderNode():
+    '''a folder of FolderIndex, name is None until it is decrypted, path is None until it is asked for'''
+    __slots__ = ('folderid', 'parentid', 'cipherName', 'name', 'children', 'path')
+    def __init__(self, folderid:int, parentid:int, cipherName:bytes, name:str=None):
+        self.folderid, self.parentid, self.cipherName, self.name = folderid, parentid, cipherName, name
+        self.children = [] #folderids
+        self.path = None #tuple of the folderids from a root folder to this one
+
+class FolderIndex():
+    '''all the folders in memory: folderid to node, the children of each folder and the paths, so that a folder is
+    found without a query or a walk of the tree. ID_ROOT has a node too, its children are the root folders.
+    the names are kept encrypted until CiperDatabase.folderName() decrypts them'''
+    def __init__(self, records:list=(), names:list=None):
+        '''records: [folderid, cipher name, parentid] of every folder, names: the decrypted names if known'''
+        self.nodes = {ID_ROOT: FolderNode(ID_ROOT, None, b'', '')}
+        self.nodes[ID_ROOT].path = ()
+        for i, (folderid, cipherName, parentid) in enumerate(records):
+            self.nodes[folderid] = FolderNode(folderid, parentid, cipherName, None if names == None else names[i])
+        for node in list(self.nodes.values())[1:]:
+            parent = self.nodes.get(node.parentid)
+            if parent != None:
+                parent.children.append(node.folderid)
+
+    def __contains__(self, folderid:int) -> bool:
+        return folderid in self.nodes
+
+    def __len__(self) -> int:
+        '''number of folders'''
+        return len(self.nodes) - 1
+
+    def node(self, folderid:int) -> FolderNode:
+        '''the node of the folder, None if there is no such folder'''
+        return self.nodes.get(folderid)
+
+    def children(self, folderid:int) -> list:
+        '''the folderids of the children of the folder'''
+        node = self.nodes.get(folderid)
+        return [] if node == None else list(node.children)
+
+    def path(self, folderid:int) -> list:
+        '''the folderids from a root folder to the folder, [folderid] for an unknown folder.
+        the path of each folder on the way is cached, so the next path below it costs one step'''
+        pending, node = [], self.nodes.get(folderid)
+        if node == None:
+            return [folderid]
+        while node.path == None:
+            pending.append(node)
+            parent = self.nodes.get(node.parentid)
+            if parent == None or parent in pending: #a lost parent or a cycle, the folder is shown as a root
+                pending[-1].path = (pending[-1].folderid,)
+                pending.pop()
+                break
+            node = parent
+        for node in reversed(pending):
+            node.path = self.nodes[node.parentid].path + (node.folderid,)
+        return list(self.nodes[folderid].path)
+
+    def subtree(self, folderid:int) -> list:
+        '''the folderids of the folder and all its descendants'''
+        ids, pending = [], [folderid]
+        while pending:
+            node = self.nodes.get(pending.pop())
+            if node != None:
+                ids.append(node.folderid)
+                pending += node.children
+        return ids
+
+    def add(self, folderid:int, parentid:int, cipherName:bytes, name:str=None) -> None:
+        '''a folder was inserted'''
+        self.nodes[folderid] = FolderNode(folderid, parentid, cipherName, name)
+        if parentid in self.nodes:
+            self.nodes[parentid].children.append(folderid)
+
+    def rename(self, folderid:int, cipherName:bytes, name:str) -> None:
+        '''the name of a folder was changed'''
+        node = self.nodes.get(folderid)
+        if node != None:
+            node.cipherName, node.name = cipherName, name
+
+    def move(self, folderid:int, parentid:int) -> None:
+        '''a folder got another parent, the cached paths of its subtree are dropped'''
+        node = self.nodes.get(folderid)
+        if node == None:
+            return
+        if node.parentid in self.nodes and folderid in self.nodes[node.parentid].children:
+            self.nodes[node.parentid].children.remove(folderid)
+        node.parentid = parentid
+        if parentid in self.nodes:
+            self.nodes[parentid].children.append(folderid)
+        for descendant in self.subtree(folderid):
+            self.nodes[descendant].path = None
+
+    def remove(self, folderid:int) -> None:
+        '''a folder was deleted, its descendants are dropped too since they cannot be reached any more'''
+        node = self.nodes.get(folderid)
+        if node == None:
+            return
+        if node.parentid in self.nodes and folderid in self.nodes[node.parentid].children:
+            self.nodes[node.parentid].children.remove(folderid)
+        for descendant in self.subtree(folderid):
+            del self.nodes[descendant]
+
+def splitText(text:str) -> list:
+    '''split a note into chunks at line ends, the text is the concatenation of the chunks.
+    A boundary depends on the line before it only, so an edit changes the chunks around it and the boundaries
+    of the rest of the note stay where they were. Lines longer than CHUNK_MAX_SIZE are cut'''
+    chunks, lines, size = [], [], 0
+    for line in text.splitlines(keepends=True):
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_MAX_SIZE or (size >= CHUNK_MIN_SIZE and zlib.crc32(line.encode()) & CHUNK_BOUNDARY_MASK == 0):
+            chunk = ''.join(lines)
+            chunks += [chunk[start:start + CHUNK_MAX_SIZE] for start in range(0, len(chunk), CHUNK_MAX_SIZE)]
+            lines, size = [], 0
+    if lines:
+        chunks.append(''.join(lines))
+    return chunks
+
+def chunkDigest(chunk:str) -> bytes:
+    '''digest of the plain text of a chunk, kept in memory only to find the chunks unchanged by an edit'''
+    return hashlib.blake2b(chunk.encode(), digest_size=16).digest()
+
+def utf16Length(text:str) -> int:
+    '''length of the text in UTF-16 code units, the unit of the positions of a QTextDocument'''
+    return len(text.encode('utf-16-le', 'surrogatepass')) // 2
+
+def applyEdits(text:str, edits:list) -> str:
+    '''replace ranges of the text, edits: [(start, end, newText), ...] sorted and not overlapping,
+    start and end are positions in UTF-16 code units, they are limited to the length of the text'''
+    if text.isascii():
+        #a position in UTF-16 code units is the index of the character, no need to encode the text
+        pieces, last = [], 0
+        for start, end, newText in edits:
+            end = min(end, len(text))
+            start = min(start, end)
+            pieces += [text[last:start], newText]
+            last = end
+        pieces.append(text[last:])
+        return ''.join(pieces)
+    data = text.encode('utf-16-le', 'surrogatepass')
+    length = len(data) // 2
+    pieces, last = [], 0
+    for start, end, newText in edits:
+        end = min(end, length)
+        start = min(start, end)
+        pieces += [data[last * 2:start * 2], newText.encode('utf-16-le', 'surrogatepass')]
+        last = end
+    pieces.append(data[last * 2:])
+    return b''.join(pieces).decode('utf-16-le', 'surrogatepass')
 
 def getUniqueId() -> int:
-    '''create a unique id for database records'''
-    return int((''.join([x[:4] for x in str(uuid.uuid4()).split('-')])[:10]),16)
+    '''create a unique id for database records, UNIQUE_ID_BITS random bits of a uuid4.
+    the ids of the older versions had 36 random bits only, they collided in bulk inserts of about 100000 records'''
+    return uuid.uuid4().int & ((1 << UNIQUE_ID_BITS) - 1)
 
 class CiperDatabase():
     '''a sqlite3 based database, with the main content encryped by AES'''
-    def __init__(self, strFileName:str):
+    def __init__(self, strFileName:str, cacheSize:int=DEFAULT_CACHE_SIZE, compressed:bool=True):
+        '''cacheSize: bytes of decrypted notes kept in memory, 0 to disable the cache
+        compressed: if the notes are compressed before they are encrypted, see notecodec, they are read either way'''
         self.passwdVerified = False #when a password is validated, set to True
         self.aes = None #encryption handle
+        self.searchKey = None #key of the hashes of the words in the search index, see searchKeyOf()
         self.dbConn = None
+        self.dbCursor = None #one cursor reused for all the statements
+        self.batchDepth = 0 #number of nested batch() blocks, commit is deferred while it is not zero
+        self.noteCache = NoteCache(cacheSize)
+        self.chunkStates = {} #textid: [(chunkid, digest, UTF-16 length), ...] of the chunks saved, for the notes read or written since opened
+        self.folderIndex = None #FolderIndex, loaded by the first lookup, see __folders()
+        self.compressed = compressed
+        self.scanPool = None #process pool of scanNotes(), kept for the next scans, see __scanPool()
+        self.scanPoolKey = None #(workers, aes) of the scan pool
         
     def __del__(self):
         '''destructor'''
+        self.closeDatabase()
+
+    def closeDatabase(self) -> None:
+        '''commit the pending modification and close the connection'''
+        if self.dbConn:
+            logging.info(f'note cache {self.noteCache.stats()}')
+        self.noteCache.clear()
+        self.chunkStates.clear()
+        self.folderIndex = None
+        self.__closeScanPool()
         if self.dbConn:
             self.dbConn.commit()
             self.dbConn.close()
-        
+            self.dbConn = None
+            self.dbCursor = None
+
 
-    def openDatabase(self, filename) -> bool:
-        '''connect a database'''
+    def openDatabase(self, filename, journalMode:str=None, synchronous:str=None) -> bool:
+        '''connect a database
+        journalMode: one of JOURNAL_MODES, e.g. 'WAL', the default of sqlite is kept if None
+        synchronous: one of SYNCHRONOUS_LEVELS, e.g. 'NORMAL', the default of sqlite is kept if None'''
         try:
-            #when a new instance is implemented, all tables will be created if not exist
-            self.dbConn = sqlite3.connect(filename)
-            
+            self.__connect(filename, journalMode, synchronous)
+            self.__upgradeDatabase()
         except:
             logging.debug(f'ERROR connecting database {filename}')
             return False
         
         return True
-    def createDatabase(self, filename, passwd) -> bool:
+    def __connect(self, filename:str, journalMode:str, synchronous:str) -> None:
+        '''connect the database file and create the cursor used by all the statements
+        all the statements bind their values as parameters, so the text of a statement never changes
+        and the prepared statement is reused from the statement cache of sqlite3'''
+        self.dbConn = sqlite3.connect(filename, cached_statements=STATEMENT_CACHE_SIZE)
+        self.dbCursor = self.dbConn.cursor()
+        self.__setDurability(journalMode, synchronous)
+    def __setDurability(self, journalMode:str, synchronous:str) -> None:
+        '''set the journal mode and the synchronous level of the connection, None keeps the current setting
+        WAL with NORMAL is much faster for frequent small commits, a commit may be lost on power failure but the database stays consistent'''
+        if journalMode:
+            if journalMode.upper() in JOURNAL_MODES:
+                self.dbConn.execute(f'PRAGMA journal_mode={journalMode.upper()}')
+            else:
+                logging.warning(f'unknown journal mode {journalMode} ignored')
+        if synchronous:
+            if synchronous.upper() in SYNCHRONOUS_LEVELS:
+                self.dbConn.execute(f'PRAGMA synchronous={synchronous.upper()}')
+            else:
+                logging.warning(f'unknown synchronous level {synchronous} ignored')
+    @contextmanager
+    def batch(self):
+        '''group the modifications done inside a with-block into one transaction:
+            with db.batch():
+                db.insertFolders(...)
+                db.updateTableFoldersParentidByFolderid(...)
+        the transaction is committed when the outermost block exits and rolled back if an exception is raised'''
+        self.batchDepth += 1
+        try:
+            yield self
+        except:
+            self.batchDepth -= 1
+            if self.batchDepth == 0:
+                self.dbConn.rollback()
+                #they may hold the notes and folders written by the rolled back transaction
+                self.noteCache.clear()
+                self.chunkStates.clear()
+                self.folderIndex = None
+            raise
+        self.batchDepth -= 1
+        if self.batchDepth == 0:
+            self.dbConn.commit()
+    def __upgradeDatabase(self) -> None:
+        '''upgrade a database created by an older version to the current format, called whenever a database is opened'''
+        data = self.__executeSqlWithFetchall(f'SELECT {TBL_SYS_F_ITEMVALUE} FROM {TBL_SYS} WHERE {TBL_SYS_F_ID}=?', (TBL_SYS_V_IDX_VER,))
+        version = data[0][0] if len(data) == 1 else DB_VERSION
+        if version == DB_VERSION_1:
+            self.__upgradeFromVersion1()
+            version = DB_VERSION_2
+        if version == DB_VERSION_2:
+            self.__upgradeFromVersion2()
+            version = DB_VERSION_3
+        if version == DB_VERSION_3:
+            self.__upgradeFromVersion3()
+            version = DB_VERSION_4
+        if version == DB_VERSION_4:
+            self.__upgradeFromVersion4()
+        self.__createIndexes()
+    def __createIndexes(self) -> None:
+        '''create the indexes of INDEXES which do not exist yet, databases created before an index was introduced get it here'''
+        existing = {record[0] for record in self.__executeSqlWithFetchall("SELECT name FROM sqlite_master WHERE type='index'")}
+        with self.batch():
+            for name, table, field in INDEXES:
+                if name not in existing:
+                    logging.info(f'creating index {name} on {table}({field})')
+                    self.__executeSqlWithoutReturn(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({field})')
+    def __upgradeFromVersion1(self) -> None:
+        '''version 1.0 saved the cipher texts as hex strings, convert them to BLOB, no password is needed for that'''
+        logging.info(f'upgrading database from version {DB_VERSION_1} to {DB_VERSION_2}')
+        self.dbConn.create_function('hex2blob', 1, a2b_hex, deterministic=True)
+        cursor = self.dbCursor
+        cursor.execute(f"UPDATE {TBL_FOLDERS} SET {TBL_FOLDERS_F_NAME}=hex2blob({TBL_FOLDERS_F_NAME}) WHERE typeof({TBL_FOLDERS_F_NAME})='text'")
+        cursor.execute(f"UPDATE {TBL_TEXT} SET {TBL_TEXT_F_VALUE}=hex2blob({TBL_TEXT_F_VALUE}) WHERE typeof({TBL_TEXT_F_VALUE})='text'")
+        cursor.execute(f"UPDATE {TBL_SYS} SET {TBL_SYS_F_ITEMVALUE}=hex2blob({TBL_SYS_F_ITEMVALUE}) WHERE {TBL_SYS_F_ID}=? AND typeof({TBL_SYS_F_ITEMVALUE})='text'", (TBL_SYS_V_IDX_SAMPLE,))
+        cursor.execute(f"UPDATE {TBL_SYS} SET {TBL_SYS_F_ITEMVALUE}=? WHERE {TBL_SYS_F_ID}=?", (DB_VERSION_2, TBL_SYS_V_IDX_VER))
+        self.dbConn.commit()
+        #the hex strings took twice the space, give the free pages back to the file system
+        self.dbConn.execute('VACUUM')
+    def __upgradeFromVersion2(self) -> None:
+        '''version 2.0 saved a note in textval of table texts, add the table of chunks.
+        the notes are not converted here, a note is saved in chunks the next time it is saved'''
+        logging.info(f'upgrading database from version {DB_VERSION_2} to {DB_VERSION_3}')
+        with self.batch():
+            self.__createTableChunks()
+            self.__executeSqlWithoutReturn(f"UPDATE {TBL_SYS} SET {TBL_SYS_F_ITEMVALUE}=? WHERE {TBL_SYS_F_ID}=?", (DB_VERSION_3, TBL_SYS_V_IDX_VER))
+    def __upgradeFromVersion3(self) -> None:
+        '''add the search index, it is built by the first search since the password is needed for that'''
+        logging.info(f'upgrading database from version {DB_VERSION_3} to {DB_VERSION_4}')
+        with self.batch():
+            self.__createTableSearch()
+            self.__executeSqlWithoutReturn(f"INSERT OR REPLACE INTO {TBL_SYS} ({TBL_SYS_F_ID}, {TBL_SYS_F_ITEMVALUE}) VALUES (?, '0')", (TBL_SYS_V_IDX_SEARCH,))
+            self.__executeSqlWithoutReturn(f"UPDATE {TBL_SYS} SET {TBL_SYS_F_ITEMVALUE}=? WHERE {TBL_SYS_F_ID}=?", (DB_VERSION_4, TBL_SYS_V_IDX_VER))
+    def __upgradeFromVersion4(self) -> None:
+        '''the values are tagged by their codec, the values saved before have no tag and are read as they are.
+        the notes are not compressed here, a note is compressed the next time it is saved, or by recompressNotes()'''
+        logging.info(f'upgrading database from version {DB_VERSION_4} to {DB_VERSION}')
+        self.__executeSqlWithoutReturn(f"UPDATE {TBL_SYS} SET {TBL_SYS_F_ITEMVALUE}=? WHERE {TBL_SYS_F_ID}=?", (DB_VERSION, TBL_SYS_V_IDX_VER))
+    def __createTableChunks(self) -> None:
+        '''create the table of the chunks of the notes'''
+        self.__executeSqlWithoutReturn(f""" CREATE TABLE IF NOT EXISTS {TBL_CHUNKS} (
+                                        {TBL_CHUNKS_F_ID} integer PRIMARY KEY,
+                                        {TBL_CHUNKS_F_TEXTID} integer NOT NULL,
+                                        {TBL_CHUNKS_F_SEQ} integer NOT NULL,
+                                        {TBL_CHUNKS_F_VALUE} blob NOT NULL
+                                    ); """)
+    def __createTableImports(self) -> None:
+        '''create the table of the paths imported if it does not exist yet'''
+        self.__executeSqlWithoutReturn(f""" CREATE TABLE IF NOT EXISTS {TBL_IMPORTS} (
+                                        {TBL_IMPORTS_F_PATH} blob PRIMARY KEY,
+                                        {TBL_IMPORTS_F_FOLDERID} integer NOT NULL
+                                    ) WITHOUT ROWID; """)
+    def __createTableSearch(self) -> None:
+        '''create the table of the search index, a word is looked up by the primary key'''
+        self.__executeSqlWithoutReturn(f""" CREATE TABLE IF NOT EXISTS {TBL_SEARCH} (
+                                        {TBL_SEARCH_F_TOKEN} blob NOT NULL,
+                                        {TBL_SEARCH_F_KIND} integer NOT NULL,
+                                        {TBL_SEARCH_F_OWNERID} integer NOT NULL,
+                                        PRIMARY KEY ({TBL_SEARCH_F_TOKEN}, {TBL_SEARCH_F_KIND}, {TBL_SEARCH_F_OWNERID})
+                                    ) WITHOUT ROWID; """)
+    def createDatabase(self, filename, passwd, journalMode:str=None, synchronous:str=None) -> bool:
         '''create a new database
+        journalMode, synchronous: see openDatabase()
         return True if successful, otherwise False'''
-        if None != self.dbConn:
-            self.dbConn.close()
-            self.dbConn = None
+        self.closeDatabase()
         try:
             #when a new instance is implemented, all tables will be created if not exist
-            self.dbConn = sqlite3.connect(filename)
+            self.__connect(filename, journalMode, synchronous)
             sqlCreateTableFolders = f""" CREATE TABLE IF NOT EXISTS {TBL_FOLDERS} (
                                         {TBL_FOLDERS_F_ID} integer PRIMARY KEY,
-                                        {TBL_FOLDERS_F_NAME} text NOT NULL,
+                                        {TBL_FOLDERS_F_NAME} blob NOT NULL,
                                         {TBL_FOLDERS_F_PARENTID} integer NOT NULL
                                     ); """
             sqlCreateTableTexts = f""" CREATE TABLE IF NOT EXISTS {TBL_TEXT} (
                                         {TBL_TEXT_F_ID} integer PRIMARY KEY,
-                                        {TBL_TEXT_F_VALUE} text NOT NULL,
+                                        {TBL_TEXT_F_VALUE} blob NOT NULL,
                                         {TBL_TEXT_F_FOLDERID} integer NOT NULL,
                                         {TBL_TEXT_F_DATE_C} text,
                                         {TBL_TEXT_F_DATE_E} text
@@ -99,16 +637,21 @@ class CiperDatabase():
                                     ); """
             #insert sample text record if not exists
             self.aes = ECP.AESCipher(passwd)
-            sqlCreateSampleText = f"""INSERT INTO {TBL_SYS} ( {TBL_SYS_F_ID}, {TBL_SYS_F_ITEMVALUE} ) 
-                                SELECT {TBL_SYS_V_IDX_SAMPLE}, \"{self.aes.encrypt(SAMPLE_TEXT)}\"
-                                WHERE NOT EXISTS (SELECT * FROM {TBL_SYS} WHERE {TBL_SYS_F_ID}={TBL_SYS_V_IDX_SAMPLE});"""
-            print(sqlCreateSampleText)
-            sqlCreateVersion = f"""INSERT INTO {TBL_SYS} ( {TBL_SYS_F_ID}, {TBL_SYS_F_ITEMVALUE} ) 
-                                SELECT {TBL_SYS_V_IDX_VER}, \"{DB_VERSION}\"
-                                WHERE NOT EXISTS (SELECT * FROM {TBL_SYS} WHERE {TBL_SYS_F_ID}={TBL_SYS_V_IDX_VER});"""
-            for sql in [sqlCreateTableFolders, sqlCreateTableTexts, sqlCreateTableSys, sqlCreateSampleText, sqlCreateVersion]:
-                self.__executeSqlWithoutReturn(sql)
-        except Error as e:
+            self.searchKey = searchKeyOf(self.aes)
+            sqlCreateSysItem = f"""INSERT INTO {TBL_SYS} ( {TBL_SYS_F_ID}, {TBL_SYS_F_ITEMVALUE} ) 
+                                SELECT ?, ?
+                                WHERE NOT EXISTS (SELECT * FROM {TBL_SYS} WHERE {TBL_SYS_F_ID}=?);"""
+            with self.batch():
+                for sql in [sqlCreateTableFolders, sqlCreateTableTexts, sqlCreateTableSys]:
+                    self.__executeSqlWithoutReturn(sql)
+                self.__createTableChunks()
+                self.__createTableSearch()
+                self.__createIndexes()
+                self.__executeSqlWithoutReturn(sqlCreateSysItem, (TBL_SYS_V_IDX_SAMPLE, self.aes.encryptRaw(SAMPLE_TEXT), TBL_SYS_V_IDX_SAMPLE))
+                self.__executeSqlWithoutReturn(sqlCreateSysItem, (TBL_SYS_V_IDX_VER, DB_VERSION, TBL_SYS_V_IDX_VER))
+                self.__executeSqlWithoutReturn(sqlCreateSysItem, (TBL_SYS_V_IDX_SEARCH, '1', TBL_SYS_V_IDX_SEARCH)) #nothing to index yet
+            self.__upgradeDatabase() #in case an existing database of an older version was selected
+        except sqlite3.Error as e:
             logging.critical(e)
             return False
         
@@ -120,134 +663,862 @@ class CiperDatabase():
         #set user inputed password for decrypting, verify it
         #return True if the password is correct, otherwise return False
         
-        data = self.__executeSqlWithFetchall(f'SELECT {TBL_SYS_F_ITEMVALUE} FROM {TBL_SYS} WHERE {TBL_SYS_F_ID}={TBL_SYS_V_IDX_SAMPLE}')
+        data = self.__executeSqlWithFetchall(f'SELECT {TBL_SYS_F_ITEMVALUE} FROM {TBL_SYS} WHERE {TBL_SYS_F_ID}=?', (TBL_SYS_V_IDX_SAMPLE,))
         if len(data) != 1:
             logging.critical('SYSTEM PANIC: password table wrong')
             return False
-        sampleTextEncrypted = str(data[0][0])
+        sampleTextEncrypted = data[0][0]
         try:
             aes = ECP.AESCipher(passwd)
-            if aes.decrypt(sampleTextEncrypted) != SAMPLE_TEXT:
+            if aes.decryptRaw(sampleTextEncrypted) != SAMPLE_TEXT:
                 return False
             self.passwdVerified = True
             self.aes = aes
+            self.searchKey = searchKeyOf(aes)
             return True
         except:
             logging.critical(f'ERROR decrypting sample text, cipher text = {sampleTextEncrypted}')
             return False
         
-    def __executeSqlWithoutReturn(self, sql:str) -> None:
-        '''execute a sql which insert new data or update a record in a table, commit() will be called after the execution of the sql'''
-        cursor = self.dbConn.cursor()
-        cursor.execute(sql)
-        self.dbConn.commit()
-    def __executeSqlWithFetchall(self, sql:str) -> list:
+    def __executeSqlWithoutReturn(self, sql:str, params:tuple=()) -> None:
+        '''execute a sql which insert new data or update a record in a table, commit() will be called after the execution of the sql
+        unless it is done inside a batch() block
+        params: values bound to the placeholders of the sql, the sql itself must not contain any value'''
+        self.dbCursor.execute(sql, params)
+        if not self.batchDepth:
+            self.dbConn.commit()
+    def __executeManySqlWithoutReturn(self, sql:str, paramsList) -> None:
+        '''same as __executeSqlWithoutReturn(), the sql is executed once for each params of paramsList'''
+        self.dbCursor.executemany(sql, paramsList)
+        if not self.batchDepth:
+            self.dbConn.commit()
+    def __executeSqlWithFetchall(self, sql:str, params:tuple=()) -> list:
         '''execute a sql which reads data from database, return the result by fetchall()'''
-        cursor = self.dbConn.cursor()
-        cursor.execute(sql)
-        return cursor.fetchall()
+        self.dbCursor.execute(sql, params)
+        return self.dbCursor.fetchall()
     def insertFolders(self, foldername:str, parentid:int) -> int:
         '''insert a new record into the table folders, return the unique folderid'''
         if not self.aes:
             return
         folderid = getUniqueId()
-        foldername = self.aes.encrypt(foldername)
-        sql = f"INSERT INTO {TBL_FOLDERS} ({TBL_FOLDERS_F_ID}, {TBL_FOLDERS_F_NAME}, {TBL_FOLDERS_F_PARENTID}) VALUES ({folderid}, \"{foldername}\", {parentid});"
-        self.__executeSqlWithoutReturn( sql )
+        hashes = tokenHashes(self.searchKey, foldername)
+        cipherName = self.aes.encryptRaw(foldername)
+        sql = f"INSERT INTO {TBL_FOLDERS} ({TBL_FOLDERS_F_ID}, {TBL_FOLDERS_F_NAME}, {TBL_FOLDERS_F_PARENTID}) VALUES (?, ?, ?);"
+        with self.batch():
+            self.__executeSqlWithoutReturn( sql, (folderid, cipherName, parentid) )
+            self.__insertSearchTokens(SEARCH_KIND_FOLDER, [folderid], [hashes])
+        if self.folderIndex != None:
+            self.folderIndex.add(folderid, int(parentid), cipherName, foldername)
         return folderid
+    def insertManyFolders(self, folders:list) -> None:
+        '''insert folders whose ids are given, e.g. by an import, folders: [(folderid, name, parentid), ...].
+        the names are encrypted in one batch'''
+        if not self.aes:
+            return
+        cipherNames = self.aes.encryptManyRaw([name for _, name, _ in folders])
+        sql = f"INSERT INTO {TBL_FOLDERS} ({TBL_FOLDERS_F_ID}, {TBL_FOLDERS_F_NAME}, {TBL_FOLDERS_F_PARENTID}) VALUES (?, ?, ?);"
+        with self.batch():
+            self.__executeManySqlWithoutReturn(sql, [(folderid, cipherName, parentid) for (folderid, _, parentid), cipherName in zip(folders, cipherNames)])
+            self.__insertSearchTokens(SEARCH_KIND_FOLDER, [folderid for folderid, _, _ in folders], [tokenHashes(self.searchKey, name) for _, name, _ in folders])
+        if self.folderIndex != None:
+            for (folderid, name, parentid), cipherName in zip(folders, cipherNames):
+                self.folderIndex.add(folderid, parentid, cipherName, name)
     def readTableFolders(self, parentId:int=ID_ROOT) -> list:
         '''read records from table folders whose parentid is given by parameter parentId'''
-        records = self.__executeSqlWithFetchall( f"SELECT {TBL_FOLDERS_F_ID},{TBL_FOLDERS_F_NAME},{TBL_FOLDERS_F_PARENTID} FROM {TBL_FOLDERS} WHERE {TBL_FOLDERS_F_PARENTID}={parentId}" )
-        ret = []
-        for record in records:
-            ret.append([record[0], self.aes.decrypt(str(record[1])), record[2]])
+        records = self.__executeSqlWithFetchall( f"SELECT {TBL_FOLDERS_F_ID},{TBL_FOLDERS_F_NAME},{TBL_FOLDERS_F_PARENTID} FROM {TBL_FOLDERS} WHERE {TBL_FOLDERS_F_PARENTID}=?", (parentId,) )
+        names = self.aes.decryptManyRaw([record[1] for record in records])
+        ret = [[record[0], name, record[2]] for record, name in zip(records, names)]
         logging.debug(f'{len(ret)} records read from table {TBL_FOLDERS_F_ID}.')
         #return sorted(ret, key=OPT.itemgetter(1))
         ret.sort(key = lambda x:x[1])   #sort the records by foldername in ascending order
         return ret
-    
+
+    def readTableFoldersWithChildFlag(self, parentId:int=ID_ROOT) -> list:
+        '''same as readTableFolders(), a flag telling weather the folder has children is appended to each record
+        used for loading the tree widget on demand, the children themselves are not read'''
+        records = self.__executeSqlWithFetchall( f"""SELECT f.{TBL_FOLDERS_F_ID},f.{TBL_FOLDERS_F_NAME},f.{TBL_FOLDERS_F_PARENTID},
+            EXISTS (SELECT 1 FROM {TBL_FOLDERS} c WHERE c.{TBL_FOLDERS_F_PARENTID}=f.{TBL_FOLDERS_F_ID})
+            FROM {TBL_FOLDERS} f WHERE f.{TBL_FOLDERS_F_PARENTID}=?""", (parentId,) )
+        names = self.aes.decryptManyRaw([record[1] for record in records])
+        ret = [[record[0], name, record[2], bool(record[3])] for record, name in zip(records, names)]
+        logging.debug(f'{len(ret)} records read from table {TBL_FOLDERS}.')
+        ret.sort(key = lambda x:x[1])
+        return ret
+
+    def readFolderTree(self) -> dict:
+        '''read the whole table folders with a single query
+        return a dict which maps a parentid to the list of its children [folderid, foldername, parentid],
+        the children are sorted by foldername in ascending order like readTableFolders()'''
+        records = self.__executeSqlWithFetchall( f"SELECT {TBL_FOLDERS_F_ID},{TBL_FOLDERS_F_NAME},{TBL_FOLDERS_F_PARENTID} FROM {TBL_FOLDERS}" )
+        #decrypt all the names in one pass before building the adjacency lists
+        names = self.aes.decryptManyRaw([record[1] for record in records])
+        tree = {}
+        for record, name in zip(records, names):
+            tree.setdefault(record[2], []).append([record[0], name, record[2]])
+        for children in tree.values():
+            children.sort(key = lambda x:x[1])
+        logging.debug(f'{len(records)} records read from table {TBL_FOLDERS}.')
+        self.folderIndex = FolderIndex(records, names) #every name is decrypted already
+        return tree
+
+    def __folders(self) -> FolderIndex:
+        '''the folder index, all the folders are read by one query the first time, the names are not decrypted'''
+        if self.folderIndex == None:
+            records = self.__executeSqlWithFetchall( f"SELECT {TBL_FOLDERS_F_ID},{TBL_FOLDERS_F_NAME},{TBL_FOLDERS_F_PARENTID} FROM {TBL_FOLDERS}" )
+            self.folderIndex = FolderIndex(records)
+        return self.folderIndex
+
+    def folderPath(self, folderid:int) -> list:
+        '''the folderids from a root folder to the folder, from the folder index'''
+        return self.__folders().path(int(folderid))
+
+    def folderName(self, folderid:int) -> str:
+        '''the name of a folder, decrypted once and kept in the folder index. None if there is no such folder'''
+        node = self.__folders().node(int(folderid))
+        if node == None:
+            return None
+        if node.name == None:
+            node.name = self.aes.decryptRaw(node.cipherName)
+        return node.name
+
+    def folderChildren(self, folderid:int) -> list:
+        '''the folderids of the children of a folder, ID_ROOT for the root folders, from the folder index'''
+        return self.__folders().children(int(folderid))
+
     def readTextByFolderid(self, folderid:int) -> list:
-        '''query table texts, read records whose folderid is given by the parameter folderid'''
-        records = self.__executeSqlWithFetchall( f"SELECT {TBL_TEXT_F_ID},{TBL_TEXT_F_VALUE},{TBL_TEXT_F_DATE_C},{TBL_TEXT_F_DATE_E} FROM {TBL_TEXT} WHERE {TBL_TEXT_F_FOLDERID}={folderid}" )
+        '''query table texts, read records whose folderid is given by the parameter folderid
+        the decrypted note is kept in the note cache for the next read'''
+        folderid = int(folderid)
+        note = self.noteCache.get(folderid)
+        if note != None:
+            return note
+        return self.__loadNote(folderid)
+
+    def __loadNote(self, folderid:int) -> tuple:
+        '''read and decrypt the note of the folder and put it into the note cache'''
+        header = self.__readTextHeader(folderid)
+        if header == None:
+            return ID_ROOT, '', '', ''
+        textid, legacyText, dateCreate, dateEdit = header
+        text = ''.join(self.__readTextChunks(textid)) if legacyText == None else legacyText
+        note = (textid, text, dateCreate, dateEdit)
+        self.noteCache.put(folderid, note)
+        return note
+
+    def __readTextHeader(self, folderid:int) -> tuple:
+        '''read the record of table texts of the folder, return [textid, text, dateCreate, dateEdit],
+        text is None if the note is saved in chunks, it is the decrypted textval for the notes saved before version 3.0.
+        return None if more than one record is found'''
+        records = self.__executeSqlWithFetchall( f"SELECT {TBL_TEXT_F_ID},{TBL_TEXT_F_VALUE},{TBL_TEXT_F_DATE_C},{TBL_TEXT_F_DATE_E} FROM {TBL_TEXT} WHERE {TBL_TEXT_F_FOLDERID}=?", (folderid,) )
         if len(records) > 1:
             logging.critical(f'ERROR: {len(records)} records of text found for folderid {folderid}')
-            return ID_ROOT, '', '', ''
+            return None
         elif len(records) != 1:
             return ID_ROOT, '', '', ''
-        return (records[0][0], self.aes.decrypt(str(records[0][1])), records[0][2], records[0][3])
+        textid, value, dateCreate, dateEdit = records[0]
+        return textid, (notecodec.decode(self.aes, value) if len(value) > 0 else None), dateCreate, dateEdit
+
+    def __readTextChunks(self, textid:int):
+        '''generator, yield the decrypted chunks of a note in order, CHUNK_READ_ROWS chunks are read by a query.
+        once all of them are read, their ids and digests are kept in chunkStates for the next save'''
+        sql = f"""SELECT {TBL_CHUNKS_F_ID},{TBL_CHUNKS_F_SEQ},{TBL_CHUNKS_F_VALUE} FROM {TBL_CHUNKS}
+            WHERE {TBL_CHUNKS_F_TEXTID}=? AND {TBL_CHUNKS_F_SEQ}>? ORDER BY {TBL_CHUNKS_F_SEQ} LIMIT ?"""
+        state, seq = [], -1
+        while True:
+            records = self.__executeSqlWithFetchall(sql, (textid, seq, CHUNK_READ_ROWS))
+            if not records:
+                break
+            chunks = notecodec.decodeMany(self.aes, [record[2] for record in records])
+            state += [(record[0], chunkDigest(chunk), utf16Length(chunk)) for record, chunk in zip(records, chunks)]
+            seq = records[-1][1]
+            yield from chunks
+        self.chunkStates[textid] = state
+
+    def streamTextByFolderid(self, folderid:int, cache:bool=True):
+        '''generator for loading a note progressively, yield (textid, dateCreate, dateEdit) first,
+        then the text of the note in one or more str. the note is cached once all of its chunks are read,
+        unless cache is False, e.g. for an export, the chunks are not kept in memory then'''
+        folderid = int(folderid)
+        note = self.noteCache.get(folderid)
+        if note == None:
+            header = self.__readTextHeader(folderid)
+            if header == None:
+                yield ID_ROOT, '', ''
+                return
+            textid, legacyText, dateCreate, dateEdit = header
+            if legacyText == None:
+                yield textid, dateCreate, dateEdit
+                chunks = []
+                for chunk in self.__readTextChunks(textid):
+                    if cache:
+                        chunks.append(chunk)
+                    yield chunk
+                if cache:
+                    self.noteCache.put(folderid, (textid, ''.join(chunks), dateCreate, dateEdit))
+                return
+            note = (textid, legacyText, dateCreate, dateEdit)
+            if cache:
+                self.noteCache.put(folderid, note)
+        textid, text, dateCreate, dateEdit = note
+        yield textid, dateCreate, dateEdit
+        yield text
+
+    def prefetchNotes(self, folderids:list, parentid:int=None, budget:int=DEFAULT_PREFETCH_BUDGET, cancelled=None) -> int:
+        '''read and decrypt notes into the note cache in advance, so that the next readTextByFolderid() of them is a hit
+        folderids: the folders to prefetch first, e.g. the siblings of the selected folder
+        parentid: then the children of this folder are prefetched
+        budget: maximum number of notes read from the database
+        cancelled: called before each note, the prefetch stops if it returns True, e.g. the selection moved
+        return the number of notes read'''
+        folderids = [int(folderid) for folderid in folderids]
+        if parentid != None and budget > len(folderids):
+            records = self.__executeSqlWithFetchall(f"SELECT {TBL_FOLDERS_F_ID} FROM {TBL_FOLDERS} WHERE {TBL_FOLDERS_F_PARENTID}=?", (parentid,))
+            folderids += [record[0] for record in records]
+        count = 0
+        for folderid in folderids:
+            if count >= budget or (cancelled and cancelled()):
+                break
+            if folderid not in self.noteCache:
+                self.__loadNote(folderid)
+                count += 1
+        return count
+
+    def cacheStats(self) -> dict:
+        '''counters of the note cache: notes, bytes, hits, misses, evictions'''
+        return self.noteCache.stats()
+
+    def searchNotes(self, query:str) -> list:
+        '''find the folders whose name or note holds all the words of the query, by the search index only,
+        no note is decrypted. the index is built first if it is not, e.g. the database was upgraded.
+        return the paths of the folders found, a path is the list of folderids from a root folder to the folder found'''
+        hashes = tokenHashes(self.searchKey, query)
+        if not hashes:
+            return []
+        if self.__executeSqlWithFetchall(f'SELECT {TBL_SYS_F_ITEMVALUE} FROM {TBL_SYS} WHERE {TBL_SYS_F_ID}=?', (TBL_SYS_V_IDX_SEARCH,)) != [('1',)]:
+            self.rebuildSearchIndex()
+        #the folders of the rarest word are found first, then each of them is checked for the other words
+        sqlCount = f"SELECT count(*) FROM (SELECT 1 FROM {TBL_SEARCH} WHERE {TBL_SEARCH_F_TOKEN}=? LIMIT {SEARCH_RANK_LIMIT})"
+        ranked = sorted(hashes, key=lambda token: self.__executeSqlWithFetchall(sqlCount, (token,))[0][0])
+        sqlFind = f"""SELECT {TBL_SEARCH_F_OWNERID} FROM {TBL_SEARCH} WHERE {TBL_SEARCH_F_TOKEN}=?1 AND {TBL_SEARCH_F_KIND}={SEARCH_KIND_FOLDER}
+            UNION SELECT t.{TBL_TEXT_F_FOLDERID} FROM {TBL_SEARCH} s JOIN {TBL_TEXT} t ON t.{TBL_TEXT_F_ID}=s.{TBL_SEARCH_F_OWNERID}
+                WHERE s.{TBL_SEARCH_F_TOKEN}=?1 AND s.{TBL_SEARCH_F_KIND}={SEARCH_KIND_TEXT}
+            UNION SELECT t.{TBL_TEXT_F_FOLDERID} FROM {TBL_SEARCH} s JOIN {TBL_CHUNKS} c ON c.{TBL_CHUNKS_F_ID}=s.{TBL_SEARCH_F_OWNERID}
+                JOIN {TBL_TEXT} t ON t.{TBL_TEXT_F_ID}=c.{TBL_CHUNKS_F_TEXTID} WHERE s.{TBL_SEARCH_F_TOKEN}=?1 AND s.{TBL_SEARCH_F_KIND}={SEARCH_KIND_CHUNK}"""
+        sqlCheck = f"""SELECT EXISTS (SELECT 1 FROM {TBL_SEARCH} WHERE {TBL_SEARCH_F_TOKEN}=?1 AND {TBL_SEARCH_F_KIND}={SEARCH_KIND_FOLDER} AND {TBL_SEARCH_F_OWNERID}=?2)
+            OR EXISTS (SELECT 1 FROM {TBL_SEARCH} WHERE {TBL_SEARCH_F_TOKEN}=?1 AND {TBL_SEARCH_F_KIND}={SEARCH_KIND_TEXT} AND {TBL_SEARCH_F_OWNERID} IN
+                (SELECT {TBL_TEXT_F_ID} FROM {TBL_TEXT} WHERE {TBL_TEXT_F_FOLDERID}=?2))
+            OR EXISTS (SELECT 1 FROM {TBL_SEARCH} WHERE {TBL_SEARCH_F_TOKEN}=?1 AND {TBL_SEARCH_F_KIND}={SEARCH_KIND_CHUNK} AND {TBL_SEARCH_F_OWNERID} IN
+                (SELECT {TBL_CHUNKS_F_ID} FROM {TBL_CHUNKS} WHERE {TBL_CHUNKS_F_TEXTID} IN (SELECT {TBL_TEXT_F_ID} FROM {TBL_TEXT} WHERE {TBL_TEXT_F_FOLDERID}=?2)))"""
+        folderids = {record[0] for record in self.__executeSqlWithFetchall(sqlFind, (ranked[0],))}
+        for token in ranked[1:]:
+            folderids = {folderid for folderid in folderids if self.__executeSqlWithFetchall(sqlCheck, (token, folderid))[0][0]}
+        logging.debug(f'{len(folderids)} folders found for {len(hashes)} words')
+        return [self.folderPath(folderid) for folderid in sorted(folderids)]
+
+    def scanNotes(self, query:str, regex:bool=False, workers:int=1, cancelled=None):
+        '''generator, find the folders whose name or note matches the query by decrypting all of them,
+        for the queries the search index cannot answer, e.g. a part of a word or a regular expression.
+        the database is read in batches of about SCAN_BATCH_BYTES, which are decrypted and matched by a pool of
+        so many worker processes if workers is more than 1, up to 2 batches per worker are in flight.
+        the pool is kept for the next scans, see __scanPool().
+        query: a substring, case insensitive, or a regular expression if regex is True, re.error is raised if it is invalid
+        cancelled: called after each batch, the scan stops if it returns True, e.g. another search is started
+        yield for each batch the list of the paths of the folders it found, see searchNotes(), often an empty one,
+        so that a caller running the generator step by step, e.g. DatabaseService, gets back control between batches'''
+        pattern = re.compile(query, re.IGNORECASE | re.MULTILINE) if regex else query.lower()
+        executor = self.__scanPool(workers) if workers > 1 else None
+        seen = set() #a folder may match by its name and by its note
+        try:
+            for folderids in self.__scanBatches(pattern, executor, workers):
+                if cancelled and cancelled():
+                    logging.info('scan cancelled')
+                    return
+                paths = [self.folderPath(folderid) for folderid in folderids if folderid not in seen]
+                seen.update(folderids)
+                yield paths
+        except Exception:
+            self.__closeScanPool() #e.g. a worker process died, the next scan starts a new pool
+            raise
+
+    def __scanPool(self, workers:int) -> Executor:
+        '''the process pool of scanNotes(), created by the first scan and kept while the workers and the password
+        are the same. Its processes are spawned, as a fork of the threads of the GUI process, e.g. of DatabaseService,
+        may deadlock in the child on a lock held by another thread, and spawning them for each scan would be slow'''
+        if self.scanPool != None and self.scanPoolKey == (workers, self.aes):
+            return self.scanPool
+        self.__closeScanPool()
+        import multiprocessing
+        self.scanPool = concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(POOL_START_METHOD),
+            initializer=initScanWorker, initargs=(self.aes,))
+        self.scanPoolKey = (workers, self.aes)
+        return self.scanPool
+
+    def __closeScanPool(self) -> None:
+        '''stop the processes of the scan pool, if any'''
+        if self.scanPool != None:
+            self.scanPool.shutdown(cancel_futures=True)
+            self.scanPool, self.scanPoolKey = None, None
+
+    def __scanBatches(self, pattern, executor:Executor, workers:int):
+        '''generator which matches the batches given by __readScanItems(), yield the folderids found in each batch in order.
+        the batches still queued are cancelled if the generator is closed before the end'''
+        if executor == None:
+            for items in self.__readScanItems():
+                yield scanMatches(self.aes, pattern, items)
+            return
+        pending = deque()
+        try:
+            for items in self.__readScanItems():
+                pending.append(executor.submit(scanValues, pattern, items))
+                if len(pending) > 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def __readScanItems(self):
+        '''generator for scanNotes(), yield lists of (folderid, [cipher texts]) of about SCAN_BATCH_BYTES,
+        the folder names first, then the notes, the chunks of a note are in order and never split between lists'''
+        items, size = [], 0
+        for folderid, name in self.dbConn.execute(f"SELECT {TBL_FOLDERS_F_ID},{TBL_FOLDERS_F_NAME} FROM {TBL_FOLDERS}"):
+            items.append((folderid, [name]))
+            size += len(name)
+            if size >= SCAN_BATCH_BYTES:
+                yield items
+                items, size = [], 0
+        sql = f"""SELECT t.{TBL_TEXT_F_ID},t.{TBL_TEXT_F_FOLDERID},t.{TBL_TEXT_F_VALUE},c.{TBL_CHUNKS_F_VALUE} FROM {TBL_TEXT} t
+            LEFT JOIN {TBL_CHUNKS} c ON c.{TBL_CHUNKS_F_TEXTID}=t.{TBL_TEXT_F_ID} ORDER BY t.{TBL_TEXT_F_ID},c.{TBL_CHUNKS_F_SEQ}"""
+        lastTextid = None
+        for textid, folderid, textval, chunkval in self.dbConn.execute(sql):
+            if textid != lastTextid:
+                if size >= SCAN_BATCH_BYTES:
+                    yield items
+                    items, size = [], 0
+                items.append((folderid, []))
+                lastTextid = textid
+            value = textval if len(textval) > 0 else chunkval #textval of a note saved before version 3.0
+            if value != None:
+                items[-1][1].append(value)
+                size += len(value)
+        if items:
+            yield items
+
+    def rebuildSearchIndex(self) -> None:
+        '''decrypt every folder name and note and index their words again, in one transaction'''
+        logging.info('building the search index')
+        with self.batch():
+            self.__executeSqlWithoutReturn(f"DELETE FROM {TBL_SEARCH}")
+            for table, idField, valueField, kind in ENCRYPTED_COLUMNS:
+                for records in self.__readChunks(table, idField, valueField):
+                    texts = notecodec.decodeMany(self.aes, [record[1] for record in records])
+                    self.__insertSearchTokens(kind, [record[0] for record in records], [tokenHashes(self.searchKey, text) for text in texts])
+            self.__executeSqlWithoutReturn(f"INSERT OR REPLACE INTO {TBL_SYS} ({TBL_SYS_F_ID}, {TBL_SYS_F_ITEMVALUE}) VALUES (?, '1')", (TBL_SYS_V_IDX_SEARCH,))
         
-    def insertTexts(self, textname:str, folderid:int) -> int:
-        '''insert a new record into the table texts, return the unique textid'''
+    def insertTexts(self, textname:str, folderid:int, textid:int=None) -> int:
+        '''insert a new record into the table texts, return the unique textid.
+        textid: given by the caller when it must know the id before the insert is done, generated if None'''
         if not self.aes:
             return
-        textid = getUniqueId()
+        textid = getUniqueId() if textid == None else int(textid)
         nowstr = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        textname = self.aes.encrypt(textname)
         sql = f"""INSERT INTO {TBL_TEXT} ({TBL_TEXT_F_ID},{TBL_TEXT_F_VALUE},{TBL_TEXT_F_FOLDERID},{TBL_TEXT_F_DATE_C},{TBL_TEXT_F_DATE_E})
-            VALUES ({textid},\"{textname}\",{folderid},\"{nowstr}\",\"{nowstr}\"); """
-        self.__executeSqlWithoutReturn( sql )
+            VALUES (?,?,?,?,?); """
+        with self.batch():
+            self.__executeSqlWithoutReturn( sql, (textid, b'', folderid, nowstr, nowstr) ) #the text is saved in chunks
+            self.__writeTextChunks(textid, textname)
+        self.noteCache.put(int(folderid), (textid, textname, nowstr, nowstr))
+        return textid
+    def importNote(self, folderid:int, pieces, dateCreate:str, dateEdit:str) -> int:
+        '''insert the note of a folder which has none, e.g. read from an archive, with the dates given.
+        pieces: iterable of str whose concatenation is the text, they are split, encrypted and written as they come,
+        so that a note of any size is imported in bounded memory. return the textid'''
+        if not self.aes:
+            return
+        textid = getUniqueId()
+        sql = f"""INSERT INTO {TBL_TEXT} ({TBL_TEXT_F_ID},{TBL_TEXT_F_VALUE},{TBL_TEXT_F_FOLDERID},{TBL_TEXT_F_DATE_C},{TBL_TEXT_F_DATE_E})
+            VALUES (?,?,?,?,?); """
+        with self.batch():
+            self.__executeSqlWithoutReturn( sql, (textid, b'', folderid, dateCreate, dateEdit) )
+            #the last chunk may go on in the next piece, so it is split again with it
+            seq, rest = 0, ''
+            for piece in pieces:
+                chunks = splitText(rest + piece)
+                if len(chunks) > 1:
+                    self.__writeChunkRange(textid, [], seq, chunks[:-1])
+                    seq += len(chunks) - 1
+                rest = chunks[-1] if chunks else ''
+            if rest:
+                self.__writeChunkRange(textid, [], seq, [rest])
         return textid
     def updateTextsTextByTextid(self, textid:int, text:str) -> None:
-        '''update the text of a record of table texts by textid'''
-        encText = self.aes.encrypt(text)
+        '''update the text of a record of table texts by textid, only the chunks changed are encrypted and written'''
+        textid = int(textid)
         nowstr = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        sql = f'UPDATE {TBL_TEXT} SET {TBL_TEXT_F_VALUE}=\"{encText}\",{TBL_TEXT_F_DATE_E}=\"{nowstr}\"  WHERE {TBL_TEXT_F_ID}={textid}'
-        self.__executeSqlWithoutReturn( sql )
+        sql = f'UPDATE {TBL_TEXT} SET {TBL_TEXT_F_VALUE}=?,{TBL_TEXT_F_DATE_E}=?  WHERE {TBL_TEXT_F_ID}=?'
+        with self.batch():
+            self.__writeTextChunks(textid, text)
+            self.__executeSqlWithoutReturn( sql, (b'', nowstr, textid) ) #textval of a note saved before version 3.0 is emptied
+            self.__deleteSearchTokens(SEARCH_KIND_TEXT, [textid])
+        self.noteCache.updateText(textid, text, nowstr)
+    def updateTextRanges(self, textid:int, edits:list) -> bool:
+        '''update a note by replacing ranges of the text saved, see applyEdits() for edits.
+        only the chunks overlapping the edits are decrypted, split again, encrypted and written.
+        the whole note is read if its chunks are unknown, e.g. a note saved before version 3.0
+        return False if the edits change nothing, nothing is written then'''
+        textid = int(textid)
+        state = self.chunkStates.get(textid)
+        if state == None:
+            text = self.noteCache.textOf(textid)
+            if text == None:
+                text = self.__readTextByTextid(textid)
+            newText = applyEdits(text, edits)
+            if newText == text:
+                return False
+            self.updateTextsTextByTextid(textid, newText)
+            return True
+        #group the edits by the chunks holding them, a group is [first chunk, last chunk, edits]
+        starts = list(accumulate([length for _, _, length in state], initial=0))
+        groups = []
+        for edit in edits:
+            first = max(min(bisect_right(starts, edit[0]) - 1, len(state) - 1), 0)
+            last = max(min(bisect_left(starts, edit[1]) - 1, len(state) - 1), first)
+            if groups and first <= groups[-1][1]:
+                groups[-1][1] = max(groups[-1][1], last)
+                groups[-1][2].append(edit)
+            else:
+                groups.append([first, last, [edit]])
+        state = list(state)
+        changed = False
+        nowstr = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.batch():
+            #from the end of the note, so that the chunks before a group keep their positions
+            for first, last, groupEdits in reversed(groups):
+                changed = self.__updateChunkRange(textid, state, starts[first], first, last, groupEdits) or changed
+            if not changed:
+                return False
+            self.chunkStates[textid] = state
+            self.__executeSqlWithoutReturn(f'UPDATE {TBL_TEXT} SET {TBL_TEXT_F_DATE_E}=? WHERE {TBL_TEXT_F_ID}=?', (nowstr, textid))
+        text = self.noteCache.textOf(textid)
+        if text != None:
+            self.noteCache.updateText(textid, applyEdits(text, edits), nowstr)
+        return True
+    def __updateChunkRange(self, textid:int, state:list, regionStart:int, first:int, last:int, edits:list) -> bool:
+        '''apply the edits to the chunks first to last of a note, whose text starts at the position regionStart.
+        the chunks are split again and written, state is updated. return False if the edits change nothing'''
+        region = state[first:last + 1]
+        sql = f"SELECT {TBL_CHUNKS_F_VALUE} FROM {TBL_CHUNKS} WHERE {TBL_CHUNKS_F_ID}=?"
+        values = [self.__executeSqlWithFetchall(sql, (chunkid,))[0][0] for chunkid, _, _ in region]
+        regionText = ''.join(notecodec.decodeMany(self.aes, values))
+        newRegionText = applyEdits(regionText, [(start - regionStart, end - regionStart, text) for start, end, text in edits])
+        if newRegionText == regionText:
+            return False
+        chunks = splitText(newRegionText)
+        #the chunks after the region are moved first, so that their positions do not collide with the new ones
+        self.__executeSqlWithoutReturn(f"UPDATE {TBL_CHUNKS} SET {TBL_CHUNKS_F_SEQ}={TBL_CHUNKS_F_SEQ}+? WHERE {TBL_CHUNKS_F_TEXTID}=? AND {TBL_CHUNKS_F_SEQ}>?",
+            (len(chunks) - len(region), textid, last))
+        state[first:last + 1] = self.__writeChunkRange(textid, region, first, chunks)
+        return True
+    def __readTextByTextid(self, textid:int) -> str:
+        '''read and decrypt the whole text of a note by its textid'''
+        records = self.__executeSqlWithFetchall(f"SELECT {TBL_TEXT_F_VALUE} FROM {TBL_TEXT} WHERE {TBL_TEXT_F_ID}=?", (textid,))
+        if len(records[0][0]) > 0:
+            return notecodec.decode(self.aes, records[0][0])
+        return ''.join(self.__readTextChunks(textid))
+    def __writeTextChunks(self, textid:int, text:str) -> None:
+        '''split the text into chunks and save them, the chunks whose text is unchanged are kept and moved if needed.
+        if the chunks saved are unknown, i.e. the note was not read since the database was opened, all of them are rewritten'''
+        oldState = self.chunkStates.get(textid)
+        if oldState == None:
+            self.__executeSqlWithoutReturn(f"""DELETE FROM {TBL_SEARCH} WHERE {TBL_SEARCH_F_KIND}={SEARCH_KIND_CHUNK} AND {TBL_SEARCH_F_OWNERID} IN
+                (SELECT {TBL_CHUNKS_F_ID} FROM {TBL_CHUNKS} WHERE {TBL_CHUNKS_F_TEXTID}=?)""", (textid,))
+            self.__executeSqlWithoutReturn(f"DELETE FROM {TBL_CHUNKS} WHERE {TBL_CHUNKS_F_TEXTID}=?", (textid,))
+            oldState = []
+        self.chunkStates[textid] = self.__writeChunkRange(textid, oldState, 0, splitText(text))
+    def __writeChunkRange(self, textid:int, oldState:list, firstSeq:int, chunks:list) -> list:
+        '''replace the chunks of oldState, which are numbered from firstSeq, by the chunks given,
+        the old chunks with the same text are reused. return the state of the new chunks'''
+        unused = {} #digest: chunks saved which may be reused, [[chunkid, seq], ...]
+        for seq, (chunkid, digest, _) in enumerate(oldState, firstSeq):
+            unused.setdefault(digest, deque()).append((chunkid, seq))
+        state, moved, inserted = [], [], []
+        for seq, chunk in enumerate(chunks, firstSeq):
+            digest = chunkDigest(chunk)
+            if unused.get(digest):
+                chunkid, oldSeq = unused[digest].popleft()
+                if oldSeq != seq:
+                    moved.append((seq, chunkid))
+            else:
+                chunkid = getUniqueId()
+                inserted.append((chunkid, seq, chunk))
+            state.append((chunkid, digest, utf16Length(chunk)))
+        deleted = [(chunkid,) for reusable in unused.values() for chunkid, _ in reusable]
+        logging.debug(f'text {textid}: {len(chunks)} chunks, {len(inserted)} written, {len(moved)} moved, {len(deleted)} deleted')
+        self.__executeManySqlWithoutReturn(f"DELETE FROM {TBL_CHUNKS} WHERE {TBL_CHUNKS_F_ID}=?", deleted)
+        self.__deleteSearchTokens(SEARCH_KIND_CHUNK, [chunkid for chunkid, in deleted])
+        self.__executeManySqlWithoutReturn(f"UPDATE {TBL_CHUNKS} SET {TBL_CHUNKS_F_SEQ}=? WHERE {TBL_CHUNKS_F_ID}=?", moved)
+        values = notecodec.encodeMany(self.aes, [chunk for _, _, chunk in inserted], self.compressed)
+        sql = f"INSERT INTO {TBL_CHUNKS} ({TBL_CHUNKS_F_ID},{TBL_CHUNKS_F_TEXTID},{TBL_CHUNKS_F_SEQ},{TBL_CHUNKS_F_VALUE}) VALUES (?,?,?,?)"
+        self.__executeManySqlWithoutReturn(sql, [(chunkid, textid, seq, value) for (chunkid, seq, _), value in zip(inserted, values)])
+        self.__insertSearchTokens(SEARCH_KIND_CHUNK, [chunkid for chunkid, _, _ in inserted], [tokenHashes(self.searchKey, chunk) for _, _, chunk in inserted])
+        return state
+    def __insertSearchTokens(self, kind:int, ownerids:list, hashes:list) -> None:
+        '''add the hashes of the words of the records to the search index, hashes: a set for each ownerid'''
+        sql = f"INSERT OR IGNORE INTO {TBL_SEARCH} ({TBL_SEARCH_F_TOKEN},{TBL_SEARCH_F_KIND},{TBL_SEARCH_F_OWNERID}) VALUES (?,?,?)"
+        self.__executeManySqlWithoutReturn(sql, [(token, kind, ownerid) for ownerid, tokens in zip(ownerids, hashes) for token in tokens])
+    def __deleteSearchTokens(self, kind:int, ownerids:list) -> None:
+        '''remove the words of the records from the search index'''
+        sql = f"DELETE FROM {TBL_SEARCH} WHERE {TBL_SEARCH_F_KIND}=? AND {TBL_SEARCH_F_OWNERID}=?"
+        self.__executeManySqlWithoutReturn(sql, [(kind, ownerid) for ownerid in ownerids])
         
     def updateTableFoldersParentidByFolderid(self, folderid:int, parentid:int) -> None:
         '''update the parentid of a record of table folders by folderid'''
-        self.__executeSqlWithoutReturn( f"UPDATE {TBL_FOLDERS} SET {TBL_FOLDERS_F_PARENTID}={parentid} WHERE {TBL_FOLDERS_F_ID}={folderid}")
+        self.__executeSqlWithoutReturn( f"UPDATE {TBL_FOLDERS} SET {TBL_FOLDERS_F_PARENTID}=? WHERE {TBL_FOLDERS_F_ID}=?", (parentid, folderid))
+        if self.folderIndex != None:
+            self.folderIndex.move(int(folderid), int(parentid))
+
+    def __topFolders(self, folderids:list) -> list:
+        '''the folders of the list which have no ancestor in the list, in the order given, unknown folders are dropped'''
+        folders = self.__folders()
+        selected = {int(folderid) for folderid in folderids}
+        return [folderid for folderid in dict.fromkeys(int(folderid) for folderid in folderids)
+            if folderid in folders and folderid != ID_ROOT and not selected.intersection(folders.path(folderid)[:-1])]
+
+    def moveSubtree(self, folderids:list, parentid:int) -> bool:
+        '''move the folders with their subtrees under the parent in one transaction, a folder whose ancestor is moved too
+        stays where it is in the moved subtree. A folder cannot be moved into its own subtree, the path of the parent,
+        cached by the folder index, is checked for the folders in O(depth).
+        return False if the move is rejected, nothing is moved then'''
+        folders = self.__folders()
+        parentid = int(parentid)
+        if parentid not in folders:
+            logging.warning(f'folder {parentid} not found, nothing moved')
+            return False
+        tops = self.__topFolders(folderids)
+        if set(folders.path(parentid)).intersection(tops):
+            logging.warning(f'folder {parentid} is in the subtree of the folders moved, nothing moved')
+            return False
+        with self.batch():
+            self.__executeManySqlWithoutReturn(f"UPDATE {TBL_FOLDERS} SET {TBL_FOLDERS_F_PARENTID}=? WHERE {TBL_FOLDERS_F_ID}=?",
+                [(parentid, folderid) for folderid in tops])
+        for folderid in tops:
+            folders.move(folderid, parentid)
+        return True
+
+    def copySubtree(self, folderids:list, parentid:int) -> dict:
+        '''copy the folders with their subtrees, notes and words in the search index under the parent in one transaction,
+        every record of the copies gets a new id. The cipher texts are copied by INSERT ... SELECT without being decrypted:
+        AESCipher encrypts in ECB mode, encrypting them again with the same key would give the same bytes.
+        the ids of the records to copy are read before any is written, so a folder may be copied into its own subtree.
+        return {folderid: folderid of the copy} for every folder copied, empty if the parent does not exist'''
+        folders = self.__folders()
+        parentid = int(parentid)
+        if parentid not in folders:
+            logging.warning(f'folder {parentid} not found, nothing copied')
+            return {}
+        tops = self.__topFolders(folderids)
+        folderMap = {folderid: getUniqueId() for top in tops for folderid in folders.subtree(top)}
+        texts, chunks = [], []
+        for top in tops:
+            texts += self.__executeSqlWithFetchall(f"SELECT {TBL_TEXT_F_ID},{TBL_TEXT_F_FOLDERID} FROM {TBL_TEXT} WHERE {TBL_TEXT_F_FOLDERID} IN ({SQL_SUBTREE})", (top,))
+            chunks += self.__executeSqlWithFetchall(f"""SELECT {TBL_CHUNKS_F_ID},{TBL_CHUNKS_F_TEXTID} FROM {TBL_CHUNKS} WHERE {TBL_CHUNKS_F_TEXTID} IN
+                (SELECT {TBL_TEXT_F_ID} FROM {TBL_TEXT} WHERE {TBL_TEXT_F_FOLDERID} IN ({SQL_SUBTREE}))""", (top,))
+        textMap = {textid: getUniqueId() for textid, _ in texts}
+        chunkMap = {chunkid: getUniqueId() for chunkid, _ in chunks}
+        newParents = {folderid: parentid if folderid in tops else folderMap[folders.node(folderid).parentid] for folderid in folderMap}
+        with self.batch():
+            self.__executeManySqlWithoutReturn(f"""INSERT INTO {TBL_FOLDERS} ({TBL_FOLDERS_F_ID},{TBL_FOLDERS_F_NAME},{TBL_FOLDERS_F_PARENTID})
+                SELECT ?,{TBL_FOLDERS_F_NAME},? FROM {TBL_FOLDERS} WHERE {TBL_FOLDERS_F_ID}=?""",
+                [(newid, newParents[folderid], folderid) for folderid, newid in folderMap.items()])
+            self.__executeManySqlWithoutReturn(f"""INSERT INTO {TBL_TEXT} ({TBL_TEXT_F_ID},{TBL_TEXT_F_VALUE},{TBL_TEXT_F_FOLDERID},{TBL_TEXT_F_DATE_C},{TBL_TEXT_F_DATE_E})
+                SELECT ?,{TBL_TEXT_F_VALUE},?,{TBL_TEXT_F_DATE_C},{TBL_TEXT_F_DATE_E} FROM {TBL_TEXT} WHERE {TBL_TEXT_F_ID}=?""",
+                [(textMap[textid], folderMap[folderid], textid) for textid, folderid in texts])
+            self.__executeManySqlWithoutReturn(f"""INSERT INTO {TBL_CHUNKS} ({TBL_CHUNKS_F_ID},{TBL_CHUNKS_F_TEXTID},{TBL_CHUNKS_F_SEQ},{TBL_CHUNKS_F_VALUE})
+                SELECT ?,?,{TBL_CHUNKS_F_SEQ},{TBL_CHUNKS_F_VALUE} FROM {TBL_CHUNKS} WHERE {TBL_CHUNKS_F_ID}=?""",
+                [(chunkMap[chunkid], textMap[textid], chunkid) for chunkid, textid in chunks])
+            for kind, idMap in ((SEARCH_KIND_FOLDER, folderMap), (SEARCH_KIND_TEXT, textMap), (SEARCH_KIND_CHUNK, chunkMap)):
+                self.__copySearchTokens(kind, idMap)
+        for folderid, newid in folderMap.items(): #a parent comes before its children in a subtree
+            node = folders.node(folderid)
+            folders.add(newid, newParents[folderid], node.cipherName, node.name)
+        logging.debug(f'{len(folderMap)} folders, {len(texts)} notes and {len(chunks)} chunks copied')
+        return folderMap
+
+    def __copySearchTokens(self, kind:int, idMap:dict) -> None:
+        '''the copies of the records have the same words as the records, idMap: {ownerid: ownerid of the copy}'''
+        sql = f"""INSERT OR IGNORE INTO {TBL_SEARCH} ({TBL_SEARCH_F_TOKEN},{TBL_SEARCH_F_KIND},{TBL_SEARCH_F_OWNERID})
+            SELECT {TBL_SEARCH_F_TOKEN},{TBL_SEARCH_F_KIND},? FROM {TBL_SEARCH} WHERE {TBL_SEARCH_F_KIND}=? AND {TBL_SEARCH_F_OWNERID}=?"""
+        self.__executeManySqlWithoutReturn(sql, [(newid, kind, ownerid) for ownerid, newid in idMap.items()])
         
     def updateTableFoldersFoldernameByFolderid(self, folderid:int, foldername:str) -> None:
         '''update the foldername of a record of table folders by folderid'''
         if not self.aes:
             return
-        foldername = self.aes.encrypt(foldername)
-        self.__executeSqlWithoutReturn(f"UPDATE {TBL_FOLDERS} SET {TBL_FOLDERS_F_NAME}=\"{foldername}\" WHERE {TBL_FOLDERS_F_ID}={folderid}")
+        hashes = tokenHashes(self.searchKey, foldername)
+        cipherName = self.aes.encryptRaw(foldername)
+        with self.batch():
+            self.__executeSqlWithoutReturn(f"UPDATE {TBL_FOLDERS} SET {TBL_FOLDERS_F_NAME}=? WHERE {TBL_FOLDERS_F_ID}=?", (cipherName, folderid))
+            self.__deleteSearchTokens(SEARCH_KIND_FOLDER, [int(folderid)])
+            self.__insertSearchTokens(SEARCH_KIND_FOLDER, [int(folderid)], [hashes])
+        if self.folderIndex != None:
+            self.folderIndex.rename(int(folderid), cipherName, foldername)
         
     def updateTableFoldersDeleteFolder(self, folderid:int) -> None:
-        '''remove a record from the folders table'''
-        self.__executeSqlWithoutReturn( f"DELETE FROM {TBL_FOLDERS} WHERE {TBL_FOLDERS_F_ID}={folderid}" )
-        self.__executeSqlWithoutReturn( f"DELETE FROM {TBL_TEXT} WHERE {TBL_TEXT_F_FOLDERID}={folderid}" )
+        '''remove a folder with all its descendants, their notes and their words in the search index, in one transaction.
+        each statement walks the subtree by SQL_SUBTREE, the folders are deleted last since the walk goes through them'''
+        inSubtree = f"IN (SELECT {TBL_TEXT_F_ID} FROM {TBL_TEXT} WHERE {TBL_TEXT_F_FOLDERID} IN ({SQL_SUBTREE}))"
+        folderids = [record[0] for record in self.__executeSqlWithFetchall(SQL_SUBTREE, (folderid,))]
+        textids = [record[0] for record in self.__executeSqlWithFetchall(f"SELECT {TBL_TEXT_F_ID} FROM {TBL_TEXT} WHERE {TBL_TEXT_F_FOLDERID} IN ({SQL_SUBTREE})", (folderid,))]
+        with self.batch():
+            for sql in (f"DELETE FROM {TBL_SEARCH} WHERE {TBL_SEARCH_F_KIND}={SEARCH_KIND_FOLDER} AND {TBL_SEARCH_F_OWNERID} IN ({SQL_SUBTREE})",
+                    f"""DELETE FROM {TBL_SEARCH} WHERE {TBL_SEARCH_F_KIND}={SEARCH_KIND_CHUNK} AND {TBL_SEARCH_F_OWNERID} IN
+                        (SELECT {TBL_CHUNKS_F_ID} FROM {TBL_CHUNKS} WHERE {TBL_CHUNKS_F_TEXTID} {inSubtree})""",
+                    f"DELETE FROM {TBL_SEARCH} WHERE {TBL_SEARCH_F_KIND}={SEARCH_KIND_TEXT} AND {TBL_SEARCH_F_OWNERID} {inSubtree}",
+                    f"DELETE FROM {TBL_CHUNKS} WHERE {TBL_CHUNKS_F_TEXTID} {inSubtree}",
+                    f"DELETE FROM {TBL_TEXT} WHERE {TBL_TEXT_F_FOLDERID} IN ({SQL_SUBTREE})",
+                    f"DELETE FROM {TBL_FOLDERS} WHERE {TBL_FOLDERS_F_ID} IN ({SQL_SUBTREE})"):
+                self.__executeSqlWithoutReturn(sql, (folderid,))
+        logging.debug(f'{len(folderids)} folders deleted with folder {folderid}')
+        for deleted in folderids:
+            self.noteCache.discard(deleted)
+        for textid in textids:
+            self.chunkStates.pop(textid, None)
+        if self.folderIndex != None:
+            self.folderIndex.remove(int(folderid))
+
+    def insertEncryptedNotes(self, notes:list) -> None:
+        '''insert the notes of new folders, encrypted beforehand, e.g. by the worker processes of dirimport, in one batch.
+        notes: [(folderid, dateCreate, dateEdit, chunks, hashes), ...], chunks: the chunks of the text given by splitText()
+        encoded by notecodec.encodeMany() with the password of this database, hashes: tokenHashes() of each chunk with its search key'''
+        texts, chunks, chunkids, hashes = [], [], [], []
+        for folderid, dateCreate, dateEdit, values, chunkHashes in notes:
+            textid = getUniqueId()
+            texts.append((textid, b'', folderid, dateCreate, dateEdit))
+            for seq, value in enumerate(values):
+                chunkids.append(getUniqueId())
+                chunks.append((chunkids[-1], textid, seq, value))
+            hashes += chunkHashes
+        with self.batch():
+            self.__executeManySqlWithoutReturn(f"""INSERT INTO {TBL_TEXT} ({TBL_TEXT_F_ID},{TBL_TEXT_F_VALUE},{TBL_TEXT_F_FOLDERID},{TBL_TEXT_F_DATE_C},{TBL_TEXT_F_DATE_E})
+                VALUES (?,?,?,?,?)""", texts)
+            self.__executeManySqlWithoutReturn(f"INSERT INTO {TBL_CHUNKS} ({TBL_CHUNKS_F_ID},{TBL_CHUNKS_F_TEXTID},{TBL_CHUNKS_F_SEQ},{TBL_CHUNKS_F_VALUE}) VALUES (?,?,?,?)", chunks)
+            self.__insertSearchTokens(SEARCH_KIND_CHUNK, chunkids, hashes)
+
+    def __pathHashes(self, paths:list) -> list:
+        '''the keyed hashes of the paths for TBL_IMPORTS, the key changes with the password'''
+        key = hmac.digest(self.aes.key, IMPORT_KEY_LABEL, 'sha256')
+        return [hmac.digest(key, path.encode('utf-8', 'surrogatepass'), 'sha256')[:SEARCH_TOKEN_BYTES] for path in paths]
+
+    def importedPaths(self, paths:list) -> dict:
+        '''the paths recorded by recordImportedPaths() whose folder still exists, {path: folderid}'''
+        self.__createTableImports()
+        byHash = dict(zip(self.__pathHashes(paths), paths))
+        hashes, found = list(byHash), {}
+        for start in range(0, len(hashes), IMPORT_LOOKUP_ROWS):
+            lookup = hashes[start:start + IMPORT_LOOKUP_ROWS]
+            sql = f"""SELECT i.{TBL_IMPORTS_F_PATH},i.{TBL_IMPORTS_F_FOLDERID} FROM {TBL_IMPORTS} i JOIN {TBL_FOLDERS} f ON f.{TBL_FOLDERS_F_ID}=i.{TBL_IMPORTS_F_FOLDERID}
+                WHERE i.{TBL_IMPORTS_F_PATH} IN ({','.join('?' * len(lookup))})"""
+            found.update({byHash[pathHash]: folderid for pathHash, folderid in self.__executeSqlWithFetchall(sql, lookup)})
+        return found
+
+    def recordImportedPaths(self, paths:list) -> None:
+        '''remember the folders created for the files and directories imported, paths: [(path, folderid), ...]'''
+        self.__createTableImports()
+        sql = f"INSERT OR REPLACE INTO {TBL_IMPORTS} ({TBL_IMPORTS_F_PATH},{TBL_IMPORTS_F_FOLDERID}) VALUES (?,?)"
+        self.__executeManySqlWithoutReturn(sql, zip(self.__pathHashes([path for path, _ in paths]), [folderid for _, folderid in paths]))
+
+    def purgeOrphans(self) -> dict:
+        '''delete the records which cannot be reached from the root folders, left behind by the versions which deleted
+        a folder without its descendants: folders whose parent does not exist, notes of folders which do not exist,
+        chunks of notes which do not exist and words of records which do not exist.
+        return the number of records deleted by table'''
+        orphans = (
+            (TBL_FOLDERS, f"DELETE FROM {TBL_FOLDERS} WHERE {TBL_FOLDERS_F_ID} NOT IN ({SQL_SUBTREE})", (ID_ROOT,)),
+            (TBL_TEXT, f"DELETE FROM {TBL_TEXT} WHERE {TBL_TEXT_F_FOLDERID} NOT IN (SELECT {TBL_FOLDERS_F_ID} FROM {TBL_FOLDERS})", ()),
+            (TBL_CHUNKS, f"DELETE FROM {TBL_CHUNKS} WHERE {TBL_CHUNKS_F_TEXTID} NOT IN (SELECT {TBL_TEXT_F_ID} FROM {TBL_TEXT})", ()))
+        counts = {}
+        with self.batch():
+            for table, sql, params in orphans:
+                self.__executeSqlWithoutReturn(sql, params)
+                counts[table] = self.dbCursor.rowcount
+            counts[TBL_SEARCH] = 0
+            for table, idField, _, kind in ENCRYPTED_COLUMNS:
+                self.__executeSqlWithoutReturn(f"""DELETE FROM {TBL_SEARCH} WHERE {TBL_SEARCH_F_KIND}=? AND
+                    {TBL_SEARCH_F_OWNERID} NOT IN (SELECT {idField} FROM {table})""", (kind,))
+                counts[TBL_SEARCH] += self.dbCursor.rowcount
+        logging.info(f'orphans purged {counts}')
+        if any(counts.values()):
+            self.noteCache.clear()
+            self.chunkStates.clear()
+            self.folderIndex = None
+        return counts
+
+    def compactDatabase(self) -> dict:
+        '''purge the orphans, then give the free pages back to the file system, by an incremental vacuum if the database
+        was created with auto_vacuum=INCREMENTAL, otherwise by rebuilding the file with VACUUM.
+        return the counts of purgeOrphans() with the bytes reclaimed under the key bytes'''
+        counts = self.purgeOrphans()
+        before = self.__databaseBytes()
+        if self.__executeSqlWithFetchall('PRAGMA auto_vacuum')[0][0] == 2:
+            self.__executeSqlWithFetchall('PRAGMA incremental_vacuum')
+        else:
+            self.dbConn.execute('VACUUM')
+        if self.__executeSqlWithFetchall('PRAGMA journal_mode')[0][0] == 'wal':
+            #the pages written by VACUUM are in the WAL file until they are copied back
+            self.__executeSqlWithFetchall('PRAGMA wal_checkpoint(TRUNCATE)')
+        counts['bytes'] = before - self.__databaseBytes()
+        logging.info(f'database compacted, {counts["bytes"]} bytes reclaimed')
+        return counts
+
+    def recompressNotes(self, progress=None) -> dict:
+        '''save the notes as they would be saved now: compress the notes saved before version 5.0 or without compression,
+        or decompress them all if compressed is False. the records are walked in chunks as by changePasswd(), in one
+        transaction, only the values which change are written. the words are the same, so the search index is kept.
+        the pages freed are given back by compactDatabase().
+        progress: called as progress(done, total) after each chunk, it is cancelled if it returns False
+        return {'records': records read, 'rewritten': records written, 'bytes': bytes saved by the values written}, None if cancelled'''
+        columns = [(table, idField, valueField) for table, idField, valueField, _ in ENCRYPTED_COLUMNS if table != TBL_FOLDERS]
+        total = sum(self.__executeSqlWithFetchall(f"SELECT count(*) FROM {table}")[0][0] for table, _, _ in columns)
+        counts = {'records': 0, 'rewritten': 0, 'bytes': 0}
+        try:
+            with self.batch():
+                for table, idField, valueField in columns:
+                    sql = f"UPDATE {table} SET {valueField}=? WHERE {idField}=?"
+                    for records in self.__readChunks(table, idField, valueField):
+                        #the values already saved as they would be now are not decrypted, textval is empty for the notes in chunks
+                        pending = [record for record in records if record[1] and notecodec.isCompressed(record[1]) != self.compressed]
+                        values = notecodec.encodeMany(self.aes, notecodec.decodeMany(self.aes, [record[1] for record in pending]), self.compressed)
+                        changed = [(value, record[0]) for record, value in zip(pending, values) if value != record[1]]
+                        self.__executeManySqlWithoutReturn(sql, changed)
+                        counts['records'] += len(records)
+                        counts['rewritten'] += len(changed)
+                        counts['bytes'] += sum(len(record[1]) for record in pending) - sum(len(value) for value in values)
+                        if progress and progress(counts['records'], total) == False:
+                            raise OperationCancelled()
+        except OperationCancelled:
+            logging.info('recompressing notes cancelled')
+            return None
+        logging.info(f'{counts["rewritten"]} of {counts["records"]} values rewritten, {counts["bytes"]} bytes saved')
+        return counts
+
+    def databaseStats(self) -> dict:
+        '''the number of records by table, the bytes of the database and of its free pages, the version of the format,
+        whether the search index is built and the number of chunks compressed'''
+        stats = {table: self.__executeSqlWithFetchall(f"SELECT count(*) FROM {table}")[0][0] for table in (TBL_FOLDERS, TBL_TEXT, TBL_CHUNKS, TBL_SEARCH)}
+        stats['compressedchunks'] = self.__executeSqlWithFetchall(f"SELECT count(*) FROM {TBL_CHUNKS} WHERE length({TBL_CHUNKS_F_VALUE}) % {notecodec.BLOCK_SIZE} != 0")[0][0]
+        stats['bytes'] = self.__databaseBytes()
+        stats['freebytes'] = self.__executeSqlWithFetchall('PRAGMA freelist_count')[0][0] * self.__executeSqlWithFetchall('PRAGMA page_size')[0][0]
+        sql = f'SELECT {TBL_SYS_F_ITEMVALUE} FROM {TBL_SYS} WHERE {TBL_SYS_F_ID}=?'
+        stats['version'] = self.__executeSqlWithFetchall(sql, (TBL_SYS_V_IDX_VER,))[0][0]
+        stats['searchindex'] = self.__executeSqlWithFetchall(sql, (TBL_SYS_V_IDX_SEARCH,)) == [('1',)]
+        return stats
+
+    def __databaseBytes(self) -> int:
+        '''size of the database in bytes, free pages included'''
+        return self.__executeSqlWithFetchall('PRAGMA page_count')[0][0] * self.__executeSqlWithFetchall('PRAGMA page_size')[0][0]
             
     
-    def changePasswd(self, newPasswd:str) -> bool:
+    def changePasswd(self, newPasswd:str, progress=None, workers:int=1) -> bool:
         """
         when a new password is set, read all the data, decrypt it with the old password, 
-        encrypt it with new password and update the database
+        encrypt it with new password and update the database, the search index is rebuilt with the new key on the way
+        the tables are walked in chunks of REKEY_CHUNK_ROWS records or REKEY_CHUNK_BYTES bytes, so the memory used
+        does not depend on the size of the database. All the chunks are written in one transaction, if anything fails
+        or the program is killed, the database keeps the old password.
+        progress: called as progress(done, total) after each chunk, the re-encryption is cancelled if it returns False
+        workers: if more than 1, the chunks are decrypted and encrypted by a pool of so many processes,
+            the database is read and written by this process only
         return True if successful
         """
         newAes = ECP.AESCipher(newPasswd)
-        #re-encrypt table folders
-        records = self.__executeSqlWithFetchall( f"SELECT {TBL_FOLDERS_F_ID},{TBL_FOLDERS_F_NAME} FROM {TBL_FOLDERS}" )
-        for record in records:
-            folderid = record[0]
-            foldername = self.aes.decrypt(str(record[1]))
-            sql = f"UPDATE {TBL_FOLDERS} SET {TBL_FOLDERS_F_NAME}=\"{newAes.encrypt(foldername)}\" WHERE {TBL_FOLDERS_F_ID}={folderid}"
-            cursor = self.dbConn.cursor()
-            cursor.execute(sql)
-        
-        #re-encrypt table texts
-        records = self.__executeSqlWithFetchall( f"SELECT {TBL_TEXT_F_ID},{TBL_TEXT_F_VALUE} FROM {TBL_TEXT}" )
-        for record in records:
-            textid = record[0]
-            text =self.aes.decrypt(str(record[1])) 
-            sql = f"UPDATE {TBL_TEXT} SET {TBL_TEXT_F_VALUE}=\"{newAes.encrypt(text)}\" WHERE {TBL_TEXT_F_ID}={textid}"
-            cursor = self.dbConn.cursor()
-            cursor.execute(sql)
-
-        #re-encrypt sample text
-        sql = f"UPDATE {TBL_SYS} SET {TBL_SYS_F_ITEMVALUE}=\"{newAes.encrypt(SAMPLE_TEXT)}\" WHERE {TBL_SYS_F_ID}={TBL_SYS_V_IDX_SAMPLE}"
-        cursor = self.dbConn.cursor()
-        cursor.execute(sql)
-
-        #commit the modification
+        newSearchKey = searchKeyOf(newAes)
+        total = sum(self.__executeSqlWithFetchall(f"SELECT count(*) FROM {table}")[0][0] for table, _, _, _ in ENCRYPTED_COLUMNS)
+        done = 0
+        executor = None
+        if workers > 1:
+            import multiprocessing
+            #spawned as the scan pool, a fork of the threads of the GUI would hang the rekey with the transaction open
+            executor = concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(POOL_START_METHOD),
+                initializer=initRekeyWorker, initargs=(self.aes, newAes))
         try:
-            self.dbConn.commit()
-            self.aes = newAes
-            return True
-        except:
+            with self.batch():
+                self.__executeSqlWithoutReturn(f"DELETE FROM {TBL_SEARCH}")
+                for table, idField, valueField, kind in ENCRYPTED_COLUMNS:
+                    sql = f"UPDATE {table} SET {valueField}=? WHERE {idField}=?"
+                    #the notes are compressed on the way, the folder names are read by AESCipher directly and are not
+                    compressed = self.compressed and table != TBL_FOLDERS
+                    for ids, values, hashes in self.__rekeyChunks(self.__readChunks(table, idField, valueField), newAes, newSearchKey, compressed, executor, workers):
+                        self.__executeManySqlWithoutReturn(sql, zip(values, ids))
+                        self.__insertSearchTokens(kind, ids, hashes)
+                        done += len(ids)
+                        if progress and progress(done, total) == False:
+                            raise OperationCancelled()
+
+                #the hashes of the paths imported depend on the password, an import cannot be resumed once it is changed
+                self.__executeSqlWithoutReturn(f"DROP TABLE IF EXISTS {TBL_IMPORTS}")
+                #re-encrypt sample text
+                sql = f"UPDATE {TBL_SYS} SET {TBL_SYS_F_ITEMVALUE}=? WHERE {TBL_SYS_F_ID}=?"
+                self.__executeSqlWithoutReturn(sql, (newAes.encryptRaw(SAMPLE_TEXT), TBL_SYS_V_IDX_SAMPLE))
+                self.__executeSqlWithoutReturn(sql, ('1', TBL_SYS_V_IDX_SEARCH))
+        except OperationCancelled:
+            logging.info('changing password cancelled')
+            return False
+        except sqlite3.Error as e:
+            logging.critical(e)
             return False
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+        self.aes = newAes
+        self.searchKey = newSearchKey
+        self.noteCache.clear()
+        self.folderIndex = None #the cipher names it holds are those of the old password
+        self.__closeScanPool() #its processes hold the old cipher
+        return True
+
+    def __rekeyChunks(self, chunks, newAes:ECP.AESCipher, newSearchKey:bytes, compressed:bool, executor:Executor, workers:int):
+        """
+        generator which re-encrypts the chunks of [id, value] given by __readChunks(), yield (ids, values, hashes) in order,
+        see rekeyAndIndex(). with an executor, up to 2 chunks per worker are in flight, so the memory used stays bounded
+        """
+        if executor == None:
+            for records in chunks:
+                yield [record[0] for record in records], *rekeyAndIndex(self.aes, newAes, newSearchKey, [record[1] for record in records], compressed)
+            return
+        pending = deque()
+        for records in chunks:
+            pending.append(([record[0] for record in records], executor.submit(rekeyValues, [record[1] for record in records], compressed)))
+            if len(pending) > 2 * workers:
+                ids, future = pending.popleft()
+                yield ids, *future.result()
+        while pending:
+            ids, future = pending.popleft()
+            yield ids, *future.result()
+
+    def __readChunks(self, table:str, idField:str, valueField:str):
+        """
+        generator which walks a table in the order of idField, yield lists of [id, value]
+        a list holds at most REKEY_CHUNK_ROWS records, and stops growing once REKEY_CHUNK_BYTES bytes are read.
+        each chunk is read by its own query starting after the last id of the previous chunk,
+        so the caller may update the records of a chunk before asking for the next one
+        """
+        sql = f"SELECT {idField},{valueField} FROM {table} WHERE {idField}>? ORDER BY {idField} LIMIT ?"
+        lastid = -1
+        while True:
+            cursor = self.dbConn.cursor()
+            cursor.execute(sql, (lastid, REKEY_CHUNK_ROWS))
+            records, size = [], 0
+            for record in cursor:
+                records.append(record)
+                size += len(record[1])
+                if size >= REKEY_CHUNK_BYTES:
+                    break
+            cursor.close()
+            if not records:
+                return
+            lastid = records[-1][0]
+            yield records
 
 
 def debugInsertData():
@@ -256,9 +1527,6 @@ def debugInsertData():
     db = CiperDatabase(filename)
     
     db.createDatabase(filename, DEFAULT_PASSWD)
-    conn = db.dbConn
-    debugData = {}
-    aes = ECP.AESCipher(DEFAULT_PASSWD)
     ids = [getUniqueId() for i in range(0,100)]
     folders = [[ids[0], 'Websites', 0], 
         [ids[1], 'Music', ids[0]], 
@@ -275,12 +1543,7 @@ def debugInsertData():
         [ids[12], 'python', ids[3]],
         [ids[13], 'javascript', ids[3]],
         [ids[14], 'Social', 0]]
-    for folder in folders:
-        folderid = folder[0]
-        foldername = aes.encrypt(folder[1])
-        parentid = folder[2]
-        sql = f"INSERT INTO folders (folderid, name, parentid) VALUES ({folderid}, \"{foldername}\", {parentid});"
-        conn.cursor().execute(sql)
+    db.insertManyFolders(folders) #the names are indexed, so the folders are found by a search
     
     texts = [ids[12], '''A list comprehension returns a list while a generator expression returns a generator object.
 It means that a list comprehension returns a complete list of elements upfront. However, a generator expression returns a list of elements, one at a time, based on request.
@@ -288,13 +1551,8 @@ It means that a list comprehension returns a complete list of elements upfront.
 A list comprehension is eager while a generator expression is lazy.
 
 In other words, a list comprehension creates all elements right away and loads all of them into the memory.''']
-    textid = ids[30]
-    textname = aes.encrypt(texts[1])
-    folderid = ids[12]
-    sql = f'INSERT INTO {TBL_TEXT} ({TBL_TEXT_F_ID},{TBL_TEXT_F_VALUE},{TBL_TEXT_F_FOLDERID}) VALUES ({textid},\"{textname}\",{folderid}); '
-    #print(sql)
-    conn.cursor().execute(sql)
-    conn.commit()
+    db.insertTexts(texts[1], texts[0], ids[30]) #split into chunks and indexed as a note saved by the GUI
+    db.closeDatabase()
 
 
 if __name__ == '__main__':
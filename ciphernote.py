@@ -1,6 +1,10 @@
 # -*- encoding: utf-8 -*-
 '''
 the main entry for cipher notebook
+    python ciphernote.py [--profile-startup]
+--profile-startup: print the import times, the phases of the start, the time to the first paint
+    and the time to interactive, then exit. The password is read from PASSNOTE_PASSWORD if set,
+    otherwise it is asked and the time waiting for it is not counted
 Author: Jared Yu
 Contect: hfyu.hzcn@gmail.com
 Version: 1.0
@@ -10,19 +14,41 @@ Tested with: PyQt5 5.15.2.2.2, cryptography 2.9.2
 Tested in: Windows 11, MacOS
 '''
 import sys
-from PyQt5.QtWidgets import QApplication
+import os
 import logging
-import window as GUI
-import cipherdb as DB
+import argparse
+import startup
+
+ENV_PASSWORD = 'PASSNOTE_PASSWORD' #password read by --profile-startup, same variable as passnotecli
 
 def main() -> None:
     '''main entry'''
-    logging.basicConfig(level=logging.DEBUG)
-    
-    app = QApplication(sys.argv)
-    mainwindow = GUI.MainWindow()
+    profiler = startup.profiler
+    profiler.restart()
+    parser = argparse.ArgumentParser(description='encrypted notebook')
+    parser.add_argument('--profile-startup', action='store_true', help='print the startup profile and exit')
+    args, qtArgs = parser.parse_known_args()
+    logging.basicConfig(level=logging.WARNING if args.profile_startup else logging.DEBUG)
+    if args.profile_startup:
+        profiler.traceImports()
+    #Qt and the GUI modules are imported here so that their import time is profiled
+    from PyQt5.QtWidgets import QApplication
+    import window as GUI
+    profiler.untraceImports()
+    profiler.mark('imports')
+
+    app = QApplication(sys.argv[:1] + qtArgs)
+    profiler.mark('application')
+    mainwindow = GUI.MainWindow(passwd=os.environ.get(ENV_PASSWORD) if args.profile_startup else None)
+    profiler.mark('main window')
+    if args.profile_startup:
+        def report() -> None:
+            print(profiler.report())
+            mainwindow.close()
+        mainwindow.ready.connect(report)
     mainwindow.show()
+    profiler.mark('shown')
     app.exec()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
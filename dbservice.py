@@ -0,0 +1,211 @@
+# -*- encoding: utf-8 -*-
+'''
+database service, runs the methods of a CiperDatabase on a worker thread so that the GUI never waits for sqlite or AES
+Author: Jared Yu
+Contect: hfyu.hzcn@gmail.com
+Version: 1.0
+Update: 2023-3-8
+Requires: PyQt5
+'''
+from PyQt5.QtCore import QObject, pyqtSignal
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+import threading
+import logging
+
+class DatabaseStream():
+    '''a generator method of the database run by DatabaseService.requestStream()'''
+    def __init__(self, callback, done, error, channel:str, generation:int, epoch:int):
+        self.callback, self.done, self.error, self.channel, self.generation = callback, done, error, channel, generation
+        self.epoch = epoch #of the database it reads, see DatabaseService.setDatabase()
+
+class DatabaseService(QObject):
+    '''owns a CiperDatabase and calls its methods on one worker thread, in the order they are requested.
+    The sqlite connection is created by openDatabase()/createDatabase() on the worker thread, so it is never used by another one.
+    call(): run a method and wait for the result, for short operations or when the GUI cannot go on without the result
+    request(): run a method in the background, the callback is called with the result on the GUI thread.
+        requests with the same key are coalesced while the first one is pending,
+        a result is dropped if a newer request was made on the same channel, e.g. the user selected another folder
+    requestStream(): same as request() for a generator method, the callback is called with each item it yields.
+        the worker runs one step of the generator at a time, the requests made meanwhile run between two steps
+    if the method of a request or a stream raises, failed is emitted and the error callback given is called instead
+    of the callback, so that the caller can restore the UI
+    '''
+    #key, result, error message. emitted on the worker thread, delivered on the GUI thread
+    finished = pyqtSignal(object, object, str)
+    #done, total. emitted by the progress callback of long operations
+    progressed = pyqtSignal(int, int)
+    #stream, item. an item yielded by the generator of requestStream(), the item is None when it is exhausted
+    produced = pyqtSignal(object, object)
+    #stream, error message. the generator of requestStream() raised
+    streamFailed = pyqtSignal(object, str)
+    failed = pyqtSignal(str)
+    def __init__(self, parent:QObject=None):
+        super(DatabaseService, self).__init__(parent)
+        self.db = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dbservice')
+        self.pending = {} #key: list of [callback, error, channel, generation], only used on the GUI thread
+        self.generations = {} #channel: generation of the latest request
+        self.keys = count() #keys of the requests which are not coalesced
+        self.epoch = 0 #incremented when the database is replaced, the streams of the previous one are stale
+        self.cancelEvent = threading.Event()
+        self.lock = threading.Lock()
+        self.waitingStreams = {} #key: DatabaseStream not started yet
+        self.finished.connect(self.__deliver)
+        self.produced.connect(self.__deliverItem)
+        self.streamFailed.connect(self.__deliverError)
+
+    def setDatabase(self, db) -> None:
+        '''replace the database, the previous one is closed on the worker thread after the requests queued before,
+        its streams are stopped'''
+        self.epoch += 1
+        if self.db != None:
+            self.call('closeDatabase')
+        self.db = db
+
+    def call(self, method:str, *args):
+        '''run the method of the database on the worker thread and wait for its result, exceptions are raised here'''
+        return self.executor.submit(getattr(self.db, method), *args).result()
+
+    def request(self, method:str, args:tuple=(), callback=None, key=None, channel:str=None, error=None) -> None:
+        '''run the method of the database on the worker thread, callback(result) is called on the GUI thread
+        key: a pending request with the same key is not run again, its result is given to both callbacks
+        channel: only the latest request of a channel has its callback called, the results of the others are stale
+        error: error(message) is called on the GUI thread instead of callback if the method raises'''
+        generation = self.__nextGeneration(channel)
+        if key == None:
+            key = (method, next(self.keys))
+        elif key in self.pending:
+            logging.debug(f'request {key} coalesced')
+            self.pending[key].append([callback, error, channel, generation])
+            return
+        self.pending[key] = [[callback, error, channel, generation]]
+        self.executor.submit(self.__run, key, getattr(self.db, method), args)
+
+    def isPending(self, method:str) -> bool:
+        '''if a request of the method, which is not coalesced, is queued or running'''
+        return any(isinstance(key, tuple) and key[0] == method for key in self.pending)
+
+    def __nextGeneration(self, channel:str) -> int:
+        '''a new request is made on the channel, the pending results of the channel become stale'''
+        if channel == None:
+            return None
+        generation = self.generations.get(channel, 0) + 1
+        self.generations[channel] = generation
+        return generation
+
+    def requestStream(self, method:str, args:tuple=(), callback=None, done=None, key=None, channel:str=None, error=None) -> None:
+        '''run a generator method of the database on the worker thread, callback(item) is called on the GUI thread
+        for each item it yields, then done()
+        key: if a stream with the same key has not started yet, it is run once with the callbacks of the latest request
+        channel: the generator is closed as soon as a newer request is made on the channel, the items not delivered are dropped
+        error: error(message) is called on the GUI thread instead of done() if the generator raises'''
+        generation = self.__nextGeneration(channel)
+        with self.lock:
+            stream = self.waitingStreams.get(key) if key != None else None
+            if stream != None:
+                logging.debug(f'stream {key} coalesced')
+                stream.callback, stream.done, stream.error, stream.generation = callback, done, error, generation
+                return
+            stream = DatabaseStream(callback, done, error, channel, generation, self.epoch)
+            if key != None:
+                self.waitingStreams[key] = stream
+        self.executor.submit(self.__runStream, key, stream, getattr(self.db, method), args)
+
+    def __isStale(self, stream:DatabaseStream) -> bool:
+        '''if a newer request was made on the channel of the stream, or the database was replaced'''
+        return stream.epoch != self.epoch or (stream.channel != None and stream.generation != self.generations[stream.channel])
+
+    def __runStream(self, key, stream:DatabaseStream, func, args:tuple) -> None:
+        '''run on the worker thread, start the generator'''
+        with self.lock:
+            if key != None:
+                self.waitingStreams.pop(key, None)
+        try:
+            iterator = func(*args)
+        except Exception as e:
+            logging.exception(e)
+            self.streamFailed.emit(stream, str(e))
+            return
+        self.__stepStream(key, stream, iterator)
+
+    def __stepStream(self, key, stream:DatabaseStream, iterator) -> None:
+        '''run on the worker thread, the next item of the generator is sent to the GUI thread by the signal produced.
+        the next step is queued behind the requests made meanwhile, so a call() waits for one item, not for the whole stream'''
+        if self.__isStale(stream):
+            logging.debug(f'stale stream {key} closed')
+            iterator.close()
+            return
+        try:
+            item = next(iterator)
+        except StopIteration:
+            self.produced.emit(stream, None)
+            return
+        except Exception as e:
+            logging.exception(e)
+            self.streamFailed.emit(stream, str(e))
+            return
+        self.produced.emit(stream, item)
+        self.executor.submit(self.__stepStream, key, stream, iterator)
+
+    def __deliverItem(self, stream:DatabaseStream, item) -> None:
+        '''slot of produced, called on the GUI thread'''
+        if self.__isStale(stream):
+            return
+        if item == None:
+            if stream.done:
+                stream.done()
+        elif stream.callback:
+            stream.callback(item)
+
+    def __deliverError(self, stream:DatabaseStream, error:str) -> None:
+        '''slot of streamFailed, called on the GUI thread'''
+        self.failed.emit(error)
+        if stream.error and not self.__isStale(stream):
+            stream.error(error)
+
+    def __run(self, key, func, args:tuple) -> None:
+        '''run on the worker thread, the result is sent to the GUI thread by the signal finished'''
+        try:
+            result = func(*args)
+        except Exception as e:
+            logging.exception(e)
+            self.finished.emit(key, None, str(e))
+            return
+        self.finished.emit(key, result, '')
+
+    def __deliver(self, key, result, error:str) -> None:
+        '''slot of finished, called on the GUI thread, call the callbacks of the request unless they are stale,
+        its error callbacks if it failed'''
+        if error:
+            self.failed.emit(error)
+        for callback, errorCallback, channel, generation in self.pending.pop(key, []):
+            if channel != None and generation != self.generations[channel]:
+                logging.debug(f'stale result of {key} dropped')
+                continue
+            if error:
+                if errorCallback:
+                    errorCallback(error)
+            elif callback:
+                callback(result)
+
+    def progressCallback(self):
+        '''return a progress callback for the long operations of the database, e.g. changePasswd().
+        it emits progressed and returns False once cancel() is called'''
+        self.cancelEvent.clear()
+        def progress(done:int, total:int) -> bool:
+            self.progressed.emit(done, total)
+            return not self.cancelEvent.is_set()
+        return progress
+
+    def cancel(self) -> None:
+        '''ask the running long operation to stop'''
+        self.cancelEvent.set()
+
+    def shutdown(self) -> None:
+        '''wait for the requests in the queue and close the database, the streams are stopped'''
+        self.epoch += 1
+        if self.db != None:
+            self.call('closeDatabase')
+            self.db = None
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,210 @@
+# -*- encoding: utf-8 -*-
+'''
+import a directory tree of text files into a notebook: a directory becomes a folder, a file becomes a folder named
+after it without the extension, holding the text of the file as its note:
+    stats = dirimport.importDirectory(db, '/path/to/notes', parentid, workers=4)
+The files are read, split, encrypted and indexed in batches by a pool of worker processes, the database is written
+by this process only, in transactions of about COMMIT_FILES files or COMMIT_BYTES bytes. A transaction records the paths it imported as
+keyed hashes, so an interrupted import is resumed by running it again: the files imported are skipped and the folders
+of the directories are reused. Run again later, it imports the files added since and those whose folder was deleted.
+Author: Jared Yu
+Contect: hfyu.hzcn@gmail.com
+Version: 1.0
+Update: 2023-3-15
+Requires: pycryptodome
+'''
+import os
+import time
+import datetime
+import logging
+import concurrent.futures
+from concurrent.futures import Executor
+from collections import deque
+import cipherdb
+import notecodec
+
+DEFAULT_EXTENSIONS = ('.txt', '.md', '.markdown', '.text') #files with other extensions are ignored
+DEFAULT_ENCODING = 'utf-8-sig' #UTF-8, a byte order mark is dropped
+READ_BATCH_FILES = 256 #files read and encrypted at once by a worker
+READ_BATCH_BYTES = 4 * 1024 * 1024 #a batch stops growing once its files have so many bytes
+COMMIT_FILES = 5000 #files written by one transaction
+COMMIT_BYTES = 64 * 1024 * 1024 #or fewer files once they have so many bytes, the notes are held in memory until written
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S' #same as the dates of the notes saved by cipherdb
+
+def readNotes(aes, searchKey:bytes, encoding:str, compressed:bool, files:list) -> list:
+    '''read the text files, split them into chunks, encode the chunks and hash their words, see insertEncryptedNotes().
+    compressed: if the chunks are compressed before they are encrypted, see notecodec.encodeMany().
+    the line ends are translated to \\n as in a note typed in the GUI.
+    return for each file (dateCreate, dateEdit, cipher chunks, hashes of each chunk, bytes of the file),
+    or the error message if it cannot be read or decoded'''
+    results, texts = [], []
+    for path in files:
+        try:
+            with open(path, 'r', encoding=encoding) as f:
+                text = f.read()
+            stat = os.stat(path)
+        except (OSError, UnicodeDecodeError) as e:
+            results.append(f'{type(e).__name__}: {e}')
+            continue
+        dateEdit = datetime.datetime.fromtimestamp(stat.st_mtime).strftime(DATE_FORMAT)
+        dateCreate = datetime.datetime.fromtimestamp(getattr(stat, 'st_birthtime', stat.st_mtime)).strftime(DATE_FORMAT)
+        chunks = cipherdb.splitText(text)
+        results.append([dateCreate, dateEdit, chunks, [cipherdb.tokenHashes(searchKey, chunk) for chunk in chunks], stat.st_size])
+        texts += chunks
+    #the chunks of all the files are encrypted at once
+    values = iter(notecodec.encodeMany(aes, texts, compressed))
+    for result in results:
+        if not isinstance(result, str):
+            result[2] = [next(values) for _ in result[2]]
+    return results
+
+#the cipher, the search key, the encoding and the compression in a worker process of importDirectory(), set by initReadWorker()
+readState = None
+
+def initReadWorker(aes, encoding:str, compressed:bool) -> None:
+    '''initializer of the worker processes of importDirectory()'''
+    global readState
+    readState = (aes, cipherdb.searchKeyOf(aes), encoding, compressed)
+
+def readFiles(files:list) -> list:
+    '''run in a worker process, see readNotes()'''
+    return readNotes(*readState, files)
+
+class DirectoryImporter():
+    '''the state of one import, see importDirectory()'''
+    def __init__(self, db:cipherdb.CiperDatabase, directory:str, parentid:int, extensions, encoding:str, progress):
+        self.db = db
+        self.directory = os.path.realpath(directory)
+        self.parentid = int(parentid)
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.encoding = encoding
+        self.progress = progress
+        #the records of the folders, notes and paths imported since the last commit
+        self.folders, self.notes, self.paths, self.uncommitted, self.uncommittedBytes = [], [], [], 0, 0
+        self.found = 0 #files found by the walk so far
+        self.stats = {'files': 0, 'folders': 0, 'skipped': 0, 'ignored': 0, 'failed': [], 'bytes': 0}
+
+    def run(self, workers:int) -> dict:
+        '''walk the directory and import it, return the statistics'''
+        start = time.perf_counter()
+        executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=initReadWorker, initargs=(self.db.aes, self.encoding, self.db.compressed)) if workers > 1 else None
+        try:
+            for files, results in self.__readBatches(self.__walk(), executor, workers):
+                for (path, name, parentid), result in zip(files, results):
+                    if isinstance(result, str):
+                        self.stats['failed'].append((path, result))
+                        continue
+                    dateCreate, dateEdit, values, hashes, size = result
+                    folderid = cipherdb.getUniqueId()
+                    self.folders.append((folderid, name, parentid))
+                    self.notes.append((folderid, dateCreate, dateEdit, values, hashes))
+                    self.paths.append((self.__key(path), folderid))
+                    self.stats['files'] += 1
+                    self.stats['bytes'] += size
+                    self.uncommittedBytes += size
+                self.uncommitted += len(files)
+                if self.uncommitted >= COMMIT_FILES or self.uncommittedBytes >= COMMIT_BYTES:
+                    self.__commit()
+                if self.progress:
+                    self.progress(self.stats['files'] + len(self.stats['failed']), self.found)
+            self.__commit()
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+        self.stats['seconds'] = time.perf_counter() - start
+        logging.info(f'directory {self.directory} imported: {formatStats(self.stats)}')
+        return self.stats
+
+    def __key(self, path:str) -> str:
+        '''the path recorded for a file or directory, importing it again into another folder is another import'''
+        return f'{self.parentid}\0{path}'
+
+    def __commit(self) -> None:
+        '''write the folders, notes and paths imported since the last commit in one transaction'''
+        with self.db.batch():
+            self.db.insertManyFolders(self.folders)
+            self.db.insertEncryptedNotes(self.notes)
+            self.db.recordImportedPaths(self.paths)
+        logging.info(f'{self.stats["files"]} files imported, {self.found} found')
+        self.folders, self.notes, self.paths, self.uncommitted, self.uncommittedBytes = [], [], [], 0, 0
+
+    def __folderOf(self, path:str, name:str, parentid:int, imported:dict) -> int:
+        '''the folder of a directory, the one of a previous import or a new one'''
+        folderid = imported.get(self.__key(path))
+        if folderid == None:
+            folderid = cipherdb.getUniqueId()
+            self.folders.append((folderid, name, parentid))
+            self.paths.append((self.__key(path), folderid))
+            self.stats['folders'] += 1
+        return folderid
+
+    def __walk(self):
+        '''generator, walk the directory and yield batches of files to read: [(path, name, parentid), ...].
+        the folders of the directories are created on the way, the files imported before are skipped,
+        the names starting with a dot are ignored, the symbolic links to directories are not followed'''
+        rootid = self.__folderOf(self.directory, os.path.basename(self.directory), self.parentid, self.db.importedPaths([self.__key(self.directory)]))
+        pending = [(self.directory, rootid)]
+        batch, size = [], 0
+        while pending:
+            directory, folderid = pending.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = sorted([entry for entry in it if not entry.name.startswith('.')], key=lambda entry: entry.name)
+            except OSError as e:
+                self.stats['failed'].append((directory, f'{type(e).__name__}: {e}'))
+                continue
+            imported = self.db.importedPaths([self.__key(entry.path) for entry in entries])
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append((entry.path, self.__folderOf(entry.path, entry.name, folderid, imported)))
+                elif not entry.is_file() or not entry.name.lower().endswith(self.extensions):
+                    self.stats['ignored'] += 1
+                elif self.__key(entry.path) in imported:
+                    self.stats['skipped'] += 1
+                else:
+                    batch.append((entry.path, os.path.splitext(entry.name)[0], folderid))
+                    size += entry.stat().st_size
+                    self.found += 1
+                    if len(batch) >= READ_BATCH_FILES or size >= READ_BATCH_BYTES:
+                        yield batch
+                        batch, size = [], 0
+        if batch:
+            yield batch
+
+    def __readBatches(self, batches, executor:Executor, workers:int):
+        '''generator, read the batches of files, yield (files, results of readNotes()) in order.
+        with an executor, up to 2 batches per worker are in flight, so the memory used stays bounded'''
+        if executor == None:
+            aes = self.db.aes
+            searchKey = cipherdb.searchKeyOf(aes)
+            for files in batches:
+                yield files, readNotes(aes, searchKey, self.encoding, self.db.compressed, [path for path, _, _ in files])
+            return
+        pending = deque()
+        for files in batches:
+            pending.append((files, executor.submit(readFiles, [path for path, _, _ in files])))
+            if len(pending) > 2 * workers:
+                files, future = pending.popleft()
+                yield files, future.result()
+        while pending:
+            files, future = pending.popleft()
+            yield files, future.result()
+
+def importDirectory(db:cipherdb.CiperDatabase, directory:str, parentid:int=cipherdb.ID_ROOT, workers:int=1,
+        extensions=DEFAULT_EXTENSIONS, encoding:str=DEFAULT_ENCODING, progress=None) -> dict:
+    '''import the directory as a folder of parentid, see the module docstring.
+    workers: processes reading and encrypting the files if more than 1, this process does it otherwise
+    extensions: the files imported, the others are ignored. encoding: of the files, those which cannot be decoded fail
+    progress(done, found): files imported or failed and files found by the walk so far, called after each batch.
+    return {'files', 'folders': directories imported, 'skipped': files imported before, 'ignored': files of other types,
+    'failed': [(path, error message), ...], 'bytes': of the files imported, 'seconds'}'''
+    if not os.path.isdir(directory):
+        raise NotADirectoryError(f'not a directory: {directory}')
+    return DirectoryImporter(db, directory, parentid, extensions, encoding, progress).run(workers)
+
+def formatStats(stats:dict) -> str:
+    '''the statistics of importDirectory() with the throughput, as text'''
+    seconds = max(stats['seconds'], 1e-6)
+    return (f"{stats['files']} files, {stats['folders']} directories, {stats['skipped']} skipped as imported before, "
+        f"{stats['ignored']} ignored, {len(stats['failed'])} failed, {stats['bytes'] / 2**20:.1f} MB, {seconds:.2f} s, "
+        f"{stats['files'] / seconds:.0f} files/s")
@@ -11,6 +11,7 @@ Requires: PyQt5
 from Crypto import Random
 from binascii import b2a_hex, a2b_hex
 from Crypto.Cipher import AES
+from itertools import accumulate
 class AESCipher:
     """
     pip install pycryptodome
@@ -34,24 +35,38 @@ class AESCipher:
             len2extend = 16 - keylen%16
             key = key + '*'*len2extend
         self.key, self.mode, self.iv = key.encode(), mode, iv
+        #ECB mode keeps no state between blocks, so the key schedule is done once and the cryptor is reused
+        self.cryptor = AES.new(key=self.key, mode=self.mode) if self.mode == AES.MODE_ECB else None
+
+    def __getstate__(self):
+        """ the cryptor of pycryptodome cannot be pickled, drop it so that the object can be sent to another process """
+        state = self.__dict__.copy()
+        state['cryptor'] = None
+        return state
+
+    def __setstate__(self, state):
+        """ rebuild the cryptor dropped by __getstate__ """
+        self.__dict__.update(state)
+        self.cryptor = AES.new(key=self.key, mode=self.mode) if self.mode == AES.MODE_ECB else None
+
+    def __getCryptor(self):
+        """ return the cached cryptor for ECB, a new one for CBC since it is chained by the iv """
+        if self.cryptor:
+            return self.cryptor
+        return AES.new(key=self.key, mode=self.mode, iv=self.iv)
 
     def __extendTo16Bytes(self, text:str):
         """ The length of the string should be a multiple of 16, if not, extend it with \0 """
-        if len(text.encode()) % 16:
-            extension = 16 - (len(text.encode()) % 16)
-        else:
-            extension = 0
-        text += ("\0" * extension)
-        return text.encode()
+        return self.__pad(text.encode())
+
+    def __pad(self, data:bytes) -> bytes:
+        """ extend the bytes with \0 to a multiple of 16 """
+        extension = -len(data) % 16
+        return data + b"\0" * extension
         
     def encrypt(self, text:str) -> str:
         """ encrypt the string with AES """
-        # it is necessary to create a new AES instance
-        if self.mode == AES.MODE_ECB:
-            cryptos = AES.new(key=self.key, mode=self.mode)
-        elif self.mode == AES.MODE_CBC:
-            cryptos = AES.new(key=self.key, mode=self.mode, iv=self.iv)
-        cipher_text = cryptos.encrypt(self.__extendTo16Bytes(text))
+        cipher_text = self.encryptRaw(text)
         # the characters of the cipher text is not necessarily ascii characters,
         # convert it to a hex string
         
@@ -61,14 +76,68 @@ class AESCipher:
 
     def decrypt(self, text:str) -> str:
         """ decryption and delete the extended \0 """
-        # it is necessary to create a new AES instance
-        if self.mode == AES.MODE_ECB:
-            cryptos = AES.new(key=self.key, mode=self.mode)
-        elif self.mode == AES.MODE_CBC:
-            cryptos = AES.new(key=self.key, mode=self.mode, iv=self.iv)
-        plain_text = cryptos.decrypt(a2b_hex(text))
+        return self.decryptRaw(a2b_hex(text))
+
+    def encryptRaw(self, text:str) -> bytes:
+        """ encrypt the string with AES, the cipher text is returned as bytes, which can be saved as a BLOB """
+        return self.__getCryptor().encrypt(self.__extendTo16Bytes(text))
+
+    def decryptRaw(self, data:bytes) -> str:
+        """ decrypt the cipher text given as bytes and delete the extended \0 """
+        plain_text = self.__getCryptor().decrypt(data)
         return bytes.decode(plain_text).rstrip("\0")
 
+    def __encryptJoined(self, datas:list) -> tuple:
+        """ encrypt all the plain texts given as bytes by one call of the cryptor, ECB mode only
+        return the joined cipher text and the end offset of each plain text in it """
+        padded = [self.__pad(data) for data in datas]
+        return self.cryptor.encrypt(b"".join(padded)), list(accumulate(len(data) for data in padded))
+
+    def __decryptJoined(self, data:bytes, lengths:list) -> list:
+        """ decrypt the joined cipher text by one call of the cryptor and split it by lengths, ECB mode only
+        the plain texts are returned as bytes, padding included """
+        plain_text = self.cryptor.decrypt(data)
+        ends = list(accumulate(lengths))
+        return [plain_text[start:end] for start, end in zip([0] + ends, ends)]
+
+    def encryptMany(self, texts:list) -> list:
+        """ encrypt a list of strings, same result as calling encrypt() for each of them
+        for ECB mode all the strings are encrypted by one call of the cryptor and hexed in one pass """
+        if not self.cryptor:
+            return [self.encrypt(text) for text in texts]
+        cipher_text, ends = self.__encryptJoined([text.encode() for text in texts])
+        hexed = b2a_hex(cipher_text).decode('ascii')
+        return [hexed[start * 2:end * 2] for start, end in zip([0] + ends, ends)]
+
+    def decryptMany(self, texts:list) -> list:
+        """ decrypt a list of hex strings, same result as calling decrypt() for each of them
+        for ECB mode all the strings are unhexed and decrypted in one pass """
+        if not self.cryptor:
+            return [self.decrypt(text) for text in texts]
+        plain_texts = self.__decryptJoined(a2b_hex("".join(texts)), [len(text) // 2 for text in texts])
+        return [bytes.decode(plain_text).rstrip("\0") for plain_text in plain_texts]
+
+    def encryptManyRaw(self, texts:list) -> list:
+        """ same as encryptMany(), the cipher texts are returned as bytes """
+        return self.encryptManyBytes([text.encode() for text in texts])
+
+    def decryptManyRaw(self, datas:list) -> list:
+        """ same as decryptMany(), the cipher texts are given as bytes """
+        return [bytes.decode(plain_text).rstrip("\0") for plain_text in self.decryptManyBytes(datas)]
+
+    def encryptManyBytes(self, datas:list) -> list:
+        """ same as encryptManyRaw(), the plain texts are given as bytes, e.g. compressed by notecodec """
+        if not self.cryptor:
+            return [self.__getCryptor().encrypt(self.__pad(data)) for data in datas]
+        cipher_text, ends = self.__encryptJoined(datas)
+        return [cipher_text[start:end] for start, end in zip([0] + ends, ends)]
+
+    def decryptManyBytes(self, datas:list) -> list:
+        """ same as decryptManyRaw(), the plain texts are returned as bytes and keep the \0 of the padding """
+        if not self.cryptor:
+            return [self.__getCryptor().decrypt(data) for data in datas]
+        return self.__decryptJoined(b"".join(datas), [len(data) for data in datas])
+
 
 if __name__ == '__main__':
     passwd = 'HiJared@2022'
@@ -0,0 +1,95 @@
+# -*- encoding: utf-8 -*-
+'''
+compress-then-encrypt codec of the notes, between CiperDatabase and AESCipher: a text is compressed before it is
+encrypted, by a codec chosen by its size, tiny texts and the texts which do not compress are encrypted as they are:
+    values = notecodec.encodeMany(aes, texts)
+    texts = notecodec.decodeMany(aes, values)
+the codec is tagged in each value: AESCipher gives cipher texts whose length is a multiple of the AES block,
+a compressed text gets one more byte holding its codec. So the values saved before, and those encrypted by AESCipher
+directly, e.g. the folder names, have no tag and are decoded as they are
+Author: Jared Yu
+Contect: hfyu.hzcn@gmail.com
+Version: 1.0
+Update: 2023-3-16
+Requires: pycryptodome
+'''
+import zlib
+import lzma
+
+CODEC_RAW = 0 #not compressed, the value has no tag
+CODEC_ZLIB = 1 #raw deflate stream
+CODEC_LZMA = 2 #raw LZMA2 stream
+
+#the codec is chosen by the size of the text in UTF-8
+COMPRESS_MIN_BYTES = 128 #smaller texts are not compressed, they would save a block of AES at most
+LZMA_MIN_BYTES = 32 * 1024 #larger texts are compressed by lzma, about 6% smaller than by zlib but decompressed 5 times slower
+ZLIB_LEVEL = 6
+#a chunk of a note has at most 64K characters, a larger dictionary would only take longer to set up
+LZMA_FILTERS = [{'id': lzma.FILTER_LZMA2, 'preset': 6, 'dict_size': 256 * 1024}]
+
+BLOCK_SIZE = 16 #of AES, the length of a cipher text is a multiple of it
+
+def codecOf(size:int) -> int:
+    '''the codec of a text of so many bytes'''
+    if size < COMPRESS_MIN_BYTES:
+        return CODEC_RAW
+    return CODEC_LZMA if size >= LZMA_MIN_BYTES else CODEC_ZLIB
+
+def compress(data:bytes, codec:int) -> bytes:
+    '''compress the data by the codec, CODEC_ZLIB or CODEC_LZMA'''
+    if codec == CODEC_ZLIB:
+        compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+    return lzma.compress(data, lzma.FORMAT_RAW, filters=LZMA_FILTERS)
+
+def decompress(data:bytes, codec:int) -> bytes:
+    '''decompress the data compressed by compress(). the streams mark their end, so the \\0 padding the data
+    to the AES block is left over by the decompressor. ValueError is raised if the codec is unknown'''
+    if codec == CODEC_ZLIB:
+        return zlib.decompressobj(-zlib.MAX_WBITS).decompress(data)
+    if codec == CODEC_LZMA:
+        return lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=LZMA_FILTERS).decompress(data)
+    raise ValueError(f'unknown codec {codec}')
+
+def paddedLength(size:int) -> int:
+    '''length of the cipher text of so many bytes'''
+    return size + -size % BLOCK_SIZE
+
+def encodeMany(aes, texts:list, compressed:bool=True) -> list:
+    '''compress and encrypt the texts, return the values to save. a text is compressed only if the value is
+    at least one AES block shorter. compressed: False to encrypt the texts as they are, as AESCipher.encryptManyRaw()'''
+    if not compressed:
+        return aes.encryptManyRaw(texts)
+    datas, codecs = [], []
+    for text in texts:
+        data = text.encode()
+        codec = codecOf(len(data))
+        if codec != CODEC_RAW:
+            packed = compress(data, codec)
+            if paddedLength(len(packed)) + 1 < paddedLength(len(data)):
+                data = packed
+            else:
+                codec = CODEC_RAW
+        datas.append(data)
+        codecs.append(codec)
+    return [value if codec == CODEC_RAW else value + bytes([codec]) for value, codec in zip(aes.encryptManyBytes(datas), codecs)]
+
+def decodeMany(aes, values:list) -> list:
+    '''decrypt and decompress the values given by encodeMany() or by AESCipher.encryptManyRaw(), return the texts'''
+    if all(len(value) % BLOCK_SIZE == 0 for value in values):
+        return aes.decryptManyRaw(values)
+    codecs = [value[-1] if len(value) % BLOCK_SIZE else CODEC_RAW for value in values]
+    datas = aes.decryptManyBytes([value[:-1] if codec != CODEC_RAW else value for value, codec in zip(values, codecs)])
+    return [(data.rstrip(b'\0') if codec == CODEC_RAW else decompress(data, codec)).decode() for data, codec in zip(datas, codecs)]
+
+def encode(aes, text:str, compressed:bool=True) -> bytes:
+    '''see encodeMany()'''
+    return encodeMany(aes, [text], compressed)[0]
+
+def decode(aes, value:bytes) -> str:
+    '''see decodeMany()'''
+    return decodeMany(aes, [value])[0]
+
+def isCompressed(value:bytes) -> bool:
+    '''if the value is tagged by a codec'''
+    return len(value) % BLOCK_SIZE != 0
@@ -0,0 +1,355 @@
+# -*- encoding: utf-8 -*-
+'''
+command line interface of the cipher notebook, run "python passnotecli.py -h" for the commands.
+It never imports PyQt5, so it starts fast enough for shell pipelines and cron jobs:
+    PASSNOTE_PASSWORD=... python passnotecli.py cat Finance/Banks/BMO
+The functions are an API for scripts as well:
+    db = passnotecli.openNotebook('passnote.db', passwd)
+    text = passnotecli.readNote(db, passnotecli.findFolder(db, 'Finance/Banks/BMO'))
+Author: Jared Yu
+Contect: hfyu.hzcn@gmail.com
+Version: 1.0
+Update: 2023-3-12
+Requires: pycryptodome
+'''
+import os
+import sys
+import json
+import getpass
+import argparse
+import logging
+import cipherdb
+import archive
+import dirimport
+
+ENV_DATABASE = 'PASSNOTE_DB' #database file used when none is given by --db
+ENV_PASSWORD = 'PASSNOTE_PASSWORD' #password of the database, asked on the terminal if not set
+ENV_NEW_PASSWORD = 'PASSNOTE_NEW_PASSWORD' #new password for the command rekey, asked on the terminal if not set
+ENV_ARCHIVE_PASSWORD = 'PASSNOTE_ARCHIVE_PASSWORD' #password of the archive for backup and restore, asked on the terminal if not set
+CONFIG_FILE = 'config.json' #config of the GUI, its database is used when neither --db nor PASSNOTE_DB is given
+CFG_DBFILE = 'database'
+PATH_SEPARATOR = '/' #between the folder names of a path, e.g. Finance/Banks/BMO
+ID_PREFIX = '#' #a part of a path written as #folderid, e.g. for a folder whose name holds the separator
+
+class NotebookError(Exception):
+    '''a command cannot be done, e.g. the password is wrong or a folder does not exist'''
+
+def defaultDatabase() -> str:
+    '''the database given by PASSNOTE_DB, otherwise the one of the GUI config, None if there is neither'''
+    if os.environ.get(ENV_DATABASE):
+        return os.environ[ENV_DATABASE]
+    try:
+        with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), CONFIG_FILE), 'r') as f:
+            config = json.load(f)
+        #the GUI saves the config as a JSON string holding the JSON of the dict
+        return (json.loads(config) if isinstance(config, str) else config).get(CFG_DBFILE)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def readPassword(envName:str, prompt:str, confirm:bool=False) -> str:
+    '''the password from the environment variable, otherwise asked on the terminal, twice if confirm'''
+    if os.environ.get(envName) != None:
+        return os.environ[envName]
+    passwd = getpass.getpass(prompt)
+    if confirm and getpass.getpass('Again: ') != passwd:
+        raise NotebookError("passwords don't match")
+    return passwd
+
+def openNotebook(filename:str, passwd:str, journalMode:str=None, synchronous:str=None) -> cipherdb.CiperDatabase:
+    '''open an existing database and verify the password, see CiperDatabase.openDatabase() for the other parameters'''
+    if not filename or not os.path.isfile(filename):
+        raise NotebookError(f'database not found: {filename}')
+    db = cipherdb.CiperDatabase(filename)
+    if not db.openDatabase(filename, journalMode, synchronous):
+        raise NotebookError(f'cannot open database {filename}')
+    if not db.verifyPasswd(passwd):
+        db.closeDatabase()
+        raise NotebookError('wrong password')
+    return db
+
+def findFolder(db:cipherdb.CiperDatabase, path:str, create:bool=False) -> int:
+    '''the folderid of a path of folder names, ID_ROOT for an empty path. a part may be #folderid instead of a name.
+    the first folder with the name is taken if several have it
+    create: create the missing folders of the path instead of raising NotebookError'''
+    folderid = cipherdb.ID_ROOT
+    for name in [name for name in path.split(PATH_SEPARATOR) if name]:
+        children = db.folderChildren(folderid)
+        if name.startswith(ID_PREFIX) and name[1:].isdigit() and int(name[1:]) in children:
+            folderid = int(name[1:])
+            continue
+        found = [childid for childid in children if db.folderName(childid) == name]
+        if found:
+            folderid = found[0]
+        elif create:
+            folderid = db.insertFolders(name, folderid)
+        else:
+            raise NotebookError(f'folder not found: {path}')
+    return folderid
+
+def folderPathName(db:cipherdb.CiperDatabase, folderid:int) -> str:
+    '''the path of folder names of a folder, the reverse of findFolder()'''
+    return PATH_SEPARATOR.join(db.folderName(folderid) for folderid in db.folderPath(folderid))
+
+def walkFolders(db:cipherdb.CiperDatabase, folderid:int=cipherdb.ID_ROOT, recursive:bool=True):
+    '''generator, yield the folderids below the folder in the order of a listing:
+    the children sorted by name, each one followed by its own subtree if recursive'''
+    pending = [iter(sorted(db.folderChildren(folderid), key=db.folderName))]
+    while pending:
+        childid = next(pending[-1], None)
+        if childid == None:
+            pending.pop()
+            continue
+        yield childid
+        if recursive:
+            pending.append(iter(sorted(db.folderChildren(childid), key=db.folderName)))
+
+def readNote(db:cipherdb.CiperDatabase, folderid:int) -> str:
+    '''the note of the folder, empty if it has none'''
+    return db.readTextByFolderid(folderid)[1]
+
+def writeNote(db:cipherdb.CiperDatabase, folderid:int, text:str) -> None:
+    '''replace the note of the folder, it is created if the folder has none'''
+    textid = db.readTextByFolderid(folderid)[0]
+    if textid == cipherdb.ID_ROOT:
+        db.insertTexts(text, folderid)
+    else:
+        db.updateTextsTextByTextid(textid, text)
+
+def exportNotes(db:cipherdb.CiperDatabase, out) -> int:
+    '''write every folder with its note in plain text to the file out, one JSON object per line:
+    {"id": folderid, "parentid": parentid, "path": [names], "text": note}, a parent comes before its children.
+    return the number of folders written'''
+    count = 0
+    for folderid in walkFolders(db):
+        path = db.folderPath(folderid)
+        record = {'id': folderid, 'parentid': path[-2] if len(path) > 1 else cipherdb.ID_ROOT,
+            'path': [db.folderName(ancestor) for ancestor in path], 'text': readNote(db, folderid)}
+        out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+def commandLs(db:cipherdb.CiperDatabase, args) -> None:
+    '''list the folders below a folder'''
+    parentid = findFolder(db, args.path)
+    for folderid in walkFolders(db, parentid, args.recursive):
+        name = folderPathName(db, folderid) if args.recursive else db.folderName(folderid)
+        print(f'{folderid}\t{name}' if args.long else name)
+
+def commandCat(db:cipherdb.CiperDatabase, args) -> None:
+    '''write the note of a folder to stdout, a big note is written chunk by chunk as it is decrypted'''
+    stream = db.streamTextByFolderid(findFolder(db, args.path))
+    next(stream) #textid, dateCreate, dateEdit
+    for chunk in stream:
+        sys.stdout.write(chunk)
+
+def commandPut(db:cipherdb.CiperDatabase, args) -> None:
+    '''replace the note of a folder by the text of a file or stdin'''
+    if args.file == '-':
+        text = sys.stdin.read()
+    else:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            text = f.read()
+    with db.batch():
+        folderid = findFolder(db, args.path, args.parents)
+        if folderid == cipherdb.ID_ROOT:
+            raise NotebookError('the root has no note, give a folder')
+        writeNote(db, folderid, text)
+
+def commandMv(db:cipherdb.CiperDatabase, args) -> None:
+    '''move folders into another folder'''
+    if not db.moveSubtree([findFolder(db, path) for path in args.sources], findFolder(db, args.dest)):
+        raise NotebookError(f'cannot move a folder into its own subtree: {args.dest}')
+
+def commandCp(db:cipherdb.CiperDatabase, args) -> None:
+    '''copy folders with their notes into another folder'''
+    db.copySubtree([findFolder(db, path) for path in args.sources], findFolder(db, args.dest))
+
+def commandSearch(db:cipherdb.CiperDatabase, args) -> None:
+    '''print the paths of the folders found, by the search index or by decrypting every note'''
+    if args.scan or args.regex:
+        paths = [path for found in db.scanNotes(args.query, args.regex, args.workers) for path in found]
+    else:
+        paths = db.searchNotes(args.query)
+    for path in paths:
+        print(folderPathName(db, path[-1]))
+
+def commandRekey(db:cipherdb.CiperDatabase, args) -> None:
+    '''re-encrypt the database with a new password'''
+    passwd = readPassword(ENV_NEW_PASSWORD, 'New password: ', confirm=True)
+    if not db.changePasswd(passwd, None, args.workers):
+        raise NotebookError('FAILED to set the new password, the database keeps the old one')
+
+def commandExport(db:cipherdb.CiperDatabase, args) -> None:
+    '''export the notes in plain text, see exportNotes()'''
+    if args.output == '-':
+        count = exportNotes(db, sys.stdout)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            count = exportNotes(db, f)
+    logging.info(f'{count} folders exported')
+
+def commandBackup(db:cipherdb.CiperDatabase, args) -> None:
+    '''write a folder and its subtree, or the whole notebook, to an encrypted archive, see archive.exportArchive()'''
+    folderid = findFolder(db, args.path)
+    passwd = readPassword(ENV_ARCHIVE_PASSWORD, 'Archive password: ', confirm=True)
+    try:
+        if args.archive == '-':
+            stats = archive.exportArchive(db, sys.stdout.buffer, passwd, folderid, not args.no_compress)
+        else:
+            with open(args.archive, 'wb') as f:
+                stats = archive.exportArchive(db, f, passwd, folderid, not args.no_compress)
+    except OSError as e:
+        raise NotebookError(f'cannot write {args.archive}: {e.strerror}')
+    print(f'exported {archive.formatStats(stats)}', file=sys.stderr)
+
+def commandRestore(db:cipherdb.CiperDatabase, args) -> None:
+    '''import an archive written by backup into a folder, see archive.importArchive()'''
+    folderid = findFolder(db, args.path, args.parents)
+    passwd = readPassword(ENV_ARCHIVE_PASSWORD, 'Archive password: ')
+    try:
+        if args.archive == '-':
+            stats = archive.importArchive(db, sys.stdin.buffer, passwd, folderid)
+        else:
+            with open(args.archive, 'rb') as f:
+                stats = archive.importArchive(db, f, passwd, folderid)
+    except archive.ArchiveError as e:
+        raise NotebookError(str(e))
+    except OSError as e:
+        raise NotebookError(f'cannot read {args.archive}: {e.strerror}')
+    print(f'imported {archive.formatStats(stats)}', file=sys.stderr)
+
+def commandImportDir(db:cipherdb.CiperDatabase, args) -> None:
+    '''import a directory tree of text files, see dirimport.importDirectory()'''
+    folderid = findFolder(db, args.path, args.parents)
+    try:
+        stats = dirimport.importDirectory(db, args.directory, folderid, args.workers, args.ext, args.encoding,
+            lambda done, found: logging.info(f'{done} files imported, {found} found'))
+    except OSError as e:
+        raise NotebookError(str(e))
+    for path, error in stats['failed']:
+        print(f'FAILED {path}: {error}', file=sys.stderr)
+    print(f'imported {dirimport.formatStats(stats)}', file=sys.stderr)
+    if stats['failed']:
+        raise NotebookError(f"{len(stats['failed'])} files or directories could not be imported, run it again once fixed, e.g. with --encoding")
+
+def commandCompress(db:cipherdb.CiperDatabase, args) -> None:
+    '''compress the notes saved uncompressed, or decompress them all, then compact the database'''
+    db.compressed = not args.off
+    before = db.databaseStats()['bytes']
+    counts = db.recompressNotes()
+    db.compactDatabase()
+    after = db.databaseStats()['bytes']
+    print(f"{counts['rewritten']} of {counts['records']} records rewritten, database {before / 2**20:.1f} MB -> {after / 2**20:.1f} MB", file=sys.stderr)
+
+def commandStats(db:cipherdb.CiperDatabase, args) -> None:
+    '''print the size of the database, see CiperDatabase.databaseStats()'''
+    stats = db.databaseStats()
+    if args.json:
+        print(json.dumps(stats))
+    else:
+        for key, value in stats.items():
+            print(f'{key}\t{value}')
+
+def parseArguments(argv:list) -> argparse.Namespace:
+    '''parse the command line, argv without the program name'''
+    parser = argparse.ArgumentParser(description='command line interface of the cipher notebook. '
+        f'the password is read from {ENV_PASSWORD}, or asked on the terminal if it is not set. '
+        f'a path is a list of folder names separated by {PATH_SEPARATOR}, a name may be written as {ID_PREFIX}folderid')
+    parser.add_argument('--db', default=None, help=f'database file, {ENV_DATABASE} or the database of {CONFIG_FILE} by default')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log the progress to stderr')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sub = subparsers.add_parser('ls', help='list the folders below a folder')
+    sub.add_argument('path', nargs='?', default='')
+    sub.add_argument('-r', '--recursive', action='store_true', help='list the whole subtree, with the paths')
+    sub.add_argument('-l', '--long', action='store_true', help='show the folderids')
+    sub.set_defaults(func=commandLs)
+
+    sub = subparsers.add_parser('cat', help='print the note of a folder')
+    sub.add_argument('path')
+    sub.set_defaults(func=commandCat)
+
+    sub = subparsers.add_parser('put', help='replace the note of a folder')
+    sub.add_argument('path')
+    sub.add_argument('file', nargs='?', default='-', help='file holding the note, stdin by default')
+    sub.add_argument('-p', '--parents', action='store_true', help='create the folders of the path which do not exist')
+    sub.set_defaults(func=commandPut)
+
+    sub = subparsers.add_parser('mv', help='move folders into another folder')
+    sub.add_argument('sources', nargs='+')
+    sub.add_argument('dest')
+    sub.set_defaults(func=commandMv)
+
+    sub = subparsers.add_parser('cp', help='copy folders with their notes into another folder')
+    sub.add_argument('sources', nargs='+')
+    sub.add_argument('dest')
+    sub.set_defaults(func=commandCp)
+
+    sub = subparsers.add_parser('search', help='print the folders whose name or note holds all the words of the query')
+    sub.add_argument('query')
+    sub.add_argument('--scan', action='store_true', help='find the query as a substring by decrypting every note')
+    sub.add_argument('--regex', action='store_true', help='the query is a regular expression, implies --scan')
+    sub.add_argument('--workers', type=int, default=1, help='processes decrypting the notes for --scan')
+    sub.set_defaults(func=commandSearch)
+
+    sub = subparsers.add_parser('rekey', help=f'set a new password, read from {ENV_NEW_PASSWORD} or asked on the terminal')
+    sub.add_argument('--workers', type=int, default=1, help='processes re-encrypting the database')
+    sub.set_defaults(func=commandRekey)
+
+    sub = subparsers.add_parser('export', help='write all the folders and notes in PLAIN TEXT as JSON lines')
+    sub.add_argument('-o', '--output', default='-', help='output file, stdout by default')
+    sub.set_defaults(func=commandExport)
+
+    sub = subparsers.add_parser('backup', help=f'write the notebook or a folder to an encrypted archive, its password is read from {ENV_ARCHIVE_PASSWORD} or asked on the terminal')
+    sub.add_argument('archive', help='archive file, - for stdout')
+    sub.add_argument('path', nargs='?', default='', help='folder written with its subtree, the whole notebook by default')
+    sub.add_argument('--no-compress', action='store_true', help='do not compress the archive, e.g. for notes already compressed')
+    sub.set_defaults(func=commandBackup)
+
+    sub = subparsers.add_parser('restore', help='import an archive written by backup, the folders and notes get new ids')
+    sub.add_argument('archive', help='archive file, - for stdin')
+    sub.add_argument('path', nargs='?', default='', help='folder receiving the top folders of the archive, the root by default')
+    sub.add_argument('-p', '--parents', action='store_true', help='create the folders of the path which do not exist')
+    sub.set_defaults(func=commandRestore)
+
+    sub = subparsers.add_parser('importdir', help='import a directory tree of text files, the directories become folders, '
+        'the files folders holding their text. run it again to resume an interrupted import')
+    sub.add_argument('directory')
+    sub.add_argument('path', nargs='?', default='', help='folder receiving the directory, the root by default')
+    sub.add_argument('-p', '--parents', action='store_true', help='create the folders of the path which do not exist')
+    sub.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processes reading and encrypting the files')
+    sub.add_argument('--ext', nargs='+', default=dirimport.DEFAULT_EXTENSIONS, help='extensions of the files imported')
+    sub.add_argument('--encoding', default=dirimport.DEFAULT_ENCODING, help='encoding of the files')
+    sub.set_defaults(func=commandImportDir)
+
+    sub = subparsers.add_parser('compress', help='compress the notes saved before compression was added, then compact the database')
+    sub.add_argument('--off', action='store_true', help='decompress all the notes instead')
+    sub.set_defaults(func=commandCompress)
+
+    sub = subparsers.add_parser('stats', help='number of records and size of the database')
+    sub.add_argument('--json', action='store_true')
+    sub.set_defaults(func=commandStats)
+    return parser.parse_args(argv)
+
+def main(argv:list=None) -> int:
+    '''run a command, return the exit status: 0 if done, 1 if it failed'''
+    args = parseArguments(sys.argv[1:] if argv == None else argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    db = None
+    try:
+        db = openNotebook(args.db or defaultDatabase(), readPassword(ENV_PASSWORD, 'Password: '))
+        args.func(db, args)
+        sys.stdout.flush()
+    except NotebookError as e:
+        print(f'{os.path.basename(sys.argv[0])}: {e}', file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        #the reader of the pipe is gone, e.g. "| head", python must not write the rest of stdout at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    finally:
+        if db != None:
+            db.closeDatabase()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
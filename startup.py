@@ -0,0 +1,115 @@
+# -*- encoding: utf-8 -*-
+'''
+startup profiler of the GUI: the phases of the start are marked with their time since ciphernote.main() was entered,
+the imports are timed if asked. "python ciphernote.py --profile-startup" prints the breakdown and exits
+Author: Jared Yu
+Contect: hfyu.hzcn@gmail.com
+Version: 1.0
+Update: 2023-3-13
+Requires: None
+'''
+import sys
+import time
+import builtins
+import logging
+from contextlib import contextmanager
+
+MARK_FIRST_PAINT = 'first paint' #the main window is painted for the first time
+MARK_INTERACTIVE = 'interactive' #the folders of the database are shown, or no database could be loaded
+IMPORT_REPORT_MS = 1.0 #imports taking less are not printed
+
+class StartupProfiler():
+    '''the times of the phases of the start, the time spent waiting for the user, e.g. in the password dialog,
+    is kept apart so that the numbers do not depend on how fast the password is typed'''
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks = [] #[name, milliseconds since start, milliseconds waited before], in the order they are made
+        self.waited = 0.0 #milliseconds spent waiting for the user
+        self.imports = [] #[depth, module name, milliseconds], in the order the imports end
+        self.importDepth = 0
+        self.originalImport = None
+
+    def restart(self) -> None:
+        '''the start is now, the marks made before are dropped'''
+        self.__init__()
+
+    def elapsed(self) -> float:
+        '''milliseconds since the start'''
+        return (time.perf_counter() - self.start) * 1000
+
+    def mark(self, name:str) -> None:
+        '''a phase ends now, only the first mark of a name is kept'''
+        if name not in [mark[0] for mark in self.marks]:
+            self.marks.append([name, self.elapsed(), self.waited])
+            if name in (MARK_FIRST_PAINT, MARK_INTERACTIVE):
+                logging.info(f'startup: {name} after {self.netOf(name):.1f} ms')
+
+    def netOf(self, name:str) -> float:
+        '''milliseconds from the start to the mark, without the time waited for the user, None if it is not marked'''
+        for mark, elapsed, waited in self.marks:
+            if mark == name:
+                return elapsed - waited
+        return None
+
+    @contextmanager
+    def waiting(self):
+        '''the time spent in the with-block, e.g. a dialog, is not counted as startup time'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.waited += (time.perf_counter() - start) * 1000
+
+    def traceImports(self) -> None:
+        '''time the imports of the modules which are not loaded yet, from now until untraceImports()'''
+        if self.originalImport == None:
+            self.originalImport = builtins.__import__
+            builtins.__import__ = self.__tracedImport
+
+    def untraceImports(self) -> None:
+        '''stop timing the imports'''
+        if self.originalImport != None:
+            builtins.__import__ = self.originalImport
+            self.originalImport = None
+
+    def __tracedImport(self, name, globals=None, locals=None, fromlist=(), level=0):
+        '''replacement of builtins.__import__, a module already loaded costs nothing and is not recorded'''
+        if level != 0 or name in sys.modules:
+            return self.originalImport(name, globals, locals, fromlist, level)
+        self.importDepth += 1
+        start = time.perf_counter()
+        try:
+            return self.originalImport(name, globals, locals, fromlist, level)
+        finally:
+            self.importDepth -= 1
+            self.imports.append([self.importDepth, name, (time.perf_counter() - start) * 1000])
+
+    def report(self) -> str:
+        '''the imports and the phases, as text'''
+        lines = ['startup profile, milliseconds since ciphernote.main() was entered']
+        if self.imports:
+            lines.append(f'imports taking {IMPORT_REPORT_MS} ms or more, nested imports indented, times include them:')
+            #an import ends after its nested imports, which are the deeper records recorded since the previous one of its depth
+            pending = []
+            for depth, name, milliseconds in self.imports:
+                children = [record for record in pending if record[0][0] > depth]
+                pending = [record for record in pending if record[0][0] <= depth] + [[[depth, name, milliseconds], children]]
+            def walk(records):
+                for (depth, name, milliseconds), children in records:
+                    if milliseconds >= IMPORT_REPORT_MS:
+                        lines.append(f'{milliseconds:>9.1f}  {"  " * depth}{name}')
+                        walk(children)
+            walk(pending)
+        lines.append(f'{"phase":<20} {"ms":>9} {"delta":>9}')
+        previous = 0.0
+        for name, elapsed, waited in self.marks:
+            lines.append(f'{name:<20} {elapsed - waited:>9.1f} {elapsed - waited - previous:>9.1f}')
+            previous = elapsed - waited
+        if self.waited:
+            lines.append(f'{self.waited:.1f} ms waiting for the user are not counted')
+        for name in (MARK_FIRST_PAINT, MARK_INTERACTIVE):
+            if self.netOf(name) != None:
+                lines.append(f'time to {name}: {self.netOf(name):.1f} ms')
+        return '\n'.join(lines)
+
+profiler = StartupProfiler() #the profiler of this process, marked by ciphernote and window
@@ -8,8 +8,8 @@ Update: 2023-2-22
 Requires: PyQt5
 '''
 from PyQt5.QtWidgets import QWidget, QTreeWidget, QTextEdit, QAction, QMenu, QAbstractItemView, QInputDialog, QTreeWidgetItem
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QDrag
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtGui import QDrag, QTextCursor, QBrush, QColor
 import cipherdb
 import logging
 
@@ -22,14 +22,71 @@ class TextEdit(QTextEdit):
         self.textid = cipherdb.ID_ROOT
         self.ifTextChanged = False
         self.db = None
+        self.dirtyRanges = [] #[start, end, length saved], ranges of the document changed since saved, in UTF-16 code units
+        self.savedLength = 0 #UTF-16 length of the text saved
+        self.document().contentsChange.connect(self.__contentsChange)
     def setDatabaseHandle(self, db) -> None:
-        '''for the main window to pass the database handler'''
+        '''for the main window to pass the database service'''
         self.db = db
     def setNewPlainText(self, folderid:int, textid:int, text:str) -> None:
         '''set new content with textid and folderid'''
         self.folderid, self.textid = folderid, textid
         self.setPlainText(text)
         self.ifTextChanged = False
+        self.setSaved(cipherdb.utf16Length(text))
+    def appendTextChunk(self, text:str) -> None:
+        '''append a chunk of the note being loaded progressively, it is not recorded as an edit'''
+        undoRedo = self.isUndoRedoEnabled()
+        self.setUndoRedoEnabled(False)
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        self.setUndoRedoEnabled(undoRedo)
+        self.ifTextChanged = False
+        self.setSaved(self.savedLength + cipherdb.utf16Length(text))
+    def setSaved(self, length:int) -> None:
+        '''the content is the same as the text saved, whose UTF-16 length is given'''
+        self.savedLength = length
+        self.dirtyRanges = []
+    def __contentsChange(self, position:int, removed:int, added:int) -> None:
+        '''slot of QTextDocument.contentsChange, record the range changed.
+        the ranges touched by the change are merged into one, the ranges after it are moved'''
+        before, merged, after = [], [], []
+        for dirty in self.dirtyRanges:
+            if dirty[1] < position:
+                before.append(dirty)
+            elif dirty[0] > position + removed:
+                after.append([dirty[0] + added - removed, dirty[1] + added - removed, dirty[2]])
+            else:
+                merged.append(dirty)
+        start = min([position] + [dirty[0] for dirty in merged])
+        end = max([position + removed] + [dirty[1] for dirty in merged])
+        #the parts of [start, end) outside the merged ranges are unchanged since saved
+        savedLength = end - start - sum(dirty[1] - dirty[0] for dirty in merged) + sum(dirty[2] for dirty in merged)
+        self.dirtyRanges = before + [[start, end + added - removed, savedLength]] + after
+    def takeEdits(self) -> list:
+        '''return the edits done since the text was saved, [(start, end, text), ...] see cipherdb.applyEdits(),
+        the content is regarded as saved then. Ranges which are changed back, e.g. by an undo, are not returned.
+        return None if the positions of the document do not match the text saved, e.g. Qt changed its line ends,
+        the whole text has to be saved then'''
+        length = self.document().characterCount() - 1
+        if self.savedLength + sum(end - start - savedLength for start, end, savedLength in self.dirtyRanges) != length:
+            logging.debug('the document does not match the text saved')
+            self.setSaved(length)
+            return None
+        edits, shift = [], 0
+        cursor = QTextCursor(self.document())
+        for start, end, savedLength in self.dirtyRanges:
+            #a change replacing the whole document also counts the paragraph separator after the last character
+            cursor.setPosition(min(start, length))
+            cursor.setPosition(min(end, length), QTextCursor.KeepAnchor)
+            #same characters as toPlainText()
+            text = cursor.selectedText().replace('\u2029', '\n').replace('\u2028', '\n').replace('\u00a0', ' ')
+            if savedLength > 0 or text:
+                edits.append((start - shift, start - shift + savedLength, text))
+            shift += end - start - savedLength
+        self.setSaved(length)
+        return edits
     def setTextChangedFlag(self, bChanged) -> None:
         '''set a flag when the content is changed
         There supposed to be a better solution, to be optimized'''
@@ -39,27 +96,157 @@ class TextEdit(QTextEdit):
         return self.ifTextChanged
 
 class TreeWidget(QTreeWidget):
-    '''This class is for categories, internal drag and drop supported.'''
+    '''This class is for categories, internal drag and drop supported.
+    several folders may be selected and dragged at once, they are moved, or copied if Ctrl is held'''
     #define column of the folders TreeWidgetFolders
-    COL_FOLDER_ID = 1
     COL_FOLDER_NAME = 0
-    COL_FOLDER_PARENTID = 2
+    ROLE_FOLDER_ID = Qt.UserRole #the folderid is kept as an int in this data role of the name column
+    HIGHLIGHT_COLOR = QColor(255, 236, 139) #background of the folders found by a search
+    foldersLoaded = pyqtSignal() #emitted when the folders read by loadFolders() are shown
     def __init__(self, parent:QWidget=None):
         super(TreeWidget, self).__init__(parent=parent)
         self.db = None
-        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.itemsById = {} #folderid: item, for the folders loaded
+        self.highlighted = set() #folderids of the highlighted folders
+        self.highlightGeneration = 0 #incremented when the highlight is cleared, the paths still loading are dropped
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.setDragEnabled(True)
         self.viewport().setAcceptDrops(True)
         self.setDropIndicatorShown(True)
         self.setDragDropMode(QAbstractItemView.DragDrop)
+        self.setDefaultDropAction(Qt.MoveAction)
         
         
         self.setContextMenuPolicy(Qt.CustomContextMenu)
         self.customContextMenuRequested.connect(self.__openConextMenuForTree)
+        self.itemExpanded.connect(self.__itemExpanded)
         self.setActiveStatus(False) #if true, ppup menu is enabled
+        self.setLazyLoading(False)
     def setDatabaseHandle(self, db) -> None:
-        '''for the main window to pass the database handler'''
+        '''for the main window to pass the database service, a dbservice.DatabaseService'''
         self.db = db
+    def setLazyLoading(self, lazy:bool) -> None:
+        '''if lazy, only the root folders are loaded by loadFolders(),
+        the children of a folder are read from the database the first time it is expanded'''
+        self.lazyLoading = lazy
+    def loadFolders(self) -> None:
+        '''clear the tree and load the folders from the database, the folders are read in the background'''
+        self.clear()
+        self.itemsById.clear()
+        self.highlighted.clear()
+        self.setActiveStatus(False)
+        if self.lazyLoading:
+            self.db.request('readTableFoldersWithChildFlag', (cipherdb.ID_ROOT,), self.__setRootFolders, key='loadFolders', channel='loadFolders')
+        else:
+            self.db.request('readFolderTree', (), self.__setFolderTree, key='loadFolders', channel='loadFolders')
+    def __setRootFolders(self, folders:list) -> None:
+        '''callback of loadFolders() in lazy loading mode, folders: [[id, name, parentid, hasChildren], ...]'''
+        for folderid, foldername, _, hasChildren in folders:
+            self.__addFolderItem(self.invisibleRootItem(), folderid, foldername, hasChildren)
+        self.setActiveStatus(True)
+        self.foldersLoaded.emit()
+    def __setFolderTree(self, tree:dict) -> None:
+        '''callback of loadFolders(), tree: parentid: [[id, name, parentid], ...]'''
+        pending = [(cipherdb.ID_ROOT, self.invisibleRootItem())]
+        while pending:
+            parentid, parentItem = pending.pop()
+            for folderid, foldername, _ in tree.get(parentid, []):
+                pending.append((folderid, self.__addFolderItem(parentItem, folderid, foldername, False)))
+        self.setActiveStatus(True)
+        self.foldersLoaded.emit()
+    def __addFolderItem(self, parentItem:QTreeWidgetItem, folderid:int, foldername:str, hasChildren:bool) -> QTreeWidgetItem:
+        '''create an item for a folder, a placeholder child is added if the children are not loaded yet,
+        so that the expand arrow is shown'''
+        item = QTreeWidgetItem(parentItem)
+        item.setText(TreeWidget.COL_FOLDER_NAME, foldername)
+        item.setData(TreeWidget.COL_FOLDER_NAME, TreeWidget.ROLE_FOLDER_ID, folderid)
+        self.itemsById[folderid] = item
+        if hasChildren:
+            placeholder = QTreeWidgetItem(item)
+            placeholder.setFlags(Qt.NoItemFlags)
+        return item
+    def folderidOf(self, item:QTreeWidgetItem) -> int:
+        '''the folderid of an item, ID_ROOT for None, i.e. the blank area, None for a placeholder'''
+        if item == None or item == self.invisibleRootItem():
+            return cipherdb.ID_ROOT
+        return item.data(TreeWidget.COL_FOLDER_NAME, TreeWidget.ROLE_FOLDER_ID)
+    def itemOf(self, folderid:int) -> QTreeWidgetItem:
+        '''the item of a folder, None if it is not loaded'''
+        return self.itemsById.get(folderid)
+    def __isPlaceholder(self, item:QTreeWidgetItem) -> bool:
+        '''the placeholder is the only item without a folderid'''
+        return self.folderidOf(item) == None
+    def __hasPlaceholder(self, item:QTreeWidgetItem) -> bool:
+        '''if the children of the item are not loaded yet'''
+        return item != None and item.childCount() == 1 and self.__isPlaceholder(item.child(0))
+    def __isLoaded(self, item:QTreeWidgetItem, folderid:int) -> bool:
+        '''if the item of the folder is still in the tree, it may be removed or reloaded while a request is pending'''
+        return folderid == cipherdb.ID_ROOT or self.itemsById.get(folderid) is item
+    def populateChildren(self, item:QTreeWidgetItem, loaded=None) -> None:
+        '''read the children of the folder in the background if they are not loaded yet,
+        loaded() is called once they are, at once if they are loaded already'''
+        if not self.__hasPlaceholder(item):
+            if loaded:
+                loaded()
+            return
+        folderid = self.folderidOf(item)
+        logging.debug(f'load children of folder {folderid}')
+        self.db.request('readTableFoldersWithChildFlag', (folderid,), lambda children: self.__setChildren(item, folderid, children, loaded),
+            key=('readTableFoldersWithChildFlag', folderid))
+    def __setChildren(self, item:QTreeWidgetItem, folderid:int, children:list, loaded) -> None:
+        '''callback of populateChildren(), children: [[id, name, parentid, hasChildren], ...].
+        the children may be set already by a coalesced request'''
+        if not self.__isLoaded(item, folderid):
+            return
+        if self.__hasPlaceholder(item):
+            item.removeChild(item.child(0))
+            for childid, childname, _, hasChildren in children:
+                self.__addFolderItem(item, childid, childname, hasChildren)
+        if loaded:
+            loaded()
+    def __forgetItems(self, item:QTreeWidgetItem) -> None:
+        '''the item is removed from the tree, unregister it and its descendants'''
+        pending = [item]
+        while pending:
+            item = pending.pop()
+            self.itemsById.pop(self.folderidOf(item), None)
+            self.highlighted.discard(self.folderidOf(item))
+            pending += [item.child(i) for i in range(item.childCount())]
+    def highlightFolders(self, paths:list, append:bool=False) -> None:
+        '''highlight the folders found by a search, paths: given by CiperDatabase.searchNotes().
+        the ancestors of the folders are expanded, in lazy loading mode a path whose ancestors are not loaded
+        is highlighted once their children are read in the background.
+        the previous highlight is cleared unless append is True, e.g. for the next results of a scan,
+        an empty list only clears it'''
+        if not append:
+            for folderid in self.highlighted:
+                self.itemsById[folderid].setBackground(TreeWidget.COL_FOLDER_NAME, QBrush())
+            self.highlighted = set()
+            self.highlightGeneration += 1
+        generation = self.highlightGeneration
+        firstItem = None
+        for path in paths:
+            item = None
+            for folderid in path:
+                if item != None:
+                    item.setExpanded(True)
+                    if self.__hasPlaceholder(item):
+                        self.populateChildren(item, lambda path=path: generation == self.highlightGeneration and self.highlightFolders([path], True))
+                        item = None
+                        break
+                item = self.itemsById.get(folderid)
+                if item == None:
+                    break
+            if item == None:
+                continue
+            item.setBackground(TreeWidget.COL_FOLDER_NAME, QBrush(TreeWidget.HIGHLIGHT_COLOR))
+            self.highlighted.add(path[-1])
+            firstItem = firstItem or item
+        if firstItem and not append:
+            self.scrollToItem(firstItem)
+    def __itemExpanded(self, item:QTreeWidgetItem) -> None:
+        '''event handler, called when an item is expanded, load its children on demand'''
+        self.populateChildren(item)
     def setActiveStatus(self, status:bool) -> None:
         '''set a flag which indicate weather self is active.
         if inactive, the context menu will not be showed when a right clicked issued'''
@@ -101,20 +288,21 @@ class TreeWidget(QTreeWidget):
         if item == None:
             logging.debug('create a new root item')
         else:
-            logging.debug(f'create a new folder with parentid = {item.text(TreeWidget.COL_FOLDER_PARENTID)}, parentname={item.text(TreeWidget.COL_FOLDER_NAME)}')
+            logging.debug(f'create a new folder with parentid = {self.folderidOf(item)}, parentname={item.text(TreeWidget.COL_FOLDER_NAME)}')
         foldername, ok = QInputDialog.getText(self, 'New category', 'Input a new category')
         if not ok:
             return False
         
-        parentid = cipherdb.ID_ROOT if item == None else item.text(TreeWidget.COL_FOLDER_ID)
-        
-        folderid = self.db.insertFolders(foldername, parentid)
-        self.selectionModel().clear()
-        itemNew = QTreeWidgetItem(self.invisibleRootItem() if item==None else item)
-        itemNew.setText(TreeWidget.COL_FOLDER_ID, str(folderid))
-        itemNew.setText(TreeWidget.COL_FOLDER_NAME, foldername)
-        itemNew.setText(TreeWidget.COL_FOLDER_PARENTID, str(parentid))
-        itemNew.setSelected(True)
+        parentid = self.folderidOf(item)
+        parentItem = self.invisibleRootItem() if item==None else item
+        def added(folderid:int) -> None:
+            if not self.__isLoaded(parentItem, parentid):
+                return
+            self.selectionModel().clear()
+            itemNew = self.__addFolderItem(parentItem, folderid, foldername, False)
+            itemNew.setSelected(True)
+        #the children must be loaded before a new one is added
+        self.populateChildren(parentItem, lambda: self.db.request('insertFolders', (foldername, parentid), added))
 
     def __menuRenameCategoryClick(self, item:QTreeWidgetItem) -> None:
         '''handler of context menu command Rename Category'''
@@ -124,8 +312,8 @@ class TreeWidget(QTreeWidget):
         foldername, ok = QInputDialog.getText(self, 'Rename the category', 'Please input a new category name')
         if not ok:
             return False
-        folderid = item.text(TreeWidget.COL_FOLDER_ID)
-        self.db.updateTableFoldersFoldernameByFolderid(folderid, foldername)
+        folderid = self.folderidOf(item)
+        self.db.request('updateTableFoldersFoldernameByFolderid', (folderid, foldername))
         item.setText(TreeWidget.COL_FOLDER_NAME, foldername)
 
     def __menuDelCategoryClick(self, item:QTreeWidgetItem) -> None:
@@ -133,31 +321,114 @@ class TreeWidget(QTreeWidget):
         logging.debug('>>>TreeWidget.__menuDelCategoryClick')
         if item == None:
             return
-        folderid = item.text(TreeWidget.COL_FOLDER_ID)
-        self.db.updateTableFoldersDeleteFolder(folderid) #delete the record from the table
+        folderid = self.folderidOf(item)
+        self.db.request('updateTableFoldersDeleteFolder', (folderid,)) #delete the record from the table
         root = self.invisibleRootItem() #delete the item from the tree widget
+        self.__forgetItems(item)
         ( item.parent() or root ).removeChild(item)
 
     def startDrag(self, supportedActions) -> None:
         '''event handler, called when a drag-and-drop starts, overwriting the handler of the parent class'''
         logging.debug('>>>TreeWidget.startDrag')
-        self.dragedItem = self.currentItem()
         super().startDrag(supportedActions)
         # drag = QDrag(self)
         # drag.exec_(supportedActions)
+    def __draggedItems(self) -> list:
+        '''the selected items whose ancestors are not selected, the others go along with their ancestor'''
+        selected = self.selectedItems()
+        items = []
+        for item in selected:
+            parent = item.parent()
+            while parent != None and parent not in selected:
+                parent = parent.parent()
+            if parent == None and not self.__isPlaceholder(item):
+                items.append(item)
+        return items
     def dropEvent(self, event) -> None:
-        '''event handler, called when a drag-and-drop ends, overwriting the handler of the parent class'''
+        '''event handler, called when a drag-and-drop ends, overwriting the handler of the parent class.
+        the dragged folders are moved, or copied for a CopyAction, onto the item or beside it by one request of
+        CiperDatabase.moveSubtree() or copySubtree(), then the items are moved or copied by __dropFolders()'''
         logging.debug('>>>TreeWidget.dropEvent')
-        if event.source() != self:
+        items = self.__draggedItems()
+        if event.source() != self or not items:
             event.ignore()
+            return
+        destItem = self.itemAt(event.pos())
+        position = self.dropIndicatorPosition()
+        if destItem == None or position == QAbstractItemView.OnViewport:
+            parentItem = self.invisibleRootItem()
+        elif position == QAbstractItemView.OnItem:
+            parentItem = destItem
+        else:
+            parentItem = destItem.parent() or self.invisibleRootItem()
+        if position not in (QAbstractItemView.AboveItem, QAbstractItemView.BelowItem):
+            destItem = None #appended to the children
+        #the ids are read now, an item may be removed from the tree before the request is done
+        dest = (parentItem, self.folderidOf(parentItem), destItem, self.folderidOf(destItem) if destItem != None else None, position == QAbstractItemView.BelowItem)
+        dragged = [(item, self.folderidOf(item)) for item in items]
+        copy = event.dropAction() == Qt.CopyAction
+        #the items are placed by __dropFolders(), a MoveAction would make QAbstractItemView remove the dragged items
+        event.setDropAction(Qt.CopyAction)
+        event.accept()
+        #the children must be loaded before new ones are added
+        self.populateChildren(parentItem, lambda: self.__dropFolders(dragged, dest, copy))
+    def __dropFolders(self, dragged:list, dest:tuple, copy:bool) -> None:
+        '''copy or move the dropped folders, then place their items once the database has done it.
+        dragged: [(item, folderid), ...], dest: (parentItem, parentid, destItem, destid, below), the items are placed
+        beside destItem, or after the last child of parentItem if destItem is None'''
+        parentItem, parentid, destItem, destid, below = dest
+        def unchanged() -> bool:
+            return self.__isLoaded(parentItem, parentid) and all(self.__isLoaded(item, folderid) for item, folderid in dragged)
+        def destRow() -> int:
+            row = parentItem.indexOfChild(destItem) if destid != None and self.__isLoaded(destItem, destid) else -1
+            return row + 1 if row >= 0 and below else row
+        def placeItems(newItems:list, row:int) -> None:
+            for item in newItems:
+                if row < 0:
+                    parentItem.addChild(item)
+                else:
+                    parentItem.insertChild(row, item)
+                    row += 1
+        def copied(copies:dict) -> None:
+            if not unchanged():
+                self.loadFolders() #the tree was reloaded or changed meanwhile
+                return
+            placeItems([self.__copyItem(item, copies) for item, _ in dragged], destRow())
+        def moved(succeeded:bool) -> None:
+            if not succeeded:
+                logging.debug('dropped into its own subtree')
+                return
+            if not unchanged():
+                self.loadFolders()
+                return
+            row = destRow()
+            for item, _ in dragged:
+                oldParent = item.parent() or self.invisibleRootItem()
+                if oldParent == parentItem and 0 <= oldParent.indexOfChild(item) < row:
+                    row -= 1
+                oldParent.removeChild(item)
+            placeItems([item for item, _ in dragged], row)
+        if not unchanged():
+            logging.warning('the dropped folders were removed or reloaded meanwhile')
+            return
+        folderids = [folderid for _, folderid in dragged]
+        if copy:
+            self.db.request('copySubtree', (folderids, parentid), copied)
         else:
-            destItem = self.itemAt(event.pos())
-            parentid = cipherdb.ID_ROOT if destItem == None else destItem.text(TreeWidget.COL_FOLDER_ID)
-            event.setDropAction(Qt.MoveAction)
-            QTreeWidget.dropEvent(self, event)
-            #update the parentid of the draged item
-            self.dragedItem.setText(TreeWidget.COL_FOLDER_PARENTID, str(parentid))
-            #save to database
-            folderid = self.dragedItem.text(TreeWidget.COL_FOLDER_ID)
-            self.db.updateTableFoldersParentidByFolderid(folderid, parentid)
+            self.db.request('moveSubtree', (folderids, parentid), moved)
+    def __copyItem(self, item:QTreeWidgetItem, copies:dict) -> QTreeWidgetItem:
+        '''clone the item with its children for the folders copied by CiperDatabase.copySubtree(),
+        copies: {folderid: folderid of the copy}, the clones are registered with the new folderids'''
+        clone = item.clone()
+        pending = [(item, clone)]
+        while pending:
+            original, copy = pending.pop()
+            if self.__isPlaceholder(original):
+                continue
+            folderid = copies[self.folderidOf(original)]
+            copy.setData(TreeWidget.COL_FOLDER_NAME, TreeWidget.ROLE_FOLDER_ID, folderid)
+            copy.setBackground(TreeWidget.COL_FOLDER_NAME, QBrush())
+            self.itemsById[folderid] = copy
+            pending += [(original.child(i), copy.child(i)) for i in range(original.childCount())]
+        return clone
     
\ No newline at end of file
@@ -7,14 +7,20 @@ Version: 1.0
 Update: 2022-2-22
 Requires: PyQt5
 '''
-from PyQt5.Qt import QMainWindow, QDesktopWidget, QIcon, QWidget, QHBoxLayout, QVBoxLayout, QAbstractItemView, QMenu, QAction, QTreeWidgetItem, QLineEdit, QMessageBox, QInputDialog,QFileDialog, QFont
-from PyQt5.QtWidgets import QApplication
+#PyQt5.Qt would import every Qt module, only those used are imported to start faster
+from PyQt5.QtWidgets import QApplication, QMainWindow, QDesktopWidget, QWidget, QHBoxLayout, QVBoxLayout, QMenu, QAction, QTreeWidgetItem, QLineEdit, QMessageBox, QInputDialog, QFileDialog, QProgressDialog
+from PyQt5.QtGui import QIcon, QFont
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from widgetdef import TreeWidget, TextEdit
+from dbservice import DatabaseService
+from autosave import AutoSaver
+import autosave
 import logging
 import sys
 import os
 import json
 import cipherdb
+import startup
 
 DEFAULT_MAINWINDOW_WIDTH = 800
 DEFAULT_MAINWINDOW_HEIGHT = 500
@@ -22,6 +28,16 @@ DEFAULT_MAINWINDOW_HEIGHT = 500
 DEFALT_DB_NAME = 'cipherdb.db'
 CONFIG_FILE = 'config.json'
 CFG_DBFILE = 'database'
+CFG_LAZY_LOAD = 'lazyload' #load the children of a category when it is expanded
+CFG_JOURNAL_MODE = 'journalmode' #sqlite journal mode, e.g. WAL, see cipherdb.JOURNAL_MODES
+CFG_SYNCHRONOUS = 'synchronous' #sqlite synchronous level, e.g. NORMAL, see cipherdb.SYNCHRONOUS_LEVELS
+CFG_REKEY_WORKERS = 'rekeyworkers' #number of processes re-encrypting the database when the password is changed
+CFG_CACHE_SIZE = 'cachesize' #megabytes of decrypted notes kept in memory, 0 to disable the cache
+CFG_PREFETCH = 'prefetch' #notes of the neighbouring folders decrypted in advance when a folder is selected, 0 to disable
+CFG_SCAN_WORKERS = 'scanworkers' #number of processes decrypting the notes for a substring or regular expression search
+CFG_AUTOSAVE_IDLE = 'autosaveidle' #milliseconds without typing before the note is saved
+CFG_AUTOSAVE_MAX_LATENCY = 'autosavemaxlatency' #milliseconds a change waits at most to be saved while the user keeps typing
+SAVE_METHODS = ('insertTexts', 'updateTextsTextByTextid', 'updateTextRanges') #the database methods writing a note
 DEFAULT_DBFILE = 'cipherdb.db'
 WINDOW_TITLE = 'Cipher notebook'
 
@@ -31,39 +47,90 @@ The initial password is: {cipherdb.DEFAULT_PASSWD}
 Author: Jared Yu
 email: hfyu.hzcn@gmail.com"""
 class MainWindow(QMainWindow):
-    def __init__(self, width:int = DEFAULT_MAINWINDOW_WIDTH, height:int = DEFAULT_MAINWINDOW_HEIGHT):
-        '''create a main windows with the specified width and height'''
+    #emitted once after the first paint, when the folders of the database are shown or no database could be loaded
+    ready = pyqtSignal()
+    def __init__(self, width:int = DEFAULT_MAINWINDOW_WIDTH, height:int = DEFAULT_MAINWINDOW_HEIGHT, passwd:str = None):
+        '''create a main windows with the specified width and height.
+        the database is loaded once the window is painted, passwd: its password, asked if None'''
         super(MainWindow, self).__init__()
-        self.db = None
+        self.db = DatabaseService(self) #all the database operations are run on its worker thread
+        self.prefetchGeneration = 0 #increased when the selection moves, to cancel the running prefetch
+        self.searchGeneration = 0 #increased when a search is started or cleared, to cancel the running scan
+        self.searchFound = 0 #number of folders found by the running scan
+        #the edits are saved in the background once the typing pauses, a save waits for the previous one to be written
+        self.autoSaver = AutoSaver(self.__saveText2Database, lambda: any(self.db.isPending(method) for method in SAVE_METHODS), parent=self)
+        self.config = {}
+        self.startupPasswd = passwd
+        self.painted = False
         self.resize(width, height)
         self.__createMainWindow()
         self.__connectWidgetSignals()
-        self.loadDatabase()
     
+    def paintEvent(self, event):
+        '''the database is unlocked after the first paint, so that the window shows up before the password dialog
+        and the folders are read'''
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            startup.profiler.mark(startup.MARK_FIRST_PAINT)
+            QTimer.singleShot(0, self.__unlockAtStartup)
+    def __unlockAtStartup(self) -> None:
+        '''load the database of the config, ready is emitted when its folders are shown'''
+        def loaded() -> None:
+            self.treeFolders.foldersLoaded.disconnect(loaded)
+            self.__startupDone()
+        self.treeFolders.foldersLoaded.connect(loaded)
+        if not self.loadDatabase(self.startupPasswd):
+            self.treeFolders.foldersLoaded.disconnect(loaded)
+            self.__startupDone()
+        self.startupPasswd = None
+    def __startupDone(self) -> None:
+        startup.profiler.mark(startup.MARK_INTERACTIVE)
+        self.ready.emit()
     def closeEvent(self, event):
         logging.debug('MainWindow.closeEvent()')
-        self.__saveText2Database()
+        self.autoSaver.flush()
+        self.db.shutdown() #wait for the pending writes
 
 
     def clearMainWindow(self) -> None:
         '''clear all display of the main window'''
         self.treeFolders.clear()
-        self.textWidget.setPlainText('')
-    def loadDatabase(self) -> None:
-        '''load database, called when the class is initiated'''
+        self.__detachText()
+    def __detachText(self) -> None:
+        '''clear the TextEdit and detach it from the note it showed, e.g. once another database is set,
+        so that nothing typed or pending is saved with the ids of the previous database'''
+        self.textWidget.setNewPlainText(cipherdb.ID_ROOT, cipherdb.ID_ROOT, '')
+        self.autoSaver.stop() #setNewPlainText() touched it
+        self.textWidget.setReadOnly(False)
+    def __setDatabase(self, db:cipherdb.CiperDatabase) -> None:
+        '''replace the database of the service. The pending save of the note shown is sent first, setDatabase() waits
+        for it before the previous database is closed, then the TextEdit is detached from the note'''
+        self.autoSaver.flush()
+        self.db.setDatabase(db)
+        self.__detachText()
+    def loadDatabase(self, passwd:str = None) -> bool:
+        '''load the database of the config, called after the window is painted for the first time.
+        passwd: its password, asked if None. True if the database is opened, its folders are read in the background'''
         configfile = os.path.join(os.path.dirname(os.path.realpath(__file__)), CONFIG_FILE)
         logging.debug(f'config file {configfile}')
         config = self.__getConfig(configfile)
         if None == config:
             self.__showStatusMsg('No database found', 10000)
-            return
+            return False
         logging.info(f'config file read: ' + CONFIG_FILE)
         logging.debug(f'config:{config}')
         #print(type(config))
-        if not self.__connectDatabase(config[CFG_DBFILE]):
-            return
-        self.__readAllFolders(cipherdb.ID_ROOT, None)
+        self.config = config
+        self.treeFolders.setLazyLoading(config.get(CFG_LAZY_LOAD, True))
+        self.autoSaver.setIntervals(config.get(CFG_AUTOSAVE_IDLE, autosave.DEFAULT_IDLE_MS),
+            config.get(CFG_AUTOSAVE_MAX_LATENCY, autosave.DEFAULT_MAX_LATENCY_MS))
+        if not self.__connectDatabase(config[CFG_DBFILE], passwd):
+            return False
+        startup.profiler.mark('unlocked')
+        self.__readAllFolders()
         self.__showStatusMsg(f'Database loaded: {config[CFG_DBFILE]}', 10000)
+        return True
 
     def __getConfig(self, filename:str) -> dict:
         '''read configuration from the file'''
@@ -118,27 +185,33 @@ class MainWindow(QMainWindow):
         self.mainLayout.setContentsMargins(0, 0, 0, 0)
         self.mainLayout.setSpacing(0)
 
-        self.treeFolders = TreeWidget(self.centralwidget)
-        self.treeFolders.setSelectionMode(QAbstractItemView.SingleSelection)
-        self.treeFolders.setDragEnabled(True)
-        self.treeFolders.viewport().setAcceptDrops(True)
-        self.treeFolders.setDropIndicatorShown(True)
-        self.treeFolders.setDragDropMode(QAbstractItemView.InternalMove)
+        #the search box is above the tree
+        self.folderPanel = QWidget(self.mainWidget)
+        self.folderPanelLayout = QVBoxLayout(self.folderPanel)
+        self.folderPanelLayout.setContentsMargins(0, 0, 0, 0)
+        self.folderPanelLayout.setSpacing(0)
+        self.folderPanel.setMaximumWidth(WIDTH_FOLDER)
+        self.searchBox = QLineEdit(self.folderPanel)
+        self.searchBox.setPlaceholderText('Search words, "substring" or /regex/')
+        self.searchBox.setClearButtonEnabled(True)
+
+        self.treeFolders = TreeWidget(self.centralwidget) #extended selection, drag to move and Ctrl+drag to copy, see TreeWidget
+        self.treeFolders.setLazyLoading(True)
         self.treeFolders.setMaximumWidth(WIDTH_FOLDER)
         #self.treeFolders.header().setStyleSheet("QHeaderView{background-color:#E6E6E6;border:none;}")
         self.treeFolders.header().setStyleSheet("background-color: rgb(150,150,150)")
 
         #config widgets
-        self.treeFolders.setColumnCount(3)
-        self.treeFolders.setHeaderLabels(['Categories', 'folderid', 'parentid'])
-        self.treeFolders.setColumnHidden(TreeWidget.COL_FOLDER_ID,True)
-        self.treeFolders.setColumnHidden(TreeWidget.COL_FOLDER_PARENTID,True)
-        self.treeFolders.setColumnHidden(TreeWidget.COL_FOLDER_NAME,False)
+        self.treeFolders.setColumnCount(1) #the folderid is kept in the data of the item, see TreeWidget.folderidOf()
+        self.treeFolders.setHeaderLabels(['Categories'])
 
         self.textWidget = TextEdit(self.centralwidget)
-        
+        self.treeFolders.setDatabaseHandle(self.db)
+        self.textWidget.setDatabaseHandle(self.db)
 
-        self.mainLayout.addWidget(self.treeFolders)
+        self.folderPanelLayout.addWidget(self.searchBox)
+        self.folderPanelLayout.addWidget(self.treeFolders)
+        self.mainLayout.addWidget(self.folderPanel)
         self.mainLayout.addWidget(self.textWidget)
 
         #self.statusbar = QStatusBar(self)
@@ -178,6 +251,11 @@ class MainWindow(QMainWindow):
         changePasswd.triggered.connect(self.__menuChangePasswd)
         fileMenu.addAction(changePasswd)
 
+        compactDatabase = QAction("Co&mpact database", self)
+        compactDatabase.setStatusTip('Remove the records left behind by deleted folders and shrink the database file')
+        compactDatabase.triggered.connect(self.__menuCompactDatabase)
+        fileMenu.addAction(compactDatabase)
+
         aboutAction = QAction("&About", self)
         aboutAction.setShortcut("Ctrl+A")
         aboutAction.setStatusTip('Show about')
@@ -212,12 +290,8 @@ class MainWindow(QMainWindow):
         if passwd != passwdAgain:
             self.__showMessageBox(QMessageBox.Error, "Passwords don't match!", "Password mismatch", QMessageBox.Ok)
             return
-        if self.db != None:
-            del self.db
-        self.db = cipherdb.CiperDatabase(fname)
-        self.treeFolders.setDatabaseHandle(self.db)
-        self.textWidget.setDatabaseHandle(self.db)
-        if self.db.createDatabase(fname, passwd):
+        self.__setDatabase(cipherdb.CiperDatabase(fname, self.__cacheSize()))
+        if self.db.call('createDatabase', fname, passwd, self.config.get(CFG_JOURNAL_MODE), self.config.get(CFG_SYNCHRONOUS)):
             logging.info(f'new database created [{fname}]')
             self.__showMessageBox(QMessageBox.Information, "Database created successfully", "New database", QMessageBox.Ok)
 
@@ -225,27 +299,17 @@ class MainWindow(QMainWindow):
             logging.critical(f'FAILED to create a new database [{fname}]')
             self.__showMessageBox(QMessageBox.Error, "FAILED to create a new database", "New database", QMessageBox.Ok)
         #save config
-        self.__saveConfig({CFG_DBFILE:fname}, CONFIG_FILE)
+        self.config[CFG_DBFILE] = fname
+        self.__saveConfig(self.config, CONFIG_FILE)
         #read table folders and set the data into the tree widget
-        self.__readAllFolders(cipherdb.ID_ROOT, None)
+        self.__readAllFolders()
         
 
-    def __readAllFolders(self, parentid:int, parentWidget:QWidget) -> None:
-        '''read folder data whose parentid is given, set the data to TreeWidget
-        recursion is done to load all the children folders'''
+    def __readAllFolders(self) -> None:
+        '''read folder data and set the data to TreeWidget
+        in lazy loading mode only the root folders are read, the others are read when expanded'''
         logging.debug('>>>MainWindow.__readAllFolders')
-        if parentid == cipherdb.ID_ROOT:
-            parentWidget = self.treeFolders
-        records = self.db.readTableFolders(parentid)
-        
-        for row in records:
-            rowFolderid, rowFoldername, rowParentid = row
-            item = QTreeWidgetItem(parentWidget)
-            item.setText(TreeWidget.COL_FOLDER_ID, str(rowFolderid))
-            item.setText(TreeWidget.COL_FOLDER_NAME, rowFoldername)
-            item.setText(TreeWidget.COL_FOLDER_PARENTID, str(rowParentid))
-            self.__readAllFolders(rowFolderid, item) #recursion
-        self.treeFolders.setActiveStatus(True)
+        self.treeFolders.loadFolders()
         
     # def setSignalHandlers(self):
     #     pass
@@ -261,11 +325,42 @@ class MainWindow(QMainWindow):
         if passwd != passwdAgain:
             self.__showMessageBox(QMessageBox.Warning, "The password you inputed don't match, cancelled!", "Password mismatch", QMessageBox.Ok)
             return
-        if self.db.changePasswd(passwd):
-            self.__showMessageBox(QMessageBox.Information, "The new password was set to the database successfully", "Password changed", QMessageBox.Ok)
-        else:
-            self.__showMessageBox(QMessageBox.Critical, "FAILED to set the new password to the dataBASE", "Password UNCHANGED", QMessageBox.Ok)
+        progressDialog = QProgressDialog('Re-encrypting the database with the new password', 'Cancel', 0, 100, self)
+        progressDialog.setWindowTitle('Change password')
+        progressDialog.setWindowModality(Qt.WindowModal)
+        progressDialog.setMinimumDuration(500)
+        progressDialog.canceled.connect(self.db.cancel)
+        def setProgress(done:int, total:int) -> None:
+            progressDialog.setValue(done * 100 // max(total, 1))
+        def finished(succeeded:bool) -> None:
+            self.db.progressed.disconnect(setProgress)
+            progressDialog.canceled.disconnect(self.db.cancel) #closing the dialog emits canceled
+            progressDialog.close()
+            if succeeded == None:
+                self.__showMessageBox(QMessageBox.Critical, "FAILED to set the new password to the database, it keeps the old password", "Password UNCHANGED", QMessageBox.Ok)
+            elif self.db.cancelEvent.is_set():
+                self.__showMessageBox(QMessageBox.Information, "Cancelled, the database keeps the old password", "Password UNCHANGED", QMessageBox.Ok)
+            elif succeeded:
+                self.__showMessageBox(QMessageBox.Information, "The new password was set to the database successfully", "Password changed", QMessageBox.Ok)
+            else:
+                self.__showMessageBox(QMessageBox.Critical, "FAILED to set the new password to the dataBASE", "Password UNCHANGED", QMessageBox.Ok)
+        #the database is re-encrypted on the worker thread, the progress is reported by the signal progressed
+        self.db.progressed.connect(setProgress)
+        self.db.request('changePasswd', (passwd, self.db.progressCallback(), self.config.get(CFG_REKEY_WORKERS, 1)), finished,
+            error=lambda message: finished(None))
         
+    def __menuCompactDatabase(self) -> None:
+        '''handler of the menu command Compact Database'''
+        logging.debug('>>>MainWindow.__menuCompactDatabase')
+        self.autoSaver.flush()
+        self.__showStatusMsg('Compacting the database...')
+        def finished(counts:dict) -> None:
+            self.__showStatusMsg('')
+            self.__showMessageBox(QMessageBox.Information,
+                f"{counts[cipherdb.TBL_FOLDERS]} folders, {counts[cipherdb.TBL_TEXT]} notes and {counts[cipherdb.TBL_CHUNKS]} chunks left behind were removed, "
+                f"{counts['bytes'] / 1024:.0f} KB reclaimed", "Database compacted", QMessageBox.Ok)
+        self.db.request('compactDatabase', (), finished)
+
     def __menuSelectDatabase(self) -> None:
         '''handler of the menu command Open Database'''
         logging.debug('>>>MainWindow.__menuSelectDatabase')
@@ -276,9 +371,10 @@ class MainWindow(QMainWindow):
         logging.debug(f'database file selected [{filename}]')
         if not self.__connectDatabase(filename):
             return
-        self.__saveConfig({CFG_DBFILE:filename}, CONFIG_FILE)
+        self.config[CFG_DBFILE] = filename
+        self.__saveConfig(self.config, CONFIG_FILE)
         self.clearMainWindow()
-        self.__readAllFolders(cipherdb.ID_ROOT, None)
+        self.__readAllFolders()
         
     def __menuAbout(self) -> None:
         '''handler of the menu command About'''
@@ -287,7 +383,7 @@ class MainWindow(QMainWindow):
             "About password notebook", QMessageBox.Ok)
     def __menuExit(self) -> None:
         '''handler of the menu command Exit, save changed data before exiting'''
-        self.__saveText2Database() #save change
+        self.close() #closeEvent() saves the change
         exit(0)
     def __showMessageBox(self, iconType, text:str, title:str, buttons) -> None:
         '''show a message box window
@@ -300,22 +396,22 @@ class MainWindow(QMainWindow):
         msgBox.setStandardButtons(buttons)
         msgBox.exec_()
     
-    def __connectDatabase(self, filename) -> bool:
-        '''connect the sqlite3 database and save the handler'''
+    def __connectDatabase(self, filename, passwd:str = None) -> bool:
+        '''connect the sqlite3 database and save the handler, the password is asked if None'''
         logging.debug('>>>MainWindow.openDatabase')
         #input password
-        passwd, ok = QInputDialog.getText(self, f'Open a database', f'Input password for the database {filename}', QLineEdit.Password)
-        if not ok:
-            return False
+        if passwd == None:
+            with startup.profiler.waiting():
+                passwd, ok = QInputDialog.getText(self, f'Open a database', f'Input password for the database {filename}', QLineEdit.Password)
+            if not ok:
+                return False
         logging.debug(f'{passwd=}')
-        self.db = cipherdb.CiperDatabase(filename)
-        self.treeFolders.setDatabaseHandle(self.db)
-        self.textWidget.setDatabaseHandle(self.db)
-        if not self.db.openDatabase(filename):
+        self.__setDatabase(cipherdb.CiperDatabase(filename, self.__cacheSize()))
+        if not self.db.call('openDatabase', filename, self.config.get(CFG_JOURNAL_MODE), self.config.get(CFG_SYNCHRONOUS)):
             logging.warning(f'FAILED to open database {filename}')
             self.__showStatusMsg(f'FAILED to open database {filename}', 5000)
             return False
-        if not self.db.verifyPasswd(passwd):
+        if not self.db.call('verifyPasswd', passwd):
             self.__showMessageBox(QMessageBox.Critical, "The password you inputed is incorrect!", "Password incorrect", QMessageBox.Ok)
             return False
         
@@ -323,10 +419,16 @@ class MainWindow(QMainWindow):
         basename = os.path.basename(filename)
         self.setWindowTitle(WINDOW_TITLE + ' - ' + basename)
         return True
+    def __cacheSize(self) -> int:
+        '''bytes of the note cache of the database, set by the config'''
+        return int(self.config.get(CFG_CACHE_SIZE, cipherdb.DEFAULT_CACHE_SIZE // 2**20) * 2**20)
     def __connectWidgetSignals(self) -> None:
         '''connect event handler of the widgets'''
         self.treeFolders.selectionModel().selectionChanged.connect(self.__folderSelectChange)
         self.textWidget.textChanged.connect(self.__textChange)
+        self.searchBox.returnPressed.connect(self.__search)
+        self.searchBox.textChanged.connect(lambda text: text or self.__search())
+        self.db.failed.connect(lambda error: self.__showStatusMsg(f'Database error: {error}', 10000))
     def __folderSelectChange(self) -> None:
         '''event handler when selection of the TreeWidget changed
         refresh the content of the TextEdit when a new folder is selected'''
@@ -334,36 +436,115 @@ class MainWindow(QMainWindow):
         if len(self.treeFolders.selectedItems()) == 0:
             logging.debug('No current itm')
             return
-        self.__saveText2Database()
-        folderid = int(self.treeFolders.selectedItems()[0].text(TreeWidget.COL_FOLDER_ID))
-        #read the text from database
-        textid, text,dateCreate, dateEdit = self.db.readTextByFolderid(folderid)
+        self.autoSaver.flush() #queued before the read of the next note, the UI does not wait for it
+        #several folders may be selected, the note shown is the one of the folder clicked last
+        item = self.treeFolders.currentItem()
+        if item not in self.treeFolders.selectedItems():
+            item = self.treeFolders.selectedItems()[0]
+        folderid = self.treeFolders.folderidOf(item)
+        #read the text from database in the background, the result is dropped if another folder is selected meanwhile
+        self.prefetchGeneration += 1
+        self.textWidget.setReadOnly(True)
+        #the chunks of a big note are shown as they are decrypted
+        self.db.requestStream('streamTextByFolderid', (folderid,), lambda item: self.__textChunkLoaded(folderid, item),
+            self.__textLoaded, key=('streamTextByFolderid', folderid), channel='text', error=self.__textLoadFailed)
+    def __textChunkLoaded(self, folderid:int, item) -> None:
+        '''callback of streamTextByFolderid, item is (textid, dateCreate, dateEdit) first, then the chunks of the text'''
+        if isinstance(item, str):
+            self.textWidget.appendTextChunk(item)
+            return
+        textid, dateCreate, dateEdit = item
         logging.debug(f'text for {folderid=} {dateCreate=} {dateEdit=}')
         
-        self.textWidget.setNewPlainText(folderid, textid, text)
+        self.textWidget.setNewPlainText(folderid, textid, '')
         msg = '' if cipherdb.ID_ROOT == textid else f'Created at {dateCreate}     Last edited at {dateEdit}'
         self.__showStatusMsg(msg, 10000)
+    def __textLoaded(self) -> None:
+        '''called when the whole text of the selected folder is shown'''
+        self.textWidget.setReadOnly(False)
+        self.__prefetchNeighbours()
+    def __textLoadFailed(self, error:str) -> None:
+        '''called when the text of the selected folder cannot be read, the part shown is cleared so that it never
+        overwrites the note, and the TextEdit is detached from the folder as when no folder is selected'''
+        self.textWidget.setNewPlainText(cipherdb.ID_ROOT, cipherdb.ID_ROOT, '')
+        self.textWidget.setReadOnly(False)
+    def __prefetchNeighbours(self) -> None:
+        '''decrypt the notes of the adjacent siblings and the children of the selected folder in the background,
+        they are likely to be opened next. The prefetch stops as soon as the selection moves'''
+        budget = self.config.get(CFG_PREFETCH, cipherdb.DEFAULT_PREFETCH_BUDGET)
+        if budget <= 0 or len(self.treeFolders.selectedItems()) == 0:
+            return
+        item = self.treeFolders.selectedItems()[0]
+        parent = item.parent() or self.treeFolders.invisibleRootItem()
+        index = parent.indexOfChild(item)
+        siblings = [parent.child(i) for i in (index + 1, index - 1) if 0 <= i < parent.childCount()]
+        generation = self.prefetchGeneration
+        self.db.request('prefetchNotes', ([self.treeFolders.folderidOf(sibling) for sibling in siblings],
+            self.treeFolders.folderidOf(item), budget, lambda: generation != self.prefetchGeneration))
+    def __search(self) -> None:
+        '''search the text of the search box and highlight the folders found.
+        words are looked up in the search index of the database, a "substring" or a /regex/ is searched by decrypting
+        all the notes in worker processes, the folders are highlighted as they are found'''
+        query = self.searchBox.text().strip()
+        self.searchGeneration += 1
+        self.treeFolders.highlightFolders([])
+        if not query:
+            return
+        self.autoSaver.flush() #the note being edited is saved before the search is run
+        scan = len(query) > 2 and query[0] == query[-1] and query[0] in '"/'
+        if not scan:
+            self.db.request('searchNotes', (query,), self.__searchDone, channel='search')
+            return
+        generation, self.searchFound = self.searchGeneration, 0
+        self.__showStatusMsg('Searching...')
+        self.db.requestStream('scanNotes', (query[1:-1], query[0] == '/', self.config.get(CFG_SCAN_WORKERS, 1),
+            lambda: generation != self.searchGeneration), lambda paths: self.__scanFound(generation, paths),
+            lambda: generation == self.searchGeneration and self.__searchDone(), channel='search')
+    def __scanFound(self, generation:int, paths:list) -> None:
+        '''callback of scanNotes, called for each batch, the results are dropped if the search box was cleared'''
+        if generation != self.searchGeneration or not paths:
+            return
+        self.treeFolders.highlightFolders(paths, True)
+        self.searchFound += len(paths)
+        self.__showStatusMsg(f'Searching... {self.searchFound} folders found')
+    def __searchDone(self, paths:list=None) -> None:
+        '''callback of searchNotes with the paths found, called without paths at the end of scanNotes'''
+        if paths != None:
+            self.treeFolders.highlightFolders(paths)
+            self.searchFound = len(paths)
+        self.__showStatusMsg(f'{self.searchFound} folders found', 10000)
     def __textChange(self) -> None:
-        '''event handler of TextEdit, called when the content of TextEdit is changed, set a flag. 
+        '''event handler of TextEdit, called for each keystroke, set a flag and restart the autosave timer.
         the data will be saved to database according to this flag'''
-        logging.debug('>>>MainWindow.text changed')
         self.textWidget.setTextChangedFlag(True)
+        self.autoSaver.touch()
 
     def __saveText2Database(self) -> None:
-        '''save the content of TextEdit to database'''
+        '''save the content of TextEdit to database, the text is written in the background'''
         if not self.textWidget.getTextChangedFlag():
             logging.debug('no need to save text')
             return
         #logging.debug(f'save text to db with textid {self.textWidget.textid}')
         folderid = self.textWidget.folderid
+        if folderid == cipherdb.ID_ROOT:
+            logging.debug('no folder selected, the text is not saved')
+            self.textWidget.setTextChangedFlag(False)
+            return
+        edits = self.textWidget.takeEdits()
         if self.textWidget.textid == cipherdb.ID_ROOT:
             logging.debug(f'create a new text with {folderid=}')
-            self.db.insertTexts(self.textWidget.toPlainText(), self.textWidget.folderid)
-        else:
-            
+            #the id is known at once, so the saves queued after the insert update the same note
+            self.textWidget.textid = cipherdb.getUniqueId()
+            self.db.request('insertTexts', (self.textWidget.toPlainText(), folderid, self.textWidget.textid))
+        elif edits == None:
             logging.debug(f'update the text with {folderid=}')
-            self.db.updateTextsTextByTextid(self.textWidget.textid, self.textWidget.toPlainText())
-            #self.db.updateTextsTextByTextid(self.textWidget.textid, self.textWidget.toPlainText())
+            self.db.request('updateTextsTextByTextid', (self.textWidget.textid, self.textWidget.toPlainText()))
+        elif edits:
+            #only the ranges changed are sent, the database rewrites the chunks holding them
+            logging.debug(f'update {len(edits)} ranges of the text with {folderid=}')
+            self.db.request('updateTextRanges', (self.textWidget.textid, edits))
+        else:
+            logging.debug('the text is changed back, no need to save')
         self.textWidget.setTextChangedFlag(False)
 if __name__ == '__main__':
     def setDebugData(w):